@@ -0,0 +1,84 @@
+"""
+Benchmark parallel cognate detection with a growing number of processes.
+
+Usage: python benchmarks/bench_cognates.py [--workers 1 2 4] [--repeat 3]
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from edictor.util import _cognates
+
+ROOT = Path(__file__).parent.parent
+
+
+def sqlite_wordlist(path, table):
+    db = sqlite3.connect(path)
+    data = {}
+    for idx, col, val in db.execute(
+            "select ID, COL, VAL from " + table + " where COL in "
+            "('DOCULECT', 'CONCEPT', 'TOKENS');"):
+        data.setdefault(idx, {})[col] = val
+    db.close()
+    return "".join(
+        "\t".join([str(idx), row["DOCULECT"], row["CONCEPT"], row["TOKENS"]]) + "\n"
+        for idx, row in sorted(data.items())
+        if row.get("TOKENS") and row.get("DOCULECT") and row.get("CONCEPT"))
+
+
+def tsv_wordlist(path):
+    with open(path, encoding="utf-8") as f:
+        header = f.readline().rstrip("\n").split("\t")
+        idx = {name: i for i, name in enumerate(header)}
+        lines = []
+        for line in f:
+            cells = line.rstrip("\n").split("\t")
+            if len(cells) < len(header) or not cells[0].isdigit():
+                continue
+            # skip forms which were not segmented, like <finne>
+            if not cells[idx["TOKENS"]] or "<" in cells[idx["TOKENS"]]:
+                continue
+            lines.append("\t".join([
+                cells[0], cells[idx["DOCULECT"]], cells[idx["CONCEPT"]],
+                cells[idx["TOKENS"]]]) + "\n")
+    return "".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--workers", type=int, nargs="+",
+        default=sorted({1, 2, 4, os.cpu_count() or 1}))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    logging.getLogger("lingpy").setLevel(logging.WARNING)
+
+    # partial cognates fail in LingPy on some empty morphemes of German.tsv
+    datasets = {
+        "germanic.sqlite3": (sqlite_wordlist(
+            ROOT.joinpath("tests", "data", "germanic.sqlite3"), "germanic"),
+            ["full", "partial"]),
+        "German.tsv": (tsv_wordlist(
+            ROOT.joinpath("src", "edictor", "app", "data", "German.tsv")),
+            ["full"]),
+    }
+    print("cores: {0}".format(os.cpu_count()))
+    for name, (wordlist, modes) in datasets.items():
+        for mode in modes:
+            for workers in args.workers:
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    _cognates({
+                        "wordlist": wordlist, "mode": mode, "method": "sca",
+                        "workers": str(workers)})
+                    timings.append(time.perf_counter() - start)
+                print("{0:20} {1:8} workers={2:<3} best={3:.3f}s".format(
+                    name, mode, workers, min(timings)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Benchmark the queries of the triple store with and without the indexes.
+
+Usage: python benchmarks/bench_indexes.py [--repeat 200]
+
+Both runs use copies of tests/data/germanic.sqlite3, one without any index
+and one migrated to the current schema.
+"""
+import argparse
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from edictor.db import migrate
+from edictor.util import select_triples
+
+ROOT = Path(__file__).parent.parent
+
+CONCEPTS = ["*bainan", "*bakanan", "*balgiz"]
+
+QUERIES = {
+    "concept lookup": (
+        "select distinct ID from germanic where COL = ? and "
+        "VAL in (?, ?, ?);", ["CONCEPT"] + CONCEPTS),
+    "doculect lookup": (
+        "select distinct ID from germanic where COL = ? and VAL = ?;",
+        ["DOCULECT", "German"]),
+    "cell (update)": (
+        "select VAL from germanic where ID = ? and COL like ?;",
+        [1200, "TOKENS"]),
+    "modifications": (
+        "select ID, COL from backup where FILE = ? and DATE > ? "
+        "group by ID, COL limit 100;", ["germanic", "1718000000"]),
+    "new id": (
+        "select max(ID) from backup where FILE = ?;", ["germanic"]),
+}
+
+
+def timed(func, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dbs = {}
+        for name in ["plain", "indexed"]:
+            path = Path(tmp, name + ".sqlite3")
+            shutil.copy(ROOT.joinpath("tests", "data", "germanic.sqlite3"), path)
+            dbs[name] = sqlite3.connect(path)
+        plain = dbs["plain"]
+        for (index,) in plain.execute(
+                "select name from sqlite_master where type = 'index' "
+                "and sql is not null;").fetchall():
+            plain.execute("drop index " + index + ";")
+        plain.execute("pragma user_version = 0;")
+        migrate(dbs["indexed"], force=True)
+        print("{0:20} {1:>10} {2:>10}".format("query", "plain", "indexed"))
+        for name in list(QUERIES) + ["triples (concepts)"]:
+            timings = []
+            for db in dbs.values():
+                if name in QUERIES:
+                    query, params = QUERIES[name]
+                    func = lambda: db.execute(query, params).fetchall()
+                else:
+                    func = lambda: list(select_triples(
+                        db, "germanic", ["DOCULECT", "CONCEPT", "TOKENS"],
+                        concepts=CONCEPTS))
+                timings.append(timed(func, args.repeat))
+            print("{0:20} {1:8.3f}ms {2:8.3f}ms".format(name, *timings))
+        for db in dbs.values():
+            db.close()
+
+
+if __name__ == "__main__":
+    main()
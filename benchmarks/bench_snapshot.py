@@ -0,0 +1,73 @@
+"""
+Benchmark full wordlist loads from the triples and from the snapshot.
+
+Usage: python benchmarks/bench_snapshot.py [--repeat 20] [--scale 1]
+
+With --scale N, the rows of tests/data/germanic.sqlite3 are copied N times
+under new identifiers, to simulate a larger database.
+"""
+import argparse
+import shutil
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from edictor.db import migrate
+from edictor.util import get_columns, select_triples, snapshot_triples
+
+ROOT = Path(__file__).parent.parent
+
+
+def timed(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--scale", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp, "germanic.sqlite3")
+        shutil.copy(ROOT.joinpath("tests", "data", "germanic.sqlite3"), path)
+        db = sqlite3.connect(path)
+        rows = db.execute("select ID, COL, VAL from germanic;").fetchall()
+        offset = max(row[0] for row in rows) + 1
+        for i in range(1, args.scale):
+            db.executemany(
+                "insert into germanic values (?, ?, ?);",
+                [(idx + i * offset, col, val) for idx, col, val in rows])
+        db.commit()
+        migrate(db)
+        print("triples: {0}".format(
+            db.execute("select count(*) from germanic;").fetchone()[0]))
+
+        def pivot():
+            cols = get_columns(db, "germanic")
+            return sum(1 for _ in select_triples(db, "germanic", cols))
+
+        def snapshot():
+            cols, rows = snapshot_triples(db, "germanic")
+            return sum(1 for _ in rows)
+
+        def build():
+            with db:
+                db.execute("update snapshots set VERSION = VERSION + 1;")
+            return snapshot()
+
+        assert pivot() == snapshot()
+        print("cold pivot      {0:8.2f}ms".format(timed(pivot, args.repeat)))
+        print("snapshot build  {0:8.2f}ms".format(timed(build, args.repeat)))
+        print("snapshot load   {0:8.2f}ms".format(timed(snapshot, args.repeat)))
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
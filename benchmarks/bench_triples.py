@@ -0,0 +1,76 @@
+"""
+Benchmark requests per second of triples.py on the Germanic database.
+
+Usage: python benchmarks/bench_triples.py [--requests 200] [--clients 1 4]
+
+The "unpooled" run opens a new connection for every request, as the server
+did before connections were pooled.
+"""
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import edictor.server
+import edictor.util
+from edictor.db import ConnectionPool, close_pools, get_pool
+from edictor.server import get_server
+
+ROOT = Path(__file__).parent.parent
+
+QUERIES = {
+    "all": "file=germanic&remote_dbase=germanic",
+    "doculect": "file=germanic&remote_dbase=germanic&doculects=German",
+    "concept": "file=germanic&remote_dbase=germanic&concepts=*markō",
+}
+
+
+def unpooled(path):
+    return ConnectionPool(path, size=0)
+
+
+def run(url, query, requests, clients):
+    def fetch(_):
+        urllib.request.urlopen(
+            url + "/triples/triples.py", data=query.encode("utf-8")).read()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(fetch, range(requests)))
+    return requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # work on a copy, since the pool switches the database to WAL mode
+        shutil.copy(ROOT.joinpath("tests", "data", "germanic.sqlite3"), tmp)
+        edictor.server.CONF = {"sqlite": tmp, "user": "unknown"}
+        edictor.server.Handler.log_message = lambda *args: None
+        httpd = get_server(0, workers=max(args.clients), address="127.0.0.1")
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        url = "http://127.0.0.1:{0}".format(httpd.server_address[1])
+        try:
+            for mode, pool in [("unpooled", unpooled), ("pooled", get_pool)]:
+                edictor.util.get_pool = pool
+                for name, query in QUERIES.items():
+                    for clients in args.clients:
+                        rate = run(url, query, args.requests, clients)
+                        print("{0:9} {1:9} clients={2:<3} {3:8.1f} req/s".format(
+                            mode, name, clients, rate))
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            close_pools()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Benchmark the reading of a large synthetic wordlist by server_page.
+
+Usage: python benchmarks/bench_tsv.py [--size 1024] [--path wordlist.tsv]
+
+A wordlist of about `--size` megabytes is written to a temporary folder,
+or to `--path` if given, where it is kept for later runs. The "codecs"
+line shows a full scan as server_page did it before the TSV files were
+memory-mapped, decoding every line as text.
+"""
+import argparse
+import codecs
+import json
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+from edictor.tsv import INDEXES, TsvReader, line_index
+from edictor.util import server_page
+
+DOCULECTS = ["German", "Dutch", "English", "Swedish", "Icelandic", "Gothic"]
+
+
+class Writer:
+
+    def write(self, data):
+        self.data = data
+
+
+class Sender:
+
+    def __init__(self):
+        self.wfile = Writer()
+
+    def send_response(self, code):
+        pass
+
+    def send_header(self, key, value):
+        pass
+
+    def end_headers(self):
+        pass
+
+
+def make_wordlist(path, size):
+    random.seed(1)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ID\tDOCULECT\tCONCEPT\tFORM\tTOKENS\tCOGID\tNOTE\n")
+        idx = 0
+        while f.tell() < size * 1024 ** 2:
+            rows = []
+            for _ in range(10000):
+                idx += 1
+                form = "".join(random.choice("aeioubdgklmnprstvxʃθ") for _ in
+                               range(random.randint(3, 9)))
+                rows.append("{0}\t{1}\tconcept-{2}\t{3}\t{4}\t{5}\t\n".format(
+                    idx, DOCULECTS[idx % len(DOCULECTS)], idx % 2000, form,
+                    " ".join(form), idx % 5000))
+            f.write("".join(rows))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def codecs_scan(path):
+    # the reader used by server_page before the memory map
+    matched = 0
+    with codecs.open(path, "r", "utf-8") as f:
+        header = f.readline().rstrip("\n\r").split("\t")
+        for line in f:
+            cells = line.rstrip("\n\r").split("\t")
+            if len(cells) < len(header):
+                cells += [""] * (len(header) - len(cells))
+            if cells[1].lower() == "dutch":
+                matched += 1
+    return matched
+
+
+def mmap_scan(path):
+    matched = 0
+    with TsvReader(path) as reader:
+        offsets = reader.offsets()
+        for (doculect,) in reader.cells([1], offsets[0], offsets[-1], decode=False):
+            if doculect == b"Dutch":
+                matched += 1
+    return matched
+
+
+def page(path, **payload):
+    payload.update(file=str(path), limit=50)
+    s = Sender()
+    server_page(s, "payload=" + json.dumps(payload), "POST")
+    return json.loads(s.wfile.data)["total"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--path")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["EDICTOR_CACHE"] = tmp
+        path = Path(args.path or Path(tmp, "wordlist.tsv"))
+        if not path.exists():
+            print("writing {0} MB to {1}".format(args.size, path))
+            make_wordlist(path, args.size)
+        print("{0:.0f} MB".format(path.stat().st_size / 1024 ** 2))
+        runs = [
+            ("codecs scan", lambda: codecs_scan(path)),
+            ("mmap scan", lambda: mmap_scan(path)),
+            ("line index", lambda: len(line_index(path))),
+            ("last page", lambda: page(path, offset=len(line_index(path)) - 50)),
+            ("value index", lambda: page(path, doculects=["Dutch"])),
+            ("new filter", lambda: page(
+                path, doculects=["German"], concepts=["concept-12"])),
+            ("same filter", lambda: page(
+                path, doculects=["German"], concepts=["concept-12"], offset=50)),
+        ]
+        for name, func in runs:
+            elapsed, result = timed(func)
+            print("{0:12} {1:10.1f}ms {2:>10}".format(name, elapsed, result))
+        INDEXES.clear()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+"""
+On-disk caches of the local server.
+"""
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+
+def cache_dir():
+    """
+    Return the default folder for the caches of EDICTOR.
+    """
+    if os.environ.get("EDICTOR_CACHE"):
+        return Path(os.environ["EDICTOR_CACHE"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home().joinpath(".cache")
+    return Path(base, "edictor")
+
+
+def normalize_wordlist(wordlist):
+    """
+    Normalize a wordlist in the tab-separated format sent by the application.
+
+    Note
+    ----
+    Rows are sorted by their identifier and trailing whitespace is removed,
+    so that the same data yields the same key, regardless of the order in
+    which the application collected the rows.
+    """
+    rows = []
+    for row in wordlist.split("\n"):
+        row = row.rstrip()
+        if not row:
+            continue
+        idx = row.split("\t", 1)[0]
+        rows.append((int(idx) if idx.isdigit() else 0, row))
+    return "\n".join(row for _, row in sorted(rows))
+
+
+def result_key(name, args, ignore=("wordlist", "job", "cache", "workers")):
+    """
+    Compute the key of an analysis from the wordlist and its parameters.
+    """
+    params = {k: str(v) for k, v in args.items() if k not in ignore}
+    digest = hashlib.sha256()
+    digest.update(name.encode("utf-8"))
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    digest.update(normalize_wordlist(args.get("wordlist", "")).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Size-bounded cache of analysis results, stored in an SQLite file.
+
+    Note
+    ----
+    Entries are evicted in the order of their last access, once the size of
+    all results exceeds `max_bytes`. The counters of hits and misses are kept
+    for the lifetime of the server.
+    """
+
+    def __init__(self, path=None, max_bytes=256 * 1024 ** 2):
+        self._path = Path(path) if path else None
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._ready = False
+
+    @property
+    def path(self):
+        return self._path or cache_dir().joinpath("results.sqlite3")
+
+    def configure(self, path=None, max_bytes=None):
+        with self._lock:
+            if path:
+                self._path = Path(path)
+                self._ready = False
+            if max_bytes:
+                self.max_bytes = max_bytes
+
+    def _connect(self):
+        if not self._ready:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            db.execute(
+                "create table if not exists results ("
+                "KEY text primary key, VAL text, SIZE int, ACCESSED real);")
+            db.execute(
+                "create index if not exists results_accessed "
+                "on results (ACCESSED);")
+            db.commit()
+            self._ready = True
+        return db
+
+    def get(self, key):
+        with self._lock:
+            db = self._connect()
+            try:
+                row = db.execute(
+                    "select VAL from results where KEY = ?;", (key,)).fetchone()
+                if row is None:
+                    self.misses += 1
+                    return None
+                db.execute(
+                    "update results set ACCESSED = ? where KEY = ?;",
+                    (time.time(), key))
+                db.commit()
+                self.hits += 1
+                return row[0]
+            finally:
+                db.close()
+
+    def put(self, key, value):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            db = self._connect()
+            try:
+                db.execute(
+                    "insert or replace into results values (?, ?, ?, ?);",
+                    (key, value, size, time.time()))
+                total = db.execute(
+                    "select coalesce(sum(SIZE), 0) from results;").fetchone()[0]
+                if total > self.max_bytes:
+                    evict = []
+                    for old_key, old_size in db.execute(
+                            "select KEY, SIZE from results order by ACCESSED;"):
+                        if total <= self.max_bytes:
+                            break
+                        evict.append((old_key,))
+                        total -= old_size
+                    db.executemany("delete from results where KEY = ?;", evict)
+                db.commit()
+            finally:
+                db.close()
+
+    def clear(self):
+        with self._lock:
+            db = self._connect()
+            try:
+                db.execute("delete from results;")
+                db.commit()
+            finally:
+                db.close()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            db = self._connect()
+            try:
+                entries, size = db.execute(
+                    "select count(*), coalesce(sum(SIZE), 0) from results;"
+                ).fetchone()
+            finally:
+                db.close()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size": size,
+            "max_size": self.max_bytes,
+            "path": str(self.path),
+        }
+
+
+def forms_changed(old, new):
+    """
+    Return the proportion of forms of a language that differ between runs.
+    """
+    old, new = Counter(old), Counter(new)
+    changed = sum(((old - new) + (new - old)).values())
+    return changed / max(sum(old.values()), sum(new.values()), 1)
+
+
+class ScorerCache:
+    """
+    Persistent LexStat scoring functions.
+
+    Note
+    ----
+    Scorers are stored per fingerprint of the taxa, the multiset of forms of
+    each taxon, and the parameters of the scorer. A stored scorer is also
+    reused for data that differs from it, as long as no language has more
+    than `threshold` of its forms changed. Sounds that were not part of the
+    stored scorer then keep the scores of the SCA model.
+    """
+
+    def __init__(self, path=None, threshold=0.05, keep=5):
+        self._path = Path(path) if path else None
+        self.threshold = threshold
+        self.keep = keep
+        self._lock = threading.Lock()
+
+    @property
+    def path(self):
+        return self._path or cache_dir().joinpath("scorers")
+
+    def configure(self, path=None, threshold=None):
+        if path:
+            self._path = Path(path)
+        if threshold is not None:
+            self.threshold = threshold
+
+    @staticmethod
+    def _forms(lex):
+        return {
+            taxon: sorted(
+                " ".join(tokens) for tokens in lex.get_list(
+                    col=taxon, entry="tokens", flat=True))
+            for taxon in lex.cols}
+
+    @staticmethod
+    def _digest(*values):
+        return hashlib.sha256(
+            json.dumps(values, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def _family(self, kind, lex, params):
+        return self._digest(kind, list(lex.cols), params)[:16]
+
+    def load(self, lex, params, kind="lexstat"):
+        """
+        Set the scorer of a LexStat object from the cache, if possible.
+        """
+        family = self._family(kind, lex, params)
+        forms = self._forms(lex)
+        exact = self.path.joinpath(
+            family, self._digest(forms)[:16] + ".pickle")
+        candidates = [exact] if exact.exists() else []
+        if not candidates and self.path.joinpath(family).exists():
+            candidates = sorted(
+                self.path.joinpath(family).glob("*.pickle"),
+                key=lambda path: path.stat().st_mtime, reverse=True)
+        for candidate in candidates:
+            try:
+                with open(candidate, "rb") as f:
+                    stored = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                continue
+            if max(
+                    forms_changed(stored["forms"].get(taxon, []), forms[taxon])
+                    for taxon in forms) > self.threshold:
+                continue
+            self._restore(lex, stored, params)
+            os.utime(candidate)
+            return True
+        return False
+
+    def store(self, lex, params, kind="lexstat"):
+        """
+        Write the scorer of a LexStat object to the cache.
+        """
+        folder = self.path.joinpath(self._family(kind, lex, params))
+        forms = self._forms(lex)
+        with self._lock:
+            folder.mkdir(parents=True, exist_ok=True)
+            target = folder.joinpath(self._digest(forms)[:16] + ".pickle")
+            tmp = target.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump({
+                    "forms": forms,
+                    "chars": list(lex.cscorer.chars2int),
+                    "matrix": lex.cscorer.matrix}, f)
+            os.replace(tmp, target)
+            stored = sorted(
+                folder.glob("*.pickle"),
+                key=lambda path: path.stat().st_mtime, reverse=True)
+            for path in stored[self.keep:]:
+                path.unlink()
+
+    @staticmethod
+    def _restore(lex, stored, params):
+        from lingpy.algorithm.cython import _misc as misc
+
+        chars = lex.bscorer.chars2int
+        old = {char: i for i, char in enumerate(stored["chars"])}
+        matrix = [[c for c in line] for line in lex.bscorer.matrix]
+        shared = [(chars[char], old[char]) for char in chars if char in old]
+        for i, k in shared:
+            row, old_row = matrix[i], stored["matrix"][k]
+            for j, m in shared:
+                row[j] = old_row[m]
+        lex.cscorer = misc.ScoreDict(lex.chars, matrix)
+        lex._meta["scorer"]["cscorer"] = lex.cscorer
+        lex.params = {"cscorer": params}
+
+
+RESULTS = ResultCache()
+SCORERS = ScorerCache()
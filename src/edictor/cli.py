@@ -4,11 +4,12 @@ Commandline Interface of EDICTOR
 
 import webbrowser
 import os
-from http.server import HTTPServer
 import argparse
 from pathlib import Path
 import codecs
 import json
+import signal
+import sys
 import threading
 
 from edictor.util import DATA
@@ -109,6 +110,37 @@ class server(Command):
                 False,
                 "Do not open a window of the application.",
                 )
+        add_option(
+                p,
+                "workers",
+                min(32, (os.cpu_count() or 1) + 4),
+                "Number of requests served concurrently, by default the "
+                "number of processors plus four, at most 32 (1 serves one "
+                "request at a time). Earlier versions started a new thread "
+                "for every request.",
+                short_opt="w",
+                )
+        add_option(
+                p,
+                "jobs",
+                2,
+                "Maximum number of background analyses running at the same "
+                "time.",
+                short_opt="j",
+                )
+        add_option(
+                p,
+                "cache-dir",
+                None,
+                "Folder where computed analyses are cached (defaults to "
+                "~/.cache/edictor).",
+                )
+        add_option(
+                p,
+                "cache-size",
+                256,
+                "Maximum size of the cache of analyses in megabytes.",
+                )
 
     def __call__(self, args):
         """
@@ -116,8 +148,16 @@ class server(Command):
         """
         os.environ.setdefault("PYTHONUTF8", "1")
         DATA["config"] = args.config
-        from edictor.server import Handler
-        httpd = HTTPServer(("", args.port), Handler)
+        from edictor.server import get_server
+        from edictor.jobs import JOBS
+        JOBS.configure(args.jobs)
+        from edictor.parallel import PROCESSES
+        PROCESSES.configure(os.cpu_count() or 1)
+        if args.cache_dir:
+            os.environ["EDICTOR_CACHE"] = args.cache_dir
+        from edictor.cache import RESULTS
+        RESULTS.configure(max_bytes=args.cache_size * 1024 ** 2)
+        httpd = get_server(args.port, workers=args.workers)
         print("Serving EDICTOR 3 at port {0}...".format(args.port))
         url = "http://localhost:" + str(args.port) + "/"
         if not args.no_window: # pragma: no cover
@@ -129,7 +169,14 @@ class server(Command):
                 except: # noqa
                     print("Could not open webbrowser, please open locally " 
                       "at http://localhost:" + str(args.port) + "/")
-        httpd.serve_forever()
+        # quit.py sends SIGTERM, which should close the databases properly
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        from edictor.db import close_pools
+        try:
+            httpd.serve_forever()
+        finally:
+            httpd.server_close()
+            close_pools()
 
 
 
@@ -238,6 +285,36 @@ class wordlist(Command):
         )
 
 
+class migrate(Command):
+    """
+    Add the indexes of the current schema to SQLITE databases of EDICTOR.
+    """
+
+    @classmethod
+    def subparser(cls, p):
+        p.add_argument(
+                "databases",
+                nargs="+",
+                help="Paths to the SQLITE files you want to migrate.",
+                )
+
+    def __call__(self, args):
+        import sqlite3
+        from edictor.db import migrate as migrate_db, SCHEMA_VERSION
+        for path in args.databases:
+            if not Path(path).exists():
+                print("{0}: file not found".format(path))
+                continue
+            db = sqlite3.connect(path)
+            try:
+                created = migrate_db(db)
+            finally:
+                db.close()
+            print("{0}: schema version {1}, {2}".format(
+                path, SCHEMA_VERSION,
+                "created " + ", ".join(created) if created else "up to date"))
+
+
 def get_parser():
     # basic parser for lingpy
     parser = argparse.ArgumentParser(
@@ -0,0 +1,139 @@
+"""
+Compression of the responses of the local server.
+"""
+import hashlib
+import os
+import threading
+import zlib
+from pathlib import Path
+
+from edictor.cache import cache_dir
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+
+# responses below this size are sent as they are
+MIN_SIZE = 1024
+
+# levels for responses compressed on the fly and for static files
+LEVELS = {"gzip": (6, 9), "br": (5, 11)}
+
+
+def compressible(content_type):
+    """
+    Check whether a content type benefits from compression.
+    """
+    content_type = content_type.split(";")[0].strip().lower()
+    return content_type.startswith("text/") or content_type.endswith(
+        ("json", "javascript", "xml"))
+
+
+def encodings():
+    """
+    Return the encodings supported by the server, the preferred one first.
+    """
+    return ["br", "gzip"] if brotli else ["gzip"]
+
+
+def negotiate(accept):
+    """
+    Select an encoding from the value of an `Accept-Encoding` header.
+
+    Note
+    ----
+    Encodings are weighted by their quality values, and `*` stands for all
+    encodings not listed. If several encodings are equally welcome, Brotli
+    is preferred over gzip. Returns None if the content is to be sent as it
+    is.
+    """
+    if not accept:
+        return None
+    weights = {}
+    for item in accept.split(","):
+        name, _, params = item.strip().partition(";")
+        weight = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.lower() == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name.strip().lower()] = weight
+    best, best_weight = None, 0.0
+    for name in encodings():
+        weight = weights.get(name, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = name, weight
+    return best
+
+
+def compress(data, encoding, static=False):
+    """
+    Compress bytes with gzip or Brotli.
+    """
+    level = LEVELS[encoding][static]
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+class Compressor:
+    """
+    Compress a response that is sent in several parts.
+    """
+
+    def __init__(self, encoding):
+        level = LEVELS[encoding][0]
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=level)
+            self.compress = self._compressor.process
+            self._finish = self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            self.compress = self._compressor.compress
+            self._finish = self._compressor.flush
+
+    def flush(self):
+        return self._finish()
+
+
+def precompressed(path, encoding):
+    """
+    Return the compressed content of a static file, cached on disk.
+
+    Note
+    ----
+    Variants are stored in the `static` folder of the cache, named after
+    the path of the file and the time of its last modification, so that
+    edited files are compressed again. Older variants of the same file are
+    removed. If the cache cannot be written, the file is compressed in
+    memory.
+    """
+    path = Path(path).resolve()
+    stat = path.stat()
+    prefix = hashlib.sha1(str(path).encode("utf-8")).hexdigest()[:16]
+    stamp = hashlib.sha1("{0}:{1}".format(
+        stat.st_mtime_ns, stat.st_size).encode("utf-8")).hexdigest()[:16]
+    folder = cache_dir().joinpath("static")
+    target = folder.joinpath("{0}-{1}.{2}".format(prefix, stamp, encoding))
+    try:
+        return target.read_bytes()
+    except OSError:
+        pass
+    data = compress(path.read_bytes(), encoding, static=True)
+    try:
+        folder.mkdir(parents=True, exist_ok=True)
+        for old in folder.glob(prefix + "-*." + encoding):
+            old.unlink(missing_ok=True)
+        tmp = target.with_suffix(".{0}-{1}.tmp".format(
+            os.getpid(), threading.get_ident()))
+        tmp.write_bytes(data)
+        os.replace(tmp, target)
+    except OSError:  # pragma: no cover
+        pass
+    return data
@@ -0,0 +1,338 @@
+"""
+Pooled connections to the SQLite databases of the triple store.
+"""
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from edictor.parallel import PROCESSES
+
+
+IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# version of the schema, stored in the user_version of the database
+SCHEMA_VERSION = 3
+
+
+def table_name(name):
+    """
+    Check that the name of a table can be used in an SQL statement.
+
+    Note
+    ----
+    Table names cannot be passed as parameters of a prepared statement, so
+    the names sent by the application are restricted to plain identifiers.
+    """
+    if not name or not IDENTIFIER.match(name):
+        raise ValueError("Invalid table name {0!r}.".format(name))
+    return name
+
+
+def triple_tables(db):
+    """
+    Return the names of all tables with the columns ID, COL and VAL.
+    """
+    tables = []
+    for (name,) in db.execute(
+            "select name from sqlite_master where type = 'table' "
+            "and name not like 'sqlite_%' order by name;"):
+        if not IDENTIFIER.match(name):
+            continue
+        columns = [row[1].upper() for row in db.execute(
+            "pragma table_info(" + name + ");")]
+        if columns == ["ID", "COL", "VAL"]:
+            tables.append(name)
+    return tables
+
+
+def unique_cells(db, name):
+    """
+    Check whether a triple table has a unique index on (ID, COL).
+    """
+    for row in db.execute("pragma index_list(" + table_name(name) + ");"):
+        if row[2] and [info[2].upper() for info in db.execute(
+                "pragma index_info(" + row[1] + ");")] == ["ID", "COL"]:
+            return True
+    return False
+
+
+def migrate(db):
+    """
+    Add the indexes of the current schema to a database of the triple store.
+
+    Note
+    ----
+    Triple tables receive an index on (COL, VAL, ID), for lookups of
+    concepts and doculects, and an index on (ID, COL), for access to single
+    cells. The latter is unique, unless the table already contains the same
+    cell more than once. The backup table receives indexes on (FILE, DATE)
+    and (FILE, ID), for the detection of modifications and new identifiers.
+    The table `changes` logs the cells modified through the server, with
+    a sequence number that only grows. The tables `snapshots` and
+    `snapshot_rows` hold the wordlists in wide format, one JSON object per
+    row, for loading them without pivoting the triples. Triggers on each
+    triple table count its modifications in `snapshots`, so that snapshots
+    made outdated by any program writing to the database are detected.
+    Indexes and triggers are looked up by name, so that triple tables added
+    after a database was migrated receive them as well. The names of the
+    indexes that were created are returned.
+    """
+    version = db.execute("pragma user_version;").fetchone()[0]
+    existing = {row[0] for row in db.execute(
+        "select name from sqlite_master;")}
+    indexes = []
+    for table in triple_tables(db):
+        indexes.append((
+            table + "_col_val",
+            "create index if not exists {0} on " + table + " (COL, VAL, ID);"))
+        duplicates = table + "_id_col" not in existing and db.execute(
+            "select 1 from " + table + " group by ID, COL "
+            "having count(*) > 1 limit 1;").fetchone()
+        indexes.append((
+            table + "_id_col",
+            "create " + ("" if duplicates else "unique ") +
+            "index if not exists {0} on " + table + " (ID, COL);"))
+    if "backup" in existing:
+        indexes += [
+            ("backup_file_date",
+             "create index if not exists {0} on backup (FILE, DATE);"),
+            ("backup_file_id",
+             "create index if not exists {0} on backup (FILE, ID);")]
+    indexes += [
+        ("changes",
+         "create table if not exists {0} ("
+         "SEQ integer primary key autoincrement, FILE text, ID int, "
+         "COL text, OP text, DATE text);"),
+        ("changes_file_seq",
+         "create index if not exists {0} on changes (FILE, SEQ);"),
+        ("snapshots",
+         "create table if not exists {0} ("
+         "FILE text, VERSION int, BUILT int, COLS text, primary key (FILE));"),
+        ("snapshot_rows",
+         "create table if not exists {0} ("
+         "FILE text, ID int, R int, ROW text, primary key (FILE, ID));"),
+        ("snapshot_rows_order",
+         "create index if not exists {0} on snapshot_rows (FILE, R);")]
+    for table in triple_tables(db):
+        indexes += snapshot_triggers(table)
+    missing = [(name, statement) for name, statement in indexes
+               if name not in existing]
+    if not missing and version >= SCHEMA_VERSION:
+        return []
+    with db:
+        for name, statement in missing:
+            db.execute(statement.format(name))
+        db.execute("pragma user_version = {0};".format(SCHEMA_VERSION))
+    return [name for name, statement in missing]
+
+
+def snapshot_triggers(table):
+    """
+    Return the names and statements of the triggers that count the
+    modifications of a triple table in its snapshot.
+    """
+    return [
+        (table + "_snapshot_" + op,
+         "create trigger if not exists " + table + "_snapshot_" + op +
+         " after " + op + " on " + table_name(table) + " begin "
+         "update snapshots set VERSION = VERSION + 1 "
+         "where FILE = '" + table + "'; end;")
+        for op in ["insert", "update", "delete"]]
+
+
+def record_changes(db, name, cells):
+    """
+    Add modified cells, given as (ID, COL, OP) triples, to the change log.
+
+    Note
+    ----
+    Databases that could not be migrated have no change log, so their
+    modifications are not recorded.
+    """
+    if not has_table(db, "changes"):
+        return
+    db.executemany(
+        "insert into changes (FILE, ID, COL, OP, DATE) "
+        "values (?, ?, ?, ?, strftime('%s', 'now'));",
+        [(name, idx, col, op) for idx, col, op in cells])
+
+
+def has_table(db, name):
+    """
+    Check whether a database contains a table.
+    """
+    return db.execute(
+        "select 1 from sqlite_master where type = 'table' and name = ?;",
+        (name,)).fetchone() is not None
+
+
+def change_head(db):
+    """
+    Return the sequence number of the latest change in a database.
+
+    Note
+    ----
+    Read-only databases that could not be migrated have no change log, in
+    which case None is returned.
+    """
+    if not has_table(db, "changes"):
+        return None
+    return db.execute("select coalesce(max(SEQ), 0) from changes;").fetchone()[0]
+
+
+class ConnectionPool:
+    """
+    Reuse connections to one SQLite database across requests.
+
+    Note
+    ----
+    A connection is used by one request at a time, but it can be handed to
+    any thread of the server. Connections keep the statements they prepared,
+    so repeated queries with parameters are only compiled once. Databases are
+    switched to WAL journaling, which lets readers proceed while another
+    request writes, and migrated to the current schema when the pool opens
+    its first connection, and again whenever the schema was changed, e.g.
+    by a program adding a wordlist. If the migration fails because the
+    database is locked, it is tried again with the next request. Databases
+    that cannot be written are marked as `read_only` and used without the
+    change log and the snapshots.
+    """
+
+    def __init__(self, path, size=8, timeout=30):
+        self.path = Path(path)
+        self.size = size
+        self.timeout = timeout
+        self.wal = False
+        self.read_only = False
+        # schema version of the database when it was last migrated
+        self._schema = None
+        self._migrating = threading.Lock()
+        self._idle = queue.LifoQueue()
+        self._closed = False
+        self.version = 0
+        self._changed = threading.Condition()
+
+    def _connect(self):
+        db = sqlite3.connect(
+            self.path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=256)
+        try:
+            mode = db.execute("pragma journal_mode=wal;").fetchone()[0]
+            self.wal = mode.lower() == "wal"
+        except sqlite3.OperationalError:
+            # read-only folders cannot hold the files of the journal
+            self.wal = False
+        if self.wal:
+            db.execute("pragma synchronous=normal;")
+        return db
+
+    def _migrate(self, db):
+        """
+        Migrate the database if its schema changed since the last migration.
+        """
+        if db.execute("pragma schema_version;").fetchone()[0] == self._schema:
+            return
+        with self._migrating:
+            schema = db.execute("pragma schema_version;").fetchone()[0]
+            if schema == self._schema:
+                return
+            try:
+                migrate(db)
+            except sqlite3.OperationalError as e:
+                db.rollback()
+                if "readonly" not in str(e):
+                    # locked databases are migrated with the next request
+                    return
+                self.read_only = True
+            self._schema = db.execute("pragma schema_version;").fetchone()[0]
+
+    def acquire(self):
+        try:
+            db = self._idle.get_nowait()
+        except queue.Empty:
+            db = self._connect()
+        self._migrate(db)
+        return db
+
+    def release(self, db):
+        if db.in_transaction:
+            db.rollback()
+        if self._closed or self._idle.qsize() >= self.size:
+            db.close()
+        else:
+            self._idle.put(db)
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrow a connection for the duration of a `with` block.
+        """
+        db = self.acquire()
+        try:
+            yield db
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            self.release(db)
+
+    def notify(self):
+        """
+        Wake up all requests waiting for a modification of the database.
+        """
+        with self._changed:
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait(self, version, timeout=None):
+        """
+        Wait until the database was modified after `version` was current.
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        self._closed = True
+        self.notify()
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_pool(path):
+    """
+    Return the pool of a database file, creating it on first use.
+    """
+    key = str(Path(path).resolve())
+    with _POOLS_LOCK:
+        if key not in POOLS:
+            POOLS[key] = ConnectionPool(key)
+        return POOLS[key]
+
+
+def close_pools():
+    """
+    Close all idle connections and the processes of the analyses, e.g. when
+    the server shuts down.
+    """
+    with _POOLS_LOCK:
+        for pool in POOLS.values():
+            pool.close()
+        POOLS.clear()
+    PROCESSES.close()
@@ -3,6 +3,8 @@ import locale
 import traceback
 from collections import defaultdict
 
+from edictor.parallel import get_workers, shard, process_map
+
 
 def _require_panphon():
     import locale
@@ -296,15 +298,14 @@ def _vectorize(rows):
     return {"column": "FEAT_VEC", "values": values, "features": names}
 
 
-def _cognates(rows):
+def _concept_roots(concepts):
+    """
+    Cluster the words of each concept, returning the cluster root per word.
+    """
     ft, _names, zero = _feature_table()
-    grouped = defaultdict(list)
-    for row in rows:
-        grouped[row["concept"]].append(row)
-    next_id = 1
-    values = {}
-    for _concept, items in grouped.items():
-        parent = list(range(len(items)))
+    out = []
+    for words in concepts:
+        parent = list(range(len(words)))
 
         def find(x):
             while parent[x] != x:
@@ -318,19 +319,39 @@ def _cognates(rows):
             if ra != rb:
                 parent[rb] = ra
 
-        for i in range(len(items)):
-            for j in range(i + 1, len(items)):
-                dist = _sequence_distance(items[i]["tokens"], items[j]["tokens"], ft, zero)
+        for i in range(len(words)):
+            for j in range(i + 1, len(words)):
+                dist = _sequence_distance(words[i], words[j], ft, zero)
                 if dist <= 0.45:
                     union(i, j)
+        out.append([find(i) for i in range(len(words))])
+    return out
+
+
+def _cognates(rows, workers=1):
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row["concept"]].append(row)
+    concepts = list(grouped.values())
+    words = [[row["tokens"] for row in items] for items in concepts]
+    roots = {}
+    parts = shard(
+            list(range(len(concepts))), workers,
+            weight=lambda i: len(concepts[i]) ** 2)
+    results = process_map(
+            _concept_roots, [[words[i] for i in part] for part in parts], workers)
+    for part, result in zip(parts, results):
+        roots.update(zip(part, result))
 
+    next_id = 1
+    values = {}
+    for i, items in enumerate(concepts):
         clusters = {}
-        for i in range(len(items)):
-            root = find(i)
+        for item, root in zip(items, roots[i]):
             if root not in clusters:
                 clusters[root] = next_id
                 next_id += 1
-            values[items[i]["idx"]] = str(clusters[root])
+            values[item["idx"]] = str(clusters[root])
     return {"column": "FEAT_COGID", "values": values}
 
 
@@ -529,6 +550,7 @@ def handle_feature_request(args):
     Expected args:
       - action: pipeline action name
       - wordlist: TSV payload
+      - workers: number of processes for cognate detection (optional)
     """
     try:
         action = (args.get("action") or "").strip().lower()
@@ -542,7 +564,7 @@ def handle_feature_request(args):
             return _vectorize(rows)
         if action == "cognates":
             rows = _parse_wordlist(wordlist)
-            return _cognates(rows)
+            return _cognates(rows, workers=get_workers(args.get("workers")))
         if action == "align":
             rows = _parse_wordlist(wordlist, with_cognates=True)
             return _align(rows)
@@ -0,0 +1,136 @@
+"""
+Background jobs for long-running analyses of the local server.
+"""
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a running job once it has been cancelled.
+    """
+
+
+class Job:
+    """
+    A single analysis submitted to the job queue.
+
+    Note
+    ----
+    The function run by the job receives the arguments of the request and
+    the method `progress`, which it calls when entering a new stage of the
+    analysis. Cancellation takes effect at the next call of `progress`, since
+    LingPy and LingRex cannot be interrupted while they compute.
+    """
+
+    def __init__(self, name, func, args, content_type):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.func = func
+        self.args = args
+        self.content_type = content_type
+        self.status = "queued"
+        self.stage = ""
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        self._cancelled = threading.Event()
+
+    def progress(self, stage, done=0, total=0):
+        if self._cancelled.is_set():
+            raise JobCancelled(self.id)
+        self.stage = stage
+        self.done = done
+        self.total = total
+
+    def cancel(self):
+        self._cancelled.set()
+        if self.future is not None and self.future.cancel():
+            self.status = "cancelled"
+            self.finished = time.time()
+
+    def run(self):
+        if self._cancelled.is_set():
+            self.status = "cancelled"
+            self.finished = time.time()
+            return
+        self.status = "running"
+        try:
+            self.result = self.func(self.args, progress=self.progress)
+            self.status = "done"
+        except JobCancelled:
+            self.status = "cancelled"
+        except Exception as exc:
+            self.error = str(exc)
+            self.status = "failed"
+        self.finished = time.time()
+
+    def info(self):
+        return {
+            "id": self.id,
+            "name": self.name,
+            "status": self.status,
+            "stage": self.stage,
+            "done": self.done,
+            "total": self.total,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class JobQueue:
+    """
+    Run jobs in a pool of threads, with at most `max_jobs` at the same time.
+    """
+
+    def __init__(self, max_jobs=2, keep=100):
+        self.max_jobs = max_jobs
+        self.keep = keep
+        self.jobs = {}
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def configure(self, max_jobs):
+        with self._lock:
+            self.max_jobs = max(1, max_jobs)
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
+
+    def submit(self, name, func, args, content_type="text/plain; charset=utf-8"):
+        job = Job(name, func, args, content_type)
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_jobs,
+                        thread_name_prefix="edictor-job")
+            self._prune()
+            self.jobs[job.id] = job
+            job.future = self._executor.submit(job.run)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def _prune(self):
+        finished = sorted(
+                [job for job in self.jobs.values() if job.finished],
+                key=lambda job: job.finished)
+        for job in finished[:max(0, len(finished) - self.keep)]:
+            del self.jobs[job.id]
+
+
+JOBS = JobQueue()
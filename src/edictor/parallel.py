@@ -0,0 +1,132 @@
+"""
+Distribute independent parts of an analysis across processes.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+def get_workers(value, default=1):
+    """
+    Convert the `workers` argument of a request to a number of processes.
+
+    Note
+    ----
+    The values `auto` and `0` use one process per available core.
+    """
+    if value in (None, ""):
+        return default
+    if str(value).lower() in ("auto", "0"):
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(value))
+    except ValueError:
+        return default
+
+
+def shard(items, workers, weight=len):
+    """
+    Split items into at most `workers` shards of similar total weight.
+
+    Note
+    ----
+    Items are assigned from the heaviest to the lightest, each to the shard
+    with the smallest weight so far, and every shard lists its heaviest items
+    first, so that large items do not end up as the long tail of a run.
+    """
+    if not items:
+        return []
+    shards = [[] for _ in range(min(workers, len(items)))]
+    loads = [0] * len(shards)
+    for item in sorted(items, key=weight, reverse=True):
+        i = loads.index(min(loads))
+        shards[i].append(item)
+        loads[i] += weight(item)
+    return [part for part in shards if part]
+
+
+def start_method():
+    """
+    Return the context in which the processes of a pool are started.
+
+    Note
+    ----
+    The server and its background jobs run in threads, and forking a process
+    with several threads can copy locks held by other threads, e.g. those of
+    SQLite, logging, or the caches, into a child that never releases them.
+    Processes are therefore started from a fork server, where available, or
+    as new interpreters.
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("forkserver")
+    return multiprocessing.get_context("spawn")  # pragma: no cover
+
+
+class ProcessPool:
+    """
+    Share one pool of processes among the analyses of the server.
+
+    Note
+    ----
+    Starting processes from a fork server or as new interpreters takes a
+    while, so the server configures a pool once, which is started with the
+    first analysis that is sharded and kept until the server closes it.
+    Without a configured pool, each analysis starts processes of its own.
+    """
+
+    def __init__(self):
+        self.max_workers = 0
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def configure(self, max_workers):
+        self.close()
+        with self._lock:
+            self.max_workers = max_workers
+
+    def executor(self):
+        with self._lock:
+            if self.max_workers > 1 and self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                        max_workers=self.max_workers,
+                        mp_context=start_method())
+            return self._executor
+
+    def discard(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def close(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self.max_workers = 0
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+PROCESSES = ProcessPool()
+
+
+def process_map(func, shards, workers):
+    """
+    Apply a function to each shard, using a pool of processes if possible.
+    """
+    if workers <= 1 or len(shards) <= 1:
+        return [func(part) for part in shards]
+    executor = PROCESSES.executor()
+    if executor is None:
+        with ProcessPoolExecutor(
+                max_workers=min(workers, len(shards)),
+                mp_context=start_method()) as pool:
+            return list(pool.map(func, shards))
+    try:
+        return list(executor.map(func, shards))
+    except BrokenProcessPool:
+        # processes that died take the pool with them, so a new one is
+        # started with the next analysis
+        PROCESSES.discard(executor)
+        raise
@@ -1,14 +1,18 @@
-from http.server import SimpleHTTPRequestHandler
+from http.server import SimpleHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import traceback
 
 from edictor.util import (
         DATA, get_distinct, get_columns,
         check, configuration,
         file_type, file_name, file_handler, triples, download,
-        update, serve_base, new_id, modifications, alignments,
+        update, serve_base, new_id, modifications, changes, events, alignments,
         cognates, patterns, distances, feature_pipeline, semantic_filter, semantic_batch, server_page, server_export,
+        server_search,
         upload_semantic_file,
-        orthography_tokenize, quit
+        orthography_tokenize, quit,
+        job_status, job_result, job_cancel, cache_stats
         )
 
 CONF = configuration()
@@ -54,6 +58,10 @@ class Handler(SimpleHTTPRequestHandler):
                 new_id(s, post_data_bytes, "POST", CONF)
             if fn == "/triples/modifications.py":
                 modifications(s, post_data_bytes, "POST", CONF)
+            if fn == "/triples/changes.py":
+                changes(s, post_data_bytes, "POST", CONF)
+            if fn == "/triples/events.py":
+                events(s, post_data_bytes, "POST", CONF)
             if fn == "/alignments.py":
                 alignments(s, post_data_bytes, "POST")
             if fn == "/cognates.py":
@@ -73,9 +81,19 @@ class Handler(SimpleHTTPRequestHandler):
             if fn == "/orthography_tokenize.py":
                 orthography_tokenize(s, post_data_bytes, "POST")
             if fn == "/server_page.py":
-                server_page(s, post_data_bytes, "POST")
+                server_page(s, post_data_bytes, "POST", CONF)
             if fn == "/server_export.py":
-                server_export(s, post_data_bytes, "POST")
+                server_export(s, post_data_bytes, "POST", CONF)
+            if fn == "/server_search.py":
+                server_search(s, post_data_bytes, "POST", CONF)
+            if fn == "/jobs/status.py":
+                job_status(s, post_data_bytes, "POST")
+            if fn == "/jobs/result.py":
+                job_result(s, post_data_bytes, "POST")
+            if fn == "/jobs/cancel.py":
+                job_cancel(s, post_data_bytes, "POST")
+            if fn == "/cache.py":
+                cache_stats(s, post_data_bytes, "POST")
             if fn == "/quit.py":
                 quit(s)
         except Exception:
@@ -108,16 +126,30 @@ class Handler(SimpleHTTPRequestHandler):
                 new_id(s, s.path, "GET", CONF)
             if fn == "/triples/modifications.py":
                 modifications(s, s.path, "GET", CONF)
+            if fn == "/triples/changes.py":
+                changes(s, s.path, "GET", CONF)
+            if fn == "/triples/events.py":
+                events(s, s.path, "GET", CONF)
             if fn == "/semantic_filter.py":
                 semantic_filter(s, s.path, "GET")
             if fn == "/semantic_batch.py":
                 semantic_batch(s, s.path, "GET")
             if fn == "/server_page.py":
-                server_page(s, s.path, "GET")
+                server_page(s, s.path, "GET", CONF)
             if fn == "/server_export.py":
-                server_export(s, s.path, "GET")
+                server_export(s, s.path, "GET", CONF)
+            if fn == "/server_search.py":
+                server_search(s, s.path, "GET", CONF)
             if fn == "/feature.py":
                 feature_pipeline(s, s.path, "GET")
+            if fn == "/jobs/status.py":
+                job_status(s, s.path, "GET")
+            if fn == "/jobs/result.py":
+                job_result(s, s.path, "GET")
+            if fn == "/jobs/cancel.py":
+                job_cancel(s, s.path, "GET")
+            if fn == "/cache.py":
+                cache_stats(s, s.path, "GET")
             if fn == "/quit.py":
                 quit(s)
         except Exception:
@@ -126,3 +158,90 @@ class Handler(SimpleHTTPRequestHandler):
             s.send_header("Content-type", "text/plain; charset=utf-8")
             s.end_headers()
             s.wfile.write(b"Internal server error.")
+
+    def finish(s):
+        # detached responses are finished by the thread that serves them
+        if not getattr(s, "detached", False):
+            super().finish()
+
+
+class PooledHTTPServer(ThreadingHTTPServer):
+    """
+    HTTP server handing each request to a bounded pool of worker threads.
+
+    Note
+    ----
+    Long analyses (cognates, alignments, semantic filters) then run alongside
+    cheap requests like the polling of the triple store, while the number of
+    requests being served at the same time never exceeds `workers`. Responses
+    that stay open, like the server-sent events of the triple store, are
+    detached from the worker that started them and continue on a thread of
+    their own, and at most `streams` of them are open at the same time.
+    """
+
+    def __init__(self, server_address, handler_class, workers=4, streams=8):
+        self.workers = workers
+        self.streams = streams
+        self.executor = ThreadPoolExecutor(
+                max_workers=workers,
+                thread_name_prefix="edictor")
+        self._detached = {}
+        self._detached_lock = threading.Lock()
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(
+                self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        with self._detached_lock:
+            stream = self._detached.pop(request, None)
+        if stream is None:
+            self.shutdown_request(request)
+        else:
+            threading.Thread(
+                    target=self._serve_detached,
+                    args=(stream, request, client_address),
+                    name="edictor-stream",
+                    daemon=True).start()
+
+    def _serve_detached(self, stream, request, client_address):
+        try:
+            stream()
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def detach(self, handler, stream):
+        """
+        Continue a response outside the workers, once its handler returns.
+        """
+        def serve():
+            try:
+                stream()
+            finally:
+                handler.detached = False
+                handler.finish()
+
+        handler.detached = True
+        handler.close_connection = True
+        with self._detached_lock:
+            self._detached[handler.request] = serve
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
+
+
+def get_server(port, workers=1, address=""):
+    """
+    Create the local server, concurrent if more than one worker is requested.
+    """
+    if workers > 1:
+        return PooledHTTPServer((address, port), Handler, workers=workers)
+    return HTTPServer((address, port), Handler)
@@ -0,0 +1,118 @@
+"""
+Static files of the application, kept in memory while they are in use.
+"""
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from edictor.compress import precompressed
+
+
+# binary files of at least this size are sent from the disk with sendfile
+SENDFILE_SIZE = 64 * 1024
+
+# third-party libraries only change with a new version of the application
+VENDORED = ("js/vendor/", "css/bootstrap", "css/jquery-ui", "fonts/")
+
+
+def cache_control(name):
+    """
+    Return the `Cache-Control` header of a static file.
+
+    Note
+    ----
+    Vendored libraries and fonts may be used for a day without asking the
+    server again. All other files are revalidated on every request, so that
+    changes of the application show up immediately.
+    """
+    if name.lstrip("/").startswith(VENDORED):
+        return "public, max-age=86400"
+    return "no-cache"
+
+
+class StaticCache:
+    """
+    Cache the content of static files in memory.
+
+    Note
+    ----
+    Entries are keyed by the path of a file and are only used as long as
+    the time of its last modification and its size match. Each entry holds
+    the plain content and the compressed variants requested so far. Files
+    larger than `max_file` are not cached, and entries are evicted in the
+    order of their last access, once all of them exceed `max_bytes`.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 ** 2, max_file=4 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.max_file = max_file
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, stamp, encoding=None):
+        """
+        Return the content of a file, compressed with `encoding` if given.
+        """
+        key = str(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == stamp and encoding in entry[1]:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1][encoding]
+            self.misses += 1
+        if encoding:
+            data = precompressed(path, encoding)
+        else:
+            data = Path(path).read_bytes()
+        if stamp[1] <= self.max_file:
+            self._put(key, stamp, encoding, data)
+        return data
+
+    def _put(self, key, stamp, encoding, data):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry and entry[0] == stamp:
+                variants = entry[1]
+            else:
+                variants = {}
+                if entry:
+                    self.size -= sum(map(len, entry[1].values()))
+            if encoding in variants:
+                self.size -= len(variants[encoding])
+            variants[encoding] = data
+            self.size += len(data)
+            self._entries[key] = (stamp, variants)
+            while self.size > self.max_bytes and self._entries:
+                _, (_, old) = self._entries.popitem(last=False)
+                self.size -= sum(map(len, old.values()))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+STATIC = StaticCache()
+
+
+def sendfile(s, path, size):
+    """
+    Copy a file to the socket of a request without reading it into memory.
+
+    Note
+    ----
+    The socket uses `os.sendfile` where the platform provides it. Returns
+    False if the handler has no socket, as in the tests, in which case the
+    caller sends the content itself.
+    """
+    connection = getattr(s, "connection", None)
+    if connection is None:
+        return False
+    s.wfile.flush()
+    with open(path, "rb") as f:
+        connection.sendfile(f, 0, size)
+    return True
@@ -0,0 +1,826 @@
+"""
+Random access to the rows of large TSV files.
+"""
+import bisect
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import pickle
+import re
+import sqlite3
+import struct
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from contextlib import ExitStack
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # pragma: no cover
+    import sre_constants
+    import sre_parse
+from operator import itemgetter
+from pathlib import Path
+
+from edictor.cache import cache_dir
+
+
+# magic number, time of modification and size of the file, count of numbers
+HEADER = struct.Struct("<8sqqq")
+MAGIC = b"EDLINES2"
+
+# rows are split in blocks of about this size
+BLOCK_SIZE = 4 * 1024 ** 2
+
+# rows are sorted in memory in runs covering this many bytes of a file
+SORT_SIZE = 16 * 1024 ** 2
+
+# columns added to the inverted index of every file
+INDEX_COLUMNS = ["DOCULECT", "CONCEPT"]
+
+# columns searched if a search names none of the file
+SEARCH_COLUMNS = ["FORM", "TOKENS", "NOTE"]
+
+# postings of trigrams are written to the index in parts of this many rows
+GRAM_ROWS = 500000
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def sidecar(path, suffix):
+    """
+    Return the path of a file in the cache that belongs to a TSV file.
+    """
+    key = hashlib.sha1(str(Path(path).resolve()).encode("utf-8")).hexdigest()
+    return cache_dir().joinpath("tsv", key[:20] + suffix)
+
+
+def load_numbers(target, stamp):
+    """
+    Map the numbers stored for a file into memory, if they are still valid.
+    """
+    try:
+        with open(target, "rb") as f:
+            magic, mtime, size, count = HEADER.unpack(f.read(HEADER.size))
+            if magic != MAGIC or (mtime, size) != stamp:
+                return None
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError, struct.error):
+        return None
+    numbers = memoryview(data)[HEADER.size:].cast("q")
+    return numbers if len(numbers) == count else None
+
+
+def store_numbers(target, stamp, numbers):
+    """
+    Store an array of numbers for a file, along with the stamp of the file.
+    """
+    try:
+        target.parent.mkdir(parents=True, exist_ok=True)
+        tmp = target.with_suffix(".{0}-{1}.tmp".format(
+            os.getpid(), threading.get_ident()))
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, *stamp, len(numbers)))
+            numbers.tofile(f)
+        os.replace(tmp, target)
+    except OSError:  # pragma: no cover
+        pass
+
+
+class TsvReader:
+    """
+    Read a TSV file from a memory map.
+
+    Note
+    ----
+    Rows are found in the raw bytes of the file, split only up to the last
+    column that is requested, and only the requested cells are decoded.
+    Use the reader in a `with` statement, which unmaps the file again.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self._file = open(self.path, "rb")
+        try:
+            self.data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty files cannot be mapped
+            self.data = b""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+        self._file.close()
+
+    def __len__(self):
+        return len(self.data)
+
+    def header(self):
+        """
+        Return the names of the columns.
+        """
+        end = self.data.find(b"\n")
+        line = self.data[:end if end >= 0 else len(self.data)]
+        return line.decode("utf-8").rstrip("\r").split("\t") if line else []
+
+    def offsets(self):
+        """
+        Return the offsets of all rows below the header and of the end.
+        """
+        data = self.data
+        if not isinstance(data, mmap.mmap):
+            return array("q", [0])
+        data.seek(0)
+        data.readline()
+        offsets = array("q", [data.tell()])
+        readline, tell, append = data.readline, data.tell, offsets.append
+        while readline():
+            append(tell())
+        return offsets
+
+    def blocks(self, start, stop, size=BLOCK_SIZE):
+        """
+        Iterate over blocks of whole lines between two offsets.
+        """
+        data = self.data
+        while start < stop:
+            end = min(stop, start + size)
+            if end < stop:
+                end = data.rfind(b"\n", start, end) + 1 or \
+                    data.find(b"\n", end, stop) + 1 or stop
+            yield data[start:end]
+            start = end
+
+    def cells(self, positions, start, stop, decode=True):
+        """
+        Iterate over the requested cells of the rows between two offsets.
+        """
+        limit = max(positions) + 1 if positions else 0
+        # padded lines have all requested cells, however short the row is
+        pad = b"\t" * limit
+        if len(positions) > 1:
+            pick = itemgetter(*positions)
+        else:
+            # itemgetter returns a single cell for a single position
+            pick = itemgetter(slice(limit - 1 if positions else 0, limit))
+        for block in self.blocks(start, stop):
+            lines = block.split(b"\n")
+            if block.endswith(b"\n"):
+                lines.pop()
+            for line in lines:
+                if line.endswith(b"\r"):
+                    line = line[:-1]
+                cells = pick((line + pad).split(b"\t", limit))
+                if decode:
+                    yield [cell.decode("utf-8") for cell in cells]
+                else:
+                    yield list(cells)
+
+    def chunks(self, size=1024 ** 2):
+        """
+        Iterate over the content of the file in blocks of bytes.
+        """
+        for start in range(0, len(self.data), size):
+            yield self.data[start:start + size]
+
+
+class LineIndex:
+    """
+    Locate the rows of a TSV file by their byte offsets.
+
+    Note
+    ----
+    The offsets of all rows below the header are computed in one pass over
+    the file and stored in the `tsv` folder of the cache, together with the
+    time of the last modification and the size of the file, so that they
+    are computed again when the file changes. The stored offsets are mapped
+    into memory, which makes the position of any row available in constant
+    time. Rows are separated by newlines only. The numbers of the rows
+    that match a filter are kept with the index, so that the same filter
+    is only looked up once.
+    """
+
+    def __init__(self, path, max_filters=16):
+        self.path = Path(path)
+        self.stamp = _stamp(path)
+        self.max_filters = max_filters
+        self._filters = OrderedDict()
+        self._lock = threading.Lock()
+        self._values = None
+        self._grams = None
+        self._orders = OrderedDict()
+        self._offsets = self._load()
+        if self._offsets is None:
+            self._offsets = self._build()
+
+    def _load(self):
+        return load_numbers(sidecar(self.path, ".lines"), self.stamp)
+
+    def _build(self):
+        with TsvReader(self.path) as reader:
+            offsets = reader.offsets()
+        store_numbers(sidecar(self.path, ".lines"), self.stamp, offsets)
+        return offsets
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def read(self, start, stop):
+        """
+        Return the lines from row `start` up to row `stop` as bytes.
+        """
+        stop = min(stop, len(self))
+        if start >= stop:
+            return b""
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[start])
+            return f.read(self._offsets[stop] - self._offsets[start])
+
+    def rows(self, numbers, positions):
+        """
+        Iterate over the requested cells of the rows with the given numbers.
+
+        Note
+        ----
+        `positions` are the positions of the requested columns. Ranges of
+        numbers are read in one pass over the memory map.
+        """
+        offsets = self._offsets
+        with TsvReader(self.path) as reader:
+            if isinstance(numbers, range) and numbers.step == 1:
+                start, stop = max(0, numbers.start), min(numbers.stop, len(self))
+                if start < stop:
+                    yield from reader.cells(
+                        positions, offsets[start], offsets[stop])
+                return
+            for number in numbers:
+                if 0 <= number < len(self):
+                    yield from reader.cells(
+                        positions, offsets[number], offsets[number + 1])
+
+    def matches(self, key, find):
+        """
+        Return the numbers of the rows that match a filter.
+
+        Note
+        ----
+        `key` identifies the filter and `find` computes the numbers if they
+        are not known yet. Results are kept for the most recently used
+        `max_filters` filters.
+        """
+        with self._lock:
+            if key in self._filters:
+                self._filters.move_to_end(key)
+                return self._filters[key]
+        numbers = find()
+        with self._lock:
+            self._filters[key] = numbers
+            while len(self._filters) > self.max_filters:
+                self._filters.popitem(last=False)
+        return numbers
+
+    def order(self, header, sort):
+        """
+        Return the sort index of the file for a list of columns.
+
+        Note
+        ----
+        `sort` lists the names of the columns, each with a flag that is set
+        for a descending order. The most recently used `max_filters` sort
+        indexes are kept with the line index.
+        """
+        key = json.dumps([[name.upper(), bool(desc)] for name, desc in sort])
+        with self._lock:
+            if key in self._orders:
+                self._orders.move_to_end(key)
+                return self._orders[key]
+        order = SortIndex(self, header, json.loads(key))
+        with self._lock:
+            self._orders[key] = order
+            while len(self._orders) > self.max_filters:
+                self._orders.popitem(last=False)
+        return order
+
+    @property
+    def values(self):
+        """
+        The inverted index of the file, created on first use.
+        """
+        with self._lock:
+            if self._values is None:
+                self._values = ValueIndex(self)
+            return self._values
+
+    @property
+    def grams(self):
+        """
+        The trigram index of the file, created on first use.
+        """
+        with self._lock:
+            if self._grams is None:
+                self._grams = TrigramIndex(self)
+            return self._grams
+
+
+class ValueIndex:
+    """
+    Find the rows of a TSV file by the values of some of its columns.
+
+    Note
+    ----
+    For each indexed column, the numbers of the rows are stored by the
+    lower-case value of their cells, in an SQLite file in the `tsv` folder
+    of the cache. Columns are added in one pass over the file when they
+    are first used in a filter, and `DOCULECT` and `CONCEPT` are always
+    added along with them. If the time of the last modification or the
+    size of the file changed, the stored index is discarded.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.path = sidecar(index.path, ".values.sqlite3")
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            with db:
+                db.execute(
+                    "create table if not exists meta (MTIME int, SIZE int);")
+                db.execute(
+                    "create table if not exists postings (COL text, VAL text, "
+                    "ROWS blob, primary key (COL, VAL)) without rowid;")
+                if db.execute("select MTIME, SIZE from meta;").fetchone() != \
+                        self.index.stamp:
+                    db.execute("delete from meta;")
+                    db.execute("delete from postings;")
+                    db.execute(
+                        "insert into meta values (?, ?);", self.index.stamp)
+            self._ready = True
+        return db
+
+    def columns(self):
+        """
+        Return the names of the columns that are indexed.
+        """
+        db = self._connect()
+        try:
+            return {row[0] for row in db.execute(
+                "select distinct COL from postings;")}
+        finally:
+            db.close()
+
+    def add(self, header, columns):
+        """
+        Index the given columns of a header, unless they are already.
+        """
+        with self._lock:
+            missing = {
+                name.upper() for name in list(columns) + INDEX_COLUMNS
+            } - self.columns()
+            positions = {
+                name.upper(): i for i, name in enumerate(header)
+                if name.upper() in missing}
+            if not positions:
+                return
+            # cells are collected as bytes, and only distinct values are
+            # decoded, which merges values that only differ in case
+            names = list(positions)
+            raw = {name: {} for name in names}
+            with TsvReader(self.index.path) as reader:
+                offsets = self.index._offsets
+                for number, cells in enumerate(reader.cells(
+                        list(positions.values()), offsets[0], offsets[-1],
+                        decode=False)):
+                    for name, cell in zip(names, cells):
+                        numbers = raw[name].get(cell)
+                        if numbers is None:
+                            numbers = raw[name][cell] = array("q")
+                        numbers.append(number)
+            postings = {name: {} for name in names}
+            for name, values in raw.items():
+                for cell, numbers in values.items():
+                    value = cell.decode("utf-8").lower()
+                    if value in postings[name]:
+                        merged = postings[name][value] + numbers
+                        postings[name][value] = array("q", sorted(merged))
+                    else:
+                        postings[name][value] = numbers
+            db = self._connect()
+            try:
+                with db:
+                    db.executemany(
+                        "insert or replace into postings values (?, ?, ?);",
+                        [(name, value, numbers.tobytes())
+                         for name, values in postings.items()
+                         for value, numbers in values.items()])
+            finally:
+                db.close()
+
+    def find(self, header, filters, extra=()):
+        """
+        Return the numbers of the rows matching all filters.
+
+        Note
+        ----
+        Filters map column names to lists of values, of which a cell must
+        match one, ignoring case. Columns missing from the header match
+        no row. The columns in `extra` are indexed along with the filtered
+        ones.
+        """
+        names = {name.upper() for name in header}
+        if any(column.upper() not in names for column in filters):
+            return array("q")
+        self.add(header, list(filters) + list(extra))
+        db = self._connect()
+        try:
+            sets = []
+            for column, values in filters.items():
+                numbers = array("q")
+                blobs = db.execute(
+                    "select ROWS from postings where COL = ? and VAL in "
+                    "(select value from json_each(?));",
+                    (column.upper(), json.dumps(
+                        sorted({value.lower() for value in values})))
+                ).fetchall()
+                for (blob,) in blobs:
+                    numbers.frombytes(blob)
+                # the rows of each value are sorted already
+                sets.append(
+                    numbers if len(blobs) < 2 else array("q", sorted(numbers)))
+        finally:
+            db.close()
+        if not sets:
+            return array("q", range(len(self.index)))
+        sets.sort(key=len)
+        if len(sets) == 1:
+            return sets[0]
+        result = set(sets[0])
+        for numbers in sets[1:]:
+            result = result.intersection(numbers)
+        return array("q", sorted(result))
+
+
+def trigrams(text):
+    """
+    Return the set of all sequences of three characters in a text.
+    """
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def literals(pattern):
+    """
+    Return the texts that any match of a regular expression must contain.
+
+    Note
+    ----
+    Only the characters at the top level of the expression are collected,
+    which every match contains, while alternatives, repetitions, and
+    classes of characters end a text.
+    """
+    try:
+        items = sre_parse.parse(pattern)
+    except (re.error, OverflowError):
+        return []
+    texts, text = [], []
+    for op, arg in items:
+        if op is sre_constants.LITERAL:
+            text.append(chr(arg))
+        else:
+            texts.append("".join(text))
+            text = []
+    texts.append("".join(text))
+    return [text for text in texts if text]
+
+
+class TrigramIndex:
+    """
+    Search the cells of some columns of a TSV file for texts.
+
+    Note
+    ----
+    For each searched column, the numbers of the rows are stored by the
+    trigrams of the lower-case value of their cells, in an SQLite file in
+    the `tsv` folder of the cache. Columns are added in one pass over the
+    file when they are first searched, and postings are written in parts
+    of `GRAM_ROWS` rows. Searches for texts or regular expressions with
+    at least three known characters only check the cells of the rows that
+    contain all of their trigrams, other searches check all cells. If the
+    time of the last modification or the size of the file changed, the
+    stored index is discarded.
+    """
+
+    def __init__(self, index):
+        self.index = index
+        self.path = sidecar(index.path, ".grams.sqlite3")
+        self._lock = threading.Lock()
+        self._ready = False
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(self.path, timeout=30)
+        if not self._ready:
+            with db:
+                db.execute(
+                    "create table if not exists meta (MTIME int, SIZE int);")
+                db.execute(
+                    "create table if not exists columns (COL text primary key);")
+                db.execute(
+                    "create table if not exists grams (COL text, GRAM text, "
+                    "PART int, ROWS blob, primary key (COL, GRAM, PART)) "
+                    "without rowid;")
+                if db.execute("select MTIME, SIZE from meta;").fetchone() != \
+                        self.index.stamp:
+                    db.execute("delete from meta;")
+                    db.execute("delete from columns;")
+                    db.execute("delete from grams;")
+                    db.execute(
+                        "insert into meta values (?, ?);", self.index.stamp)
+            self._ready = True
+        return db
+
+    def columns(self):
+        """
+        Return the names of the columns that are indexed.
+        """
+        db = self._connect()
+        try:
+            return {row[0] for row in db.execute("select COL from columns;")}
+        finally:
+            db.close()
+
+    def add(self, header, columns):
+        """
+        Index the given columns of a header, unless they are already.
+        """
+        with self._lock:
+            missing = {name.upper() for name in columns} - self.columns()
+            positions = {
+                name.upper(): i for i, name in enumerate(header)
+                if name.upper() in missing}
+            if not positions:
+                return
+            names = list(positions)
+            offsets = self.index._offsets
+            db = self._connect()
+            try:
+                with db, TsvReader(self.index.path) as reader:
+                    for part, start in enumerate(
+                            range(0, len(self.index), GRAM_ROWS)):
+                        stop = min(len(self.index), start + GRAM_ROWS)
+                        postings = {name: {} for name in names}
+                        # the trigrams of each distinct cell are only
+                        # computed once
+                        known = {name: {} for name in names}
+                        for number, cells in enumerate(reader.cells(
+                                list(positions.values()), offsets[start],
+                                offsets[stop], decode=False), start):
+                            for name, cell in zip(names, cells):
+                                grams = known[name].get(cell)
+                                if grams is None:
+                                    grams = known[name][cell] = trigrams(
+                                        cell.decode("utf-8").lower())
+                                rows = postings[name]
+                                for gram in grams:
+                                    numbers = rows.get(gram)
+                                    if numbers is None:
+                                        numbers = rows[gram] = array("q")
+                                    numbers.append(number)
+                        db.executemany(
+                            "insert or replace into grams values (?, ?, ?, ?);",
+                            [(name, gram, part, numbers.tobytes())
+                             for name, rows in postings.items()
+                             for gram, numbers in rows.items()])
+                    db.executemany(
+                        "insert or replace into columns values (?);",
+                        [(name,) for name in names])
+            finally:
+                db.close()
+
+    def candidates(self, column, grams):
+        """
+        Return the numbers of the rows whose cells contain all trigrams.
+        """
+        db = self._connect()
+        try:
+            result = None
+            for gram in sorted(grams):
+                numbers = array("q")
+                for (blob,) in db.execute(
+                        "select ROWS from grams where COL = ? and GRAM = ? "
+                        "order by PART;", (column, gram)):
+                    numbers.frombytes(blob)
+                result = set(numbers) if result is None else \
+                    result.intersection(numbers)
+                if not result:
+                    break
+            return array("q", sorted(result or ()))
+        finally:
+            db.close()
+
+    def search(self, header, columns, text, regex=False):
+        """
+        Return the numbers of the rows matching a search for each column.
+
+        Note
+        ----
+        Texts are found anywhere in a cell, ignoring case. Regular
+        expressions are searched in the cells, also ignoring case. Columns
+        missing from the header are ignored, and `SEARCH_COLUMNS` are
+        searched if none is left.
+        """
+        names = {name.upper(): i for i, name in enumerate(header)}
+        columns = [
+            column.upper() for column in columns if column.upper() in names
+        ] or [column for column in SEARCH_COLUMNS if column in names]
+        if regex:
+            match = re.compile(text, re.IGNORECASE).search
+            grams = set().union(*(
+                trigrams(literal.lower()) for literal in literals(text)))
+        else:
+            needle = text.lower()
+
+            def match(cell):
+                return needle in cell.lower()
+            grams = trigrams(needle)
+        if grams:
+            self.add(header, columns)
+
+        # columns with few candidates are checked row by row, all others
+        # in one pass over the file
+        checked, scanned = {}, []
+        for column in columns:
+            numbers = self.candidates(column, grams) if grams else None
+            if numbers is None or len(numbers) > len(self.index) / 8:
+                scanned.append(column)
+            else:
+                checked[column] = array("q", (
+                    number for number, (cell,) in zip(numbers, self.index.rows(
+                        numbers, [names[column]])) if match(cell)))
+        if scanned:
+            hits = {column: array("q") for column in scanned}
+            offsets = self.index._offsets
+            with TsvReader(self.index.path) as reader:
+                for number, cells in enumerate(reader.cells(
+                        [names[column] for column in scanned], offsets[0],
+                        offsets[-1])):
+                    for column, cell in zip(scanned, cells):
+                        if match(cell):
+                            hits[column].append(number)
+            checked.update(hits)
+        return {column: checked[column] for column in columns}
+
+
+def sort_key(cell, descending=False):
+    """
+    Return the key by which a cell is sorted.
+
+    Note
+    ----
+    Numbers come first and are compared by their value, all other cells
+    follow in alphabetical order, ignoring case. Keys for a descending
+    order reverse both, with the characters of a text mapped in reverse
+    and followed by the last character of Unicode, which sorts a text
+    before its own prefixes.
+    """
+    try:
+        number = float(cell)
+        if number == number:
+            return (1, -number, "") if descending else (0, number, "")
+    except ValueError:
+        pass
+    text = cell.casefold()
+    if descending:
+        return (0, 0, "".join(
+            [chr(max(0, 0x10FFFE - ord(char))) for char in text]) + "\U0010ffff")
+    return (1, 0, text)
+
+
+class SortIndex:
+    """
+    Order the rows of a TSV file by the values of some of its columns.
+
+    Note
+    ----
+    The rows are sorted in runs, each covering at most `SORT_SIZE` bytes of
+    the file, which are kept in temporary files and merged, so that files
+    of any size are sorted with little memory. Rows with equal values keep
+    the order of the file. The order of the rows and the rank of each row
+    in it are stored in the `tsv` folder of the cache, named after the
+    columns, and are sorted again when the file changes. Columns missing
+    from the header are ignored.
+    """
+
+    def __init__(self, index, header, sort):
+        self.index = index
+        names = {name.upper(): i for i, name in enumerate(header)}
+        self.sort = [(name, desc) for name, desc in sort if name in names]
+        self.positions = [names[name] for name, _ in self.sort]
+        key = hashlib.sha1(json.dumps(self.sort).encode("utf-8")).hexdigest()
+        self.path = sidecar(index.path, ".sort-" + key[:12])
+        size = len(index)
+        data = load_numbers(self.path, index.stamp)
+        if data is None or len(data) != 2 * size:
+            data = self._build()
+            store_numbers(self.path, index.stamp, data)
+        self.numbers, self.ranks = data[:size], data[size:]
+
+    def _runs(self, reader):
+        offsets = self.index._offsets
+        size = len(self.index)
+        descending = [desc for _, desc in self.sort]
+        start = 0
+        while start < size:
+            stop = bisect.bisect_right(
+                offsets, offsets[start] + SORT_SIZE, start + 1) - 1
+            stop = min(size, max(start + 1, stop))
+            # keys are computed once for each distinct cell of a run
+            keys = [{} for _ in self.sort]
+            run = []
+            for number, cells in enumerate(reader.cells(
+                    self.positions, offsets[start], offsets[stop],
+                    decode=False), start):
+                key = []
+                for cell, known, desc in zip(cells, keys, descending):
+                    value = known.get(cell)
+                    if value is None:
+                        value = known[cell] = sort_key(
+                            cell.decode("utf-8"), desc)
+                    key.append(value)
+                run.append((tuple(key), number))
+            run.sort()
+            yield run
+            start = stop
+
+    def _build(self):
+        size = len(self.index)
+        with TsvReader(self.index.path) as reader, ExitStack() as stack:
+            runs = []
+            for run in self._runs(reader):
+                if not runs and len(run) == size:
+                    runs.append(run)
+                    break
+                f = stack.enter_context(tempfile.TemporaryFile())
+                for start in range(0, len(run), 4096):
+                    pickle.dump(run[start:start + 4096], f)
+                f.seek(0)
+                runs.append(_load_run(f))
+            numbers = array("q", (
+                number for _, number in heapq.merge(*runs)))
+        ranks = array("q", bytes(8 * size))
+        for rank, number in enumerate(numbers):
+            ranks[number] = rank
+        return numbers + ranks
+
+    def arrange(self, numbers):
+        """
+        Return the given numbers of rows in the order of the index.
+        """
+        return array("q", sorted(numbers, key=self.ranks.__getitem__))
+
+
+def _load_run(f):
+    while True:
+        try:
+            yield from pickle.load(f)
+        except EOFError:
+            return
+
+
+INDEXES = OrderedDict()
+MAX_INDEXES = 8
+_INDEX_LOCK = threading.Lock()
+
+
+def line_index(path):
+    """
+    Return the line index of a TSV file, reusing it while the file is unchanged.
+    """
+    key = str(Path(path).resolve())
+    stamp = _stamp(key)
+    with _INDEX_LOCK:
+        index = INDEXES.get(key)
+        if index is not None and index.stamp == stamp:
+            INDEXES.move_to_end(key)
+            return index
+    index = LineIndex(key)
+    with _INDEX_LOCK:
+        INDEXES[key] = index
+        INDEXES.move_to_end(key)
+        while len(INDEXES) > MAX_INDEXES:
+            INDEXES.popitem(last=False)
+    return index
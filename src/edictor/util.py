@@ -8,9 +8,17 @@ import json
 import codecs
 import getpass
 import signal
+import socketserver
 import re
+import functools
+import itertools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from email.parser import BytesParser
 from email.policy import default as email_default
+from email.utils import formatdate, parsedate_to_datetime
 
 from urllib.request import urlopen
 
@@ -18,6 +26,18 @@ from pathlib import Path
 from datetime import datetime
 from importlib.machinery import SourceFileLoader
 
+from edictor import __version__
+from edictor.jobs import JOBS
+from edictor.cache import RESULTS, SCORERS, result_key
+from edictor.parallel import get_workers, shard, process_map
+from edictor.compress import (
+        MIN_SIZE, Compressor, compress, compressible, negotiate)
+from edictor.static import STATIC, SENDFILE_SIZE, cache_control, sendfile
+from edictor.tsv import TsvReader, line_index
+from edictor.db import (
+        get_pool, table_name, unique_cells, record_changes, change_head,
+        has_table, snapshot_triggers)
+
 DATA = {
     "js": "text/javascript",
     "css": "text/css",
@@ -56,18 +76,35 @@ def _get_semantic_model(name, device):
     return SEMANTIC_MODELS[key]
 
 
+def database_path(path, conf):
+    """
+    Locate an SQLite database in the user's folder or in the application.
+    """
+    for candidate in [
+            Path(conf["sqlite"], path + ".sqlite3"),
+            edictor_path(conf["sqlite"], path + ".sqlite3")]:
+        if candidate.exists():
+            return candidate
+    raise ValueError("SQLITE DB could not be found.")
+
+
 def opendb(path, conf):
-    if Path(conf["sqlite"], path + ".sqlite3").exists():
-        db = sqlite3.connect(
-            Path(conf["sqlite"], path + ".sqlite3"))
-    elif edictor_path(conf["sqlite"], path + ".sqlite3").exists():
-        db = sqlite3.connect(
-            edictor_path(conf["sqlite"], path + ".sqlite3"))
-    else:
-        raise ValueError("SQLITE DB could not be found.")
+    db = sqlite3.connect(database_path(path, conf))
     return db, db.cursor()
 
 
+def triple_store(path, conf):
+    """
+    Borrow a pooled connection to an SQLite database of the triple store.
+
+    Note
+    ----
+    Use the result in a `with` statement, which returns the connection to
+    the pool, rolling back anything that has not been committed.
+    """
+    return get_pool(database_path(path, conf)).connection()
+
+
 def edictor_path(*comps):
     return Path(__file__).parent.joinpath("app", *comps)
 
@@ -115,18 +152,199 @@ def download(s, post):
     send_response(s, "success")
 
 
+def content_encoding(s, content_type, headers, size=None):
+    """
+    Select the compression of a response and add the headers it requires.
+
+    Note
+    ----
+    Text and JSON responses are compressed with the best encoding the client
+    accepts, unless they are smaller than `MIN_SIZE`. Since their content
+    then depends on the `Accept-Encoding` header of the request, a `Vary`
+    header is added in any case, and entity tags become weak, as the
+    compressed content differs from the original one.
+    """
+    if not compressible(content_type) or "Content-Encoding" in headers:
+        return None
+    if size is not None and size < MIN_SIZE:
+        return None
+    headers["Vary"] = "Accept-Encoding"
+    request = getattr(s, "headers", None) or {}
+    encoding = negotiate(request.get("Accept-Encoding"))
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        if headers.get("ETag", "W/").startswith('"'):
+            headers["ETag"] = "W/" + headers["ETag"]
+    return encoding
+
+
 def send_response(s, content, content_type="text/html",
-                  content_disposition=None, encode=True, status_code=200):
+                  content_disposition=None, encode=True, status_code=200,
+                  headers=None):
     if encode:
         content = bytes(content, "utf-8")
+    headers = dict(headers or {})
+    if status_code == 200:
+        encoding = content_encoding(s, content_type, headers, len(content))
+        if encoding:
+            content = compress(content, encoding)
     s.send_response(status_code)
     s.send_header("Content-type", content_type)
     if content_disposition:
         s.send_header("Content-disposition", content_disposition)
+    for key, value in headers.items():
+        s.send_header(key, value)
     s.end_headers()
     s.wfile.write(content)
 
 
+def send_chunks(s, chunks, content_type="text/plain; charset=utf-8",
+                content_disposition=None, chunk_size=64 * 1024, headers=None):
+    """
+    Send a response of unknown length while its content is produced.
+
+    Note
+    ----
+    Strings or bytes are collected until they reach `chunk_size` bytes and
+    are then written with the chunked transfer encoding of HTTP/1.1. Clients
+    using HTTP/1.0 receive the plain content, ended by closing the
+    connection.
+    Handlers without a request version, as used in the tests, receive the
+    content in one piece. The content is compressed as it is written, if
+    the client accepts it. If the client disconnects, the chunks are no
+    longer produced and False is returned.
+    """
+    version = getattr(s, "request_version", None)
+    if version is None:
+        send_response(
+            s, b"".join(
+                chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+                for chunk in chunks),
+            content_type=content_type, encode=False,
+            content_disposition=content_disposition, headers=headers)
+        return
+    headers = dict(headers or {})
+    encoding = content_encoding(s, content_type, headers)
+    compressor = Compressor(encoding) if encoding else None
+    chunked = version == "HTTP/1.1"
+    if chunked:
+        s.protocol_version = "HTTP/1.1"
+    s.send_response(200)
+    s.send_header("Content-type", content_type)
+    if content_disposition:
+        s.send_header("Content-disposition", content_disposition)
+    for key, value in headers.items():
+        s.send_header(key, value)
+    if chunked:
+        s.send_header("Transfer-Encoding", "chunked")
+    s.send_header("Connection", "close")
+    s.end_headers()
+
+    def write(data):
+        if compressor:
+            data = compressor.compress(data)
+        if not data:
+            return
+        if chunked:
+            s.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        else:
+            s.wfile.write(data)
+
+    buffer, size = [], 0
+    try:
+        for chunk in chunks:
+            data = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+            buffer.append(data)
+            size += len(data)
+            if size >= chunk_size:
+                write(b"".join(buffer))
+                buffer, size = [], 0
+        if buffer:
+            write(b"".join(buffer))
+        if compressor:
+            compressor, data = None, compressor.flush()
+            write(data)
+        if chunked:
+            s.wfile.write(b"0\r\n\r\n")
+    except (BrokenPipeError, ConnectionResetError):
+        # generators release their files when they are closed
+        if hasattr(chunks, "close"):
+            chunks.close()
+        return False
+    return True
+
+
+def validators(key, mtime=None):
+    """
+    Return the headers that let clients revalidate a response.
+
+    Note
+    ----
+    The entity tag is a hash of `key`, which must change whenever the
+    content does. Clients are asked to revalidate their copy on every
+    request, which costs a `304 Not Modified` as long as nothing changed.
+    """
+    headers = {
+        "ETag": '"{0}"'.format(hashlib.sha1(
+            json.dumps(key).encode("utf-8")).hexdigest()[:20]),
+        "Cache-Control": "no-cache"}
+    if mtime is not None:
+        headers["Last-Modified"] = formatdate(mtime, usegmt=True)
+    return headers
+
+
+def file_stamp(path):
+    """
+    Return the time of the last modification and the size of a file.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def not_modified(s, headers, content_type=None, size=None):
+    """
+    Send `304 Not Modified` if the client already holds the content.
+
+    Note
+    ----
+    `If-None-Match` is compared with the entity tag in `headers`, and
+    `If-Modified-Since` with the time of the last modification, if the
+    former is missing. If the content would be sent with the type
+    `content_type` and `size` bytes, or streamed if `size` is None, the
+    response carries the same `Vary` header and entity tag as the content,
+    so that caches pair it with the stored encoding. Returns True if the
+    response was sent.
+    """
+    request = getattr(s, "headers", None) or {}
+    match = request.get("If-None-Match")
+    since = request.get("If-Modified-Since")
+    if match is not None:
+        tags = [tag.strip() for tag in match.split(",")]
+        fresh = "*" in tags or headers["ETag"] in [
+            tag[2:] if tag.startswith("W/") else tag for tag in tags]
+    elif since is not None and "Last-Modified" in headers:
+        try:
+            fresh = parsedate_to_datetime(headers["Last-Modified"]) <= \
+                parsedate_to_datetime(since)
+        except (TypeError, ValueError):
+            fresh = False
+    else:
+        fresh = False
+    if fresh:
+        headers = dict(headers)
+        if content_type is not None:
+            content_encoding(s, content_type, headers, size)
+            headers.pop("Content-Encoding", None)
+        s.send_response(304)
+        for key, value in headers.items():
+            s.send_header(key, value)
+        s.end_headers()
+    return fresh
+
+
 def handle_args(args, query, qtype):
     if qtype == "POST":
         args.update(parse_post(query))
@@ -191,14 +409,16 @@ def configuration():
 
 def get_distinct(what, cursor, name):
     out = [line[0] for line in cursor.execute(
-        'select distinct val from ' + name + ' where col="' + what + '";'
-    )]
+        "select distinct VAL from " + table_name(name) + " where COL = ?;",
+        (what,))]
     return out
 
 
 def get_columns(cursor, name):
+    # columns are ordered by their first appearance, regardless of indexes
     out = [line[0] for line in cursor.execute(
-        'select distinct col from ' + name + ';')]
+        "select COL from " + table_name(name) + " group by COL "
+        "order by min(rowid);")]
     return out
 
 
@@ -213,47 +433,93 @@ def file_name(path):
 def file_handler(s, ft, fn):
     """
     Handle different file types.
+
+    Note
+    ----
+    Files are sent as they are stored, with headers for conditional
+    requests. The files of the application are kept in memory by `STATIC`,
+    together with their compressed variants, and large binary files are
+    copied to the socket with `sendfile`.
     """
     message = b"404 FNF"
     ctype = DATA.get(ft, "text/plain; charset=utf-8")
     status_code = 200
-    if ft in ["js", "html", "css", "csv"]:
-        try:
-            with codecs.open(edictor_path(fn[1:]), "r", "utf-8") as f:
-                message = bytes(f.read(), "utf-8")
-        except FileNotFoundError:
-            message = b"404 FNF"
-            ctype = "text/plain; charset=utf-8"
-            status_code = 404
-            print("Missing static file:", fn)
-    elif ft == "tsv":
+    headers = None
+    if ft == "tsv":
         # if a file is in the same folder where the app was started, it is
         # marked by preceding it with "/data/" by the JS application, so
         # these files must be checked for first, as they are local files.
         if Path(fn[6:]).exists() and fn.startswith("/data/"):
-            with codecs.open(fn[6:], "r", "utf-8") as f:
-                message = bytes(f.read(), "utf-8")
+            path = Path(fn[6:])
         else:
-            if edictor_path(fn[1:]).exists():
-                with codecs.open(edictor_path(fn[1:]), "r", "utf-8") as f:
-                    message = bytes(f.read(), "utf-8")
-            else:
-                message = b"404 FNF"
-                status_code = 404
-                print("Missing TSV file:", fn)
-    elif ft in ["png", "ttf", "jpg", "woff"]:
-        try:
-            with codecs.open(edictor_path(fn[1:]), 'rb', None) as f:
-                message = f.read()
-        except FileNotFoundError:
-            message = b"404 FNF"
+            path = edictor_path(fn[1:])
+    elif ft in ["js", "html", "css", "csv", "png", "ttf", "jpg", "woff"]:
+        path = edictor_path(fn[1:])
+    else:
+        path = None
+    stamp = file_stamp(path) if path else None
+    if path and (stamp is None or path.is_dir()):
+        status_code = 404
+        if ft in ["png", "ttf", "jpg", "woff"]:
             ctype = "application/octet-stream"
-            status_code = 404
             print("Missing binary file:", fn)
-    send_response(s, message, ctype, encode=False, status_code=status_code)
+        else:
+            ctype = "text/plain; charset=utf-8"
+            print("Missing {0} file:".format(
+                "TSV" if ft == "tsv" else "static"), fn)
+    elif path:
+        headers = validators([os.path.abspath(path), stamp], stamp[0] / 1e9)
+        if ft != "tsv":
+            headers["Cache-Control"] = cache_control(fn)
+        if not_modified(
+                s, headers, ctype, None if ft == "tsv" else stamp[1]):
+            return
+        if ft == "tsv":
+            # wordlists are sent from a memory map, compressed on the fly
+            with TsvReader(path) as reader:
+                send_chunks(
+                    s, reader.chunks(), ctype, chunk_size=1024 ** 2,
+                    headers=headers)
+            return
+        elif ft in ["png", "ttf", "jpg", "woff"] and stamp[1] >= SENDFILE_SIZE:
+            s.send_response(200)
+            s.send_header("Content-type", ctype)
+            for key, value in headers.items():
+                s.send_header(key, value)
+            s.send_header("Content-Length", str(stamp[1]))
+            s.end_headers()
+            if not sendfile(s, path, stamp[1]):
+                s.wfile.write(path.read_bytes())
+            return
+        else:
+            encoding = content_encoding(s, ctype, headers, stamp[1])
+            message = STATIC.get(path, stamp, encoding)
+    send_response(
+        s, message, ctype, encode=False, status_code=status_code,
+        headers=headers)
+
+
+BASE_PAGE = {}
 
 
 def serve_base(s, conf):
+    """
+    Serve the start page with the links to the datasets.
+
+    Note
+    ----
+    The page is only rendered again when the index, the links of the
+    configuration, or the names of the files in the current folder change,
+    which is detected by the time of the last modification of the folder.
+    """
+    folder = Path().resolve()
+    key = [
+        file_stamp(edictor_path("index.html")), str(folder),
+        file_stamp(folder), conf["links"]]
+    page = BASE_PAGE.get("page")
+    if page and page[0] == key:
+        send_response(s, page[1], encode=False)
+        return
     with codecs.open(edictor_path("index.html"), "r", "utf-8") as f:
         text = f.read()
     link_template = """<div class="dataset inside" onclick="window.open('{url}');"><span>{name}</span></div>"""
@@ -273,7 +539,115 @@ def serve_base(s, conf):
     text = text.replace(' id="user" style="display:none"', '')
     text = text.replace(' class="user" style="display:none"', '')
 
-    send_response(s, text)
+    BASE_PAGE["page"] = (key, bytes(text, "utf-8"))
+    send_response(s, BASE_PAGE["page"][1], encode=False)
+
+
+def _parse_ids(values):
+    # dammit but, it doesn't really seem to work without explicit
+    # type-checking
+    ids = []
+    for value in values:
+        try:
+            ids += [int(value)]
+        except (TypeError, ValueError):
+            try:
+                ids += [int(x) for x in value.split(' ')]
+            except (AttributeError, ValueError):
+                pass
+    return max(ids, default=0)
+
+
+def _largest_id(db, name, column, since=None):
+    """
+    Find the largest identifier in a column, or among the changes after `since`.
+    """
+    table = table_name(name)
+    if since is None and column == "ID":
+        return max(
+            db.execute("select max(ID) from " + table + ";").fetchone()[0] or 0,
+            db.execute(
+                "select max(ID) from backup where FILE = ?;",
+                (name,)).fetchone()[0] or 0)
+    if since is None:
+        return _parse_ids(x[0] for x in db.execute(
+            "select distinct VAL from " + table + " where COL = ?;", (column,)))
+    if column == "ID":
+        return db.execute(
+            "select max(ID) from changes where FILE = ? and SEQ > ?;",
+            (name, since)).fetchone()[0] or 0
+    return _parse_ids(x[0] for x in db.execute(
+        "select distinct t.VAL from changes as c join " + table + " as t "
+        "on t.ID = c.ID and t.COL = c.COL "
+        "where c.FILE = ? and c.SEQ > ? and c.COL = ?;",
+        (name, since, column)))
+
+
+ID_COUNTERS = {}
+_ID_LOCK = threading.Lock()
+
+
+def _snapshot_version(db, name):
+    """
+    Return the number of modifications counted for a wordlist, if any.
+    """
+    if not has_table(db, "snapshots"):
+        return None
+    row = db.execute(
+        "select VERSION from snapshots where FILE = ?;", (name,)).fetchone()
+    return row[0] if row else None
+
+
+def _logged_changes(db, name, since):
+    """
+    Count the cells of a wordlist logged as changed after `since`.
+    """
+    return db.execute(
+        "select count(*) from changes where FILE = ? and SEQ > ?;",
+        (name, since)).fetchone()[0]
+
+
+def allocate_id(db, path, name, column="ID"):
+    """
+    Reserve a new identifier for the rows (ID) or another column of a wordlist.
+
+    Note
+    ----
+    The largest identifier is computed once per database, wordlist, and
+    column, and kept in memory together with the sequence number of the
+    change log and the number of modifications counted for the snapshot of
+    the wordlist at that moment. Later requests only check the changes
+    logged since then, and the largest row identifier, which is found in
+    the index of the table. The triggers of the snapshot count each cell
+    that is written, so if they counted more cells than the change log holds
+    for the same requests, the wordlist was modified by another program, and
+    identifiers of other columns are computed again. Databases without a change log are checked in full
+    on every request. Every identifier is handed out only once, even if
+    two windows ask for one at the same time.
+    """
+    key = (str(path), name, column)
+    with _ID_LOCK:
+        head = change_head(db)
+        version = _snapshot_version(db, name)
+        cached = ID_COUNTERS.get(key)
+        if cached is None or head is None:
+            largest = _largest_id(db, name, column)
+        else:
+            largest, seq, seen = cached
+            if head > seq:
+                largest = max(largest, _largest_id(db, name, column, since=seq))
+            if column == "ID":
+                largest = max(largest, db.execute(
+                    "select coalesce(max(ID), 0) from " + table_name(name) +
+                    ";").fetchone()[0])
+            elif version != seen and (
+                    version is None or seen is None or
+                    version - seen > _logged_changes(db, name, seq)):
+                largest = max(largest, _largest_id(db, name, column))
+        if cached is not None:
+            largest = max(largest, cached[0])
+        ID_COUNTERS[key] = (largest + 1, head, version)
+        return largest + 1
 
 
 # noinspection SqlDialectInspection,SqlResolve
@@ -305,109 +679,252 @@ def new_id(s, query, qtype, conf):
         )
         return
 
-    db, cursor = opendb(args["remote_dbase"], conf)
+    path = database_path(args["remote_dbase"], conf)
+    with get_pool(path).connection() as db:
+        message = str(allocate_id(
+            db, path, args["file"],
+            "ID" if args["new_id"] == "true" else args["new_id"]))
+    send_response(s, message)
 
-    if args['new_id'] == "true":
-        cursor.execute('select DISTINCT ID from ' + args['file'] + ';')
-        linesA = [x[0] for x in cursor.fetchall()]
-        # noinspection SqlNoDataSourceInspection
-        cursor.execute(
-            'select DISTINCT ID from backup where FILE = "' + args['file'] + '";'
-        )
-        linesB = [x[0] for x in cursor.fetchall()]
-        try:
-            maxA = max(linesA)
-        except ValueError:
-            maxA = 0
-        try:
-            maxB = max(linesB)
-        except ValueError:
-            maxB = 0
 
-        if maxA >= maxB:
-            message = str(maxA + 1)
-        else:
-            message = str(maxB + 1)
-    else:
-        lines = [x[0] for x in cursor.execute('select DISTINCT VAL from ' + args['file'] +
-                                              ' where COL="' + args['new_id'] + '";')]
-        # dammit but, it doesn't really seem to work without explicit
-        # type-checking
-        cogids = []
-        for line in lines:
-            try:
-                cogids += [int(line)]
-            except ValueError:
-                try:
-                    cogids += [int(x) for x in line.split(' ')]
-                except ValueError:
-                    pass
-        message = str(max(cogids) + 1)
-    send_response(s, message)
+def _no_progress(stage, done=0, total=0):
+    return
 
 
-def cognates(s, query, qtype):
-    args = {
-        "wordlist": "",
-        "mode": "full",
-        "method": "lexstat"
-    }
-    handle_args(args, query, qtype)
-    args["wordlist"] = urllib.parse.unquote_plus(args["wordlist"])
+def lexstat_scorer(lex, args, partial=False):
+    """
+    Compute the LexStat scorer of a wordlist or reuse it from the cache.
+    """
+    params = {"runs": int(args.get("runs") or 1000)}
+    kind = "partial" if partial else "lexstat"
+    if SCORERS.load(lex, params, kind=kind):
+        return
+    if partial:
+        lex.get_partial_scorer(**params)
+    else:
+        lex.get_scorer(**params)
+    SCORERS.store(lex, params, kind=kind)
 
-    # assemble the wordlist header
-    from lingpy.compare.partial import Partial
-    from lingpy.compare.lexstat import LexStat
-    from lingpy import basictypes
+
+def _cognate_wordlist(rows):
     tmp = {0: ["doculect", "concept", "form", "tokens"]}
-    for row in args["wordlist"].split("\n")[:-1]:
-        idx, doculect, concept, tokens = row.split('\t')
+    for idx, doculect, concept, tokens in rows:
         tmp[int(idx)] = [
             doculect,
             concept,
             tokens,
             tokens.split(" ")
         ]
-    out = ""
+    return tmp
+
+
+def _cluster_cognates(tmp, args, progress=_no_progress):
+    """
+    Cluster the words of a LingPy wordlist into cognate sets.
+    """
+    from lingpy.compare.partial import Partial
+    from lingpy.compare.lexstat import LexStat
+
+    method = "lexstat" if args["method"] == "lexstat" else "sca"
+    threshold = 0.55 if method == "lexstat" else 0.45
+    workers = get_workers(args.get("workers"))
+    if workers > 1 and method == "sca":
+        return _parallel_cognates(tmp, args, workers, progress=progress)
     if args["mode"] == "partial":
         part = Partial(tmp)
+        if method == "lexstat":
+            progress("scorer")
+            lexstat_scorer(part, args, partial=True)
+        progress("clustering")
         part.partial_cluster(
-            method="sca", threshold=0.45, ref="cogid",
-            cluster_method="upgma")
-        for idx in part:
-            out += str(idx) + "\t" + str(basictypes.ints(part[idx, "cogid"])) + "\n"
-    else:
-        lex = LexStat(tmp)
-        lex.cluster(
-            method="sca", threshold=0.45, ref="cogid",
+            method=method, threshold=threshold, ref="cogid",
             cluster_method="upgma")
-        for idx in lex:
-            out += str(idx) + "\t" + str(lex[idx, "cogid"]) + "\n"
+        return _renumber(
+            {idx: [int(cogid) for cogid in part[idx, "cogid"]] for idx in part},
+            list(tmp)[1:])
+    lex = LexStat(tmp)
+    if method == "lexstat":
+        progress("scorer")
+        lexstat_scorer(lex, args)
+    progress("clustering")
+    lex.cluster(
+        method=method, threshold=threshold, ref="cogid",
+        cluster_method="upgma")
+    return _renumber({idx: lex[idx, "cogid"] for idx in lex}, list(tmp)[1:])
 
-    send_response(
-        s,
-        out,
-        content_type="text/plain; charset=utf-8",
-        content_disposition='attachment; filename="triples.tsv"'
-    )
 
+def _renumber(cogids, order):
+    """
+    Number cognate sets from 1 in the order in which they first occur.
 
-def patterns(s, query, qtype):
+    Note
+    ----
+    LingPy numbers cognate sets in the order in which it clusters them, which
+    differs when the concepts are clustered in separate processes, so all
+    results are numbered again in the order of the rows of the wordlist.
     """
-    Compute correspondence patterns with CoPaR (LingRex)
+    numbers = {}
+    out = {}
+    for idx in order:
+        cogid = cogids[idx]
+        if isinstance(cogid, list):
+            out[idx] = [numbers.setdefault(c, len(numbers) + 1) for c in cogid]
+        else:
+            out[idx] = numbers.setdefault(cogid, len(numbers) + 1)
+    return out
+
+
+def _cluster_shard(part):
+    rows, args = part
+    return _cluster_cognates(_cognate_wordlist(rows), args)
+
+
+def _parallel_cognates(tmp, args, workers, progress=_no_progress):
+    """
+    Cluster the concepts of a wordlist in a pool of processes.
+
+    Note
+    ----
+    Concepts are independent of each other with the SCA method, so they are
+    sharded across the processes, weighted by the number of word pairs they
+    contain. The cognate sets of all shards are then numbered in the order in
+    which they first occur in the wordlist, as those of a single process, so
+    that identifiers are unique and do not depend on the number of processes.
+    """
+    concepts = {}
+    for idx, (doculect, concept, form, _tokens) in list(tmp.items())[1:]:
+        concepts.setdefault(concept, []).append((idx, doculect, concept, form))
+    parts = shard(
+            list(concepts.values()), workers, weight=lambda rows: len(rows) ** 2)
+    shard_args = {"mode": args["mode"], "method": "sca", "workers": "1"}
+    progress("clustering", 0, len(parts))
+    results = process_map(
+            _cluster_shard,
+            [([row for rows in part for row in rows], shard_args) for part in parts],
+            workers)
+    progress("merging", len(parts), len(parts))
+
+    # identifiers are only unique within their shard
+    cogids = {}
+    for i, result in enumerate(results):
+        for idx, cogid in result.items():
+            cogids[idx] = [(i, c) for c in cogid] \
+                if isinstance(cogid, list) else (i, cogid)
+    return _renumber(cogids, list(tmp)[1:])
+
+
+def _format_cognates(cogids):
+    out = ""
+    for idx, cogid in cogids.items():
+        if isinstance(cogid, list):
+            out += str(idx) + "\t" + " ".join(str(c) for c in cogid) + "\n"
+        else:
+            out += str(idx) + "\t" + str(cogid) + "\n"
+    return out
+
+
+def _cognates(args, progress=_no_progress):
+    """
+    Compute cognate sets for a wordlist passed by the application.
     """
+    if args.get("incremental") == "true" and args["method"] != "lexstat":
+        return _incremental_cognates(args, progress=progress)
+    progress("loading")
+    rows = [row.split("\t") for row in args["wordlist"].split("\n")[:-1]]
+    return _format_cognates(
+            _cluster_cognates(_cognate_wordlist(rows), args, progress=progress))
+
+
+COGNATE_STATE = OrderedDict()
+COGNATE_SESSIONS = 16
+_COGNATE_LOCKS = {}
+
+
+def _incremental_cognates(args, progress=_no_progress):
+    """
+    Recluster only the concepts whose rows changed since the last request.
+
+    Note
+    ----
+    The clustering of each concept is kept per session (passed as `session`,
+    for example the name of the dataset), mode, and method. Concepts with
+    unchanged rows keep their cognate sets, changed concepts are clustered
+    anew and receive identifiers above all identifiers handed out so far in
+    the session, including those of concepts missing from the request, and
+    only the rows of the changed concepts are returned. Since the LexStat scorer
+    depends on all concepts, the `lexstat` method always runs on the full
+    wordlist.
+    """
+    progress("loading")
+    concepts = {}
+    for row in args["wordlist"].split("\n")[:-1]:
+        cells = row.split("\t")
+        concepts.setdefault(cells[2], []).append(cells)
+    digests = {
+        concept: hashlib.sha1("\n".join(
+            sorted("\t".join(cells) for cells in rows)).encode("utf-8")
+            ).hexdigest()
+        for concept, rows in concepts.items()}
+
+    key = (args.get("session", ""), args["mode"], args["method"])
+    with _COGNATE_LOCKS.setdefault(key, threading.Lock()):
+        highest, state = COGNATE_STATE.get(key, (0, {}))
+        state = {
+            concept: value for concept, value in state.items()
+            if digests.get(concept) == value[0]}
+        changed = [concept for concept in concepts if concept not in state]
+        cogids = {}
+        if changed:
+            offset = max(
+                [highest] +
+                [max(cogid) if isinstance(cogid, list) else cogid
+                 for _, clusters in state.values()
+                 for cogid in clusters.values() if cogid])
+            clustered = _cluster_cognates(
+                _cognate_wordlist(
+                    [cells for concept in changed for cells in concepts[concept]]),
+                args, progress=progress)
+            for idx, cogid in clustered.items():
+                if isinstance(cogid, list):
+                    cogids[idx] = [c + offset for c in cogid]
+                else:
+                    cogids[idx] = cogid + offset
+            for concept in changed:
+                state[concept] = (digests[concept], {
+                    int(cells[0]): cogids[int(cells[0])]
+                    for cells in concepts[concept]})
+            highest = max(
+                [offset] +
+                [max(cogid) if isinstance(cogid, list) else cogid
+                 for cogid in cogids.values() if cogid])
+        COGNATE_STATE[key] = (highest, state)
+        COGNATE_STATE.move_to_end(key)
+        while len(COGNATE_STATE) > COGNATE_SESSIONS:
+            _COGNATE_LOCKS.pop(COGNATE_STATE.popitem(last=False)[0], None)
+    return _format_cognates(cogids)
+
+
+def cognates(s, query, qtype):
     args = {
         "wordlist": "",
         "mode": "full",
-        "method": "copar",
-        "minrefs": 2
+        "method": "sca",
+        "workers": "1"
     }
     handle_args(args, query, qtype)
     args["wordlist"] = urllib.parse.unquote_plus(args["wordlist"])
+    run_analysis(s, "cognates", args)
 
-    # assemble the wordlist header
+
+def _patterns(args, progress=_no_progress):
+    """
+    Compute correspondence patterns with CoPaR (LingRex)
+    """
     import lingpy
     from lingrex.copar import CoPaR
+
+    progress("loading")
+    # assemble the wordlist header
     if args["mode"] == "partial":
         ref = "cogids"
     else:
@@ -432,81 +949,155 @@ def patterns(s, query, qtype):
         minrefs=args["minrefs"]
     )
     print("Loaded the CoPaR object.")
+    progress("sites")
     cop.get_sites()
     print("Loaded the Sites.")
+    progress("clustering")
     cop.cluster_sites()
     print("Clustered Sites.")
+    progress("patterns")
     cop.sites_to_pattern()
     print("Converted Sites to Patterns.")
     cop.add_patterns()
     out = ""
     for idx in cop:
         out += str(idx) + "\t" + " ".join(cop[idx, "patterns"]) + "\n"
-    send_response(
-        s,
-        out,
-        content_type="text/plain; charset=utf-8",
-        content_disposition='attachment; filename="triples.tsv"'
-    )
     print("Successfully computed correspondence patterns.")
+    return out
 
 
-def alignments(s, query, qtype):
+def patterns(s, query, qtype):
+    """
+    Compute correspondence patterns with CoPaR (LingRex)
+    """
     args = {
         "wordlist": "",
         "mode": "full",
-        "method": "library"
+        "method": "copar",
+        "minrefs": 2
     }
     handle_args(args, query, qtype)
     args["wordlist"] = urllib.parse.unquote_plus(args["wordlist"])
-    method = (args.get("method") or "library").strip().lower()
+    run_analysis(s, "patterns", args)
 
-    print("Carrying out alignments with LingPy")
-    if method in {"sw", "nw"}:
-        if args["mode"] != "full":
-            send_response(
-                s,
-                "Unsupported alignment method for partial mode.",
-                content_type="text/plain; charset=utf-8",
-                status_code=400,
-            )
-            return
-        out = _pairwise_alignments(args["wordlist"], method)
-        send_response(
-            s,
-            out,
-            content_type="text/plain; charset=utf-8",
-            content_disposition='attachment; filename="triples.tsv"'
-        )
-        return
-    # assemble the wordlist header
+
+def _alignment_wordlist(rows, mode):
     import lingpy
-    ref = "cogid" if args["mode"] == "full" else "cogids"
+
+    ref = "cogid" if mode == "full" else "cogids"
     tmp = {0: ["doculect", "concept", "form", "tokens", ref]}
-    for row in args["wordlist"].split("\n")[:-1]:
-        idx, doculect, concept, tokens, cogid = row.split('\t')
+    for idx, doculect, concept, tokens, cogid in rows:
         tmp[int(idx)] = [
             doculect,
             concept,
             tokens,
             tokens.split(" "),
-            lingpy.basictypes.ints(cogid) if args["mode"] == "partial" else cogid
+            lingpy.basictypes.ints(cogid) if mode == "partial" else cogid
         ]
+    return tmp, ref
+
+
+def _align_wordlist(part):
+    """
+    Align the cognate sets of (a part of) a wordlist with LingPy.
+    """
+    import lingpy
+
+    rows, mode, method = part
+    tmp, ref = _alignment_wordlist(rows, mode)
     alms = lingpy.Alignments(tmp, ref=ref, transcription="form",
-                             fuzzy=True if args["mode"] == "partial" else False)
+                             fuzzy=True if mode == "partial" else False)
+    alms.align(method=method)
+    return {idx: " ".join(alms[idx, "alignment"]) for idx in alms}
+
+
+def _alignment_groups(rows, mode):
+    """
+    Group the rows that are linked by their cognate identifiers.
+
+    Note
+    ----
+    In partial mode, a word belongs to several cognate sets, so all sets
+    sharing a word end up in the same group.
+    """
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    keys = []
+    for row in rows:
+        cogids = row[4].split() if mode == "partial" else [row[4]]
+        cogids = cogids or ["row-" + row[0]]
+        for cogid in cogids[1:]:
+            parent[find(cogid)] = find(cogids[0])
+        keys.append(cogids[0])
+    groups = {}
+    for key, row in zip(keys, rows):
+        groups.setdefault(find(key), []).append(row)
+    return list(groups.values())
+
+
+def _alignments(args, progress=_no_progress):
+    """
+    Align the cognate sets of a wordlist passed by the application.
+    """
+    method = (args.get("method") or "library").strip().lower()
+    workers = get_workers(args.get("workers"))
+
+    print("Carrying out alignments with LingPy")
+    if method in {"sw", "nw"}:
+        if args["mode"] != "full":
+            raise ValueError("Unsupported alignment method for partial mode.")
+        return _pairwise_alignments(
+                args["wordlist"], method, progress=progress, workers=workers)
+
+    progress("loading")
+    rows = [row.split("\t") for row in args["wordlist"].split("\n")[:-1]]
     if method not in {"progressive", "library"}:
         method = "library"
+    if workers > 1:
+        parts = shard(
+                _alignment_groups(rows, args["mode"]), workers,
+                weight=lambda group: sum(len(row[3]) for row in group) ** 2)
+        progress("aligning", 0, len(parts))
+        aligned = {}
+        for result in process_map(
+                _align_wordlist,
+                [([row for group in part for row in group], args["mode"], method)
+                 for part in parts],
+                workers):
+            aligned.update(result)
+        return "".join(
+            str(idx) + "\t" + aligned[idx] + "\n" for idx in sorted(aligned))
+
+    # assemble the wordlist header
+    import lingpy
+
+    tmp, ref = _alignment_wordlist(rows, args["mode"])
+    alms = lingpy.Alignments(tmp, ref=ref, transcription="form",
+                             fuzzy=True if args["mode"] == "partial" else False)
+    progress("aligning")
     alms.align(method=method)
     out = ""
     for idx in alms:
         out += str(idx) + "\t" + " ".join(alms[idx, "alignment"]) + "\n"
+    return out
 
-    send_response(
-        s,
-        out,
-        content_type="text/plain; charset=utf-8",
-        content_disposition='attachment; filename="triples.tsv"'
-    )
+
+def alignments(s, query, qtype):
+    args = {
+        "wordlist": "",
+        "mode": "full",
+        "method": "library",
+        "workers": "1"
+    }
+    handle_args(args, query, qtype)
+    args["wordlist"] = urllib.parse.unquote_plus(args["wordlist"])
+    run_analysis(s, "alignments", args)
 
 
 def _pairwise_multi_align(seqs, aligner):
@@ -579,7 +1170,7 @@ def _pairwise_multi_align(seqs, aligner):
     return out
 
 
-def _pairwise_alignments(wordlist, method):
+def _pairwise_aligner(method):
     from lingpy.align import pairwise as lp_pairwise
 
     if method == "sw":
@@ -590,8 +1181,23 @@ def _pairwise_alignments(wordlist, method):
             fullA = preA + (["-"] * (pre_len - len(preA))) + almA + sufA + (["-"] * (suf_len - len(sufA)))
             fullB = preB + (["-"] * (pre_len - len(preB))) + almB + sufB + (["-"] * (suf_len - len(sufB)))
             return fullA, fullB, _score
-    else:
-        aligner = lp_pairwise.nw_align
+        return aligner
+    return lp_pairwise.nw_align
+
+
+def _pairwise_groups(part):
+    method, groups = part
+    aligner = _pairwise_aligner(method)
+    aligned = {}
+    for entries in groups:
+        seqs = [tokens for _, tokens in entries]
+        alms = _pairwise_multi_align(seqs, aligner)
+        for (idx, _tokens), alm in zip(entries, alms):
+            aligned[idx] = " ".join(alm)
+    return aligned
+
+
+def _pairwise_alignments(wordlist, method, progress=_no_progress, workers=1):
     rows = []
     for row in wordlist.split("\n")[:-1]:
         idx, doculect, concept, tokens, cogid = row.split("\t")
@@ -604,11 +1210,18 @@ def _pairwise_alignments(wordlist, method):
         groups.setdefault(cogid, []).append((idx, tokens))
 
     aligned = {}
-    for cogid, entries in groups.items():
-        seqs = [tokens for _, tokens in entries]
-        alms = _pairwise_multi_align(seqs, aligner)
-        for (idx, _tokens), alm in zip(entries, alms):
-            aligned[idx] = " ".join(alm)
+    if workers > 1:
+        parts = shard(
+                list(groups.values()), workers,
+                weight=lambda entries: sum(len(t) for _, t in entries) ** 2)
+        progress("aligning", 0, len(parts))
+        for result in process_map(
+                _pairwise_groups, [(method, part) for part in parts], workers):
+            aligned.update(result)
+    else:
+        for i, entries in enumerate(groups.values()):
+            progress("aligning", i, len(groups))
+            aligned.update(_pairwise_groups((method, [entries])))
 
     out = ""
     for idx in sorted(aligned.keys()):
@@ -616,23 +1229,12 @@ def _pairwise_alignments(wordlist, method):
     return out
 
 
-def distances(s, query, qtype):
-    args = {
-        "wordlist": "",
-        "method": "edit-dist",
-        "mode": "overlap",
-        "tree": "neighbor"
-    }
-    handle_args(args, query, qtype)
-    args["wordlist"] = urllib.parse.unquote_plus(args["wordlist"])
-
+def _distances(args, progress=_no_progress):
+    """
+    Compute distances and a tree for the languages of a wordlist.
+    """
     if not args["wordlist"].strip():
-        send_response(
-            s,
-            json.dumps({"error": "Missing wordlist."}),
-            content_type="application/json; charset=utf-8",
-        )
-        return
+        return json.dumps({"error": "Missing wordlist."})
 
     allowed_methods = {"edit-dist", "turchin", "sca", "lexstat"}
     allowed_modes = {"overlap", "global", "local", "dialign"}
@@ -659,14 +1261,14 @@ def distances(s, query, qtype):
             tokens.split(" ")
         ]
 
+    progress("loading")
     lex = LexStat(tmp)
     if len(lex.taxa) < 2:
-        send_response(
-            s,
-            json.dumps({"error": "Need at least two taxa to compute distances."}),
-            content_type="application/json; charset=utf-8",
-        )
-        return
+        return json.dumps({"error": "Need at least two taxa to compute distances."})
+    if args["method"] == "lexstat":
+        progress("scorer")
+        lexstat_scorer(lex, args)
+    progress("distances")
     try:
         from lingpy import util as lingpy_util
         from lingpy.algorithm.cython import _misc as misc
@@ -688,19 +1290,9 @@ def distances(s, query, qtype):
                 empty_pairs += 1
         D = misc.squareform(dist_list)
     except ZeroDivisionError:
-        send_response(
-            s,
-            json.dumps({"error": "No overlapping concepts between taxa; distance undefined. Please check filters or data coverage."}),
-            content_type="application/json; charset=utf-8",
-        )
-        return
+        return json.dumps({"error": "No overlapping concepts between taxa; distance undefined. Please check filters or data coverage."})
     except Exception as exc:
-        send_response(
-            s,
-            json.dumps({"error": "Distance computation failed.", "detail": str(exc)}),
-            content_type="application/json; charset=utf-8",
-        )
-        return
+        return json.dumps({"error": "Distance computation failed.", "detail": str(exc)})
     taxa = lex.taxa
     def _sanitize_taxa(names):
         forbidden = set("():;,")
@@ -723,6 +1315,7 @@ def distances(s, query, qtype):
     ascii_tree = ""
     taxa_map = {}
     if args["tree"] in {"neighbor", "upgma"}:
+        progress("tree")
         safe_taxa, taxa_map = _sanitize_taxa(taxa)
         try:
             if args["tree"] == "neighbor":
@@ -730,36 +1323,185 @@ def distances(s, query, qtype):
             elif args["tree"] == "upgma":
                 newick = upgma(D, safe_taxa)
         except ValueError as exc:
-            send_response(
-                s,
-                json.dumps({"error": str(exc)}),
-                content_type="application/json; charset=utf-8",
-            )
-            return
+            return json.dumps({"error": str(exc)})
+
+    if newick:
+        ascii_tree = Tree(newick).asciiArt()
+
+    matrix = D.tolist() if hasattr(D, "tolist") else D
+    payload = {
+        "taxa": taxa,
+        "matrix": matrix,
+        "phylip": dst,
+        "tree": newick,
+        "ascii": ascii_tree,
+        "method": args["method"],
+        "mode": args["mode"],
+        "tree_method": args["tree"],
+        "taxa_map": taxa_map,
+        "empty_pairs": empty_pairs
+    }
+    return json.dumps(payload)
+
+
+def distances(s, query, qtype):
+    args = {
+        "wordlist": "",
+        "method": "edit-dist",
+        "mode": "overlap",
+        "tree": "neighbor"
+    }
+    handle_args(args, query, qtype)
+    args["wordlist"] = urllib.parse.unquote_plus(args["wordlist"])
+    run_analysis(s, "distances", args)
+
+
+ANALYSES = {
+    "cognates": (_cognates, "text/plain; charset=utf-8"),
+    "alignments": (_alignments, "text/plain; charset=utf-8"),
+    "patterns": (_patterns, "text/plain; charset=utf-8"),
+    "distances": (_distances, "application/json; charset=utf-8"),
+}
+
+
+def send_result(s, content, content_type):
+    if content_type.startswith("text/plain"):
+        send_response(
+            s,
+            content,
+            content_type=content_type,
+            content_disposition='attachment; filename="triples.tsv"'
+        )
+    else:
+        send_response(s, content, content_type=content_type)
+
+
+def cached_analysis(name, args, progress=_no_progress):
+    """
+    Look up the result of an analysis in the cache before computing it.
+    """
+    func = ANALYSES[name][0]
+    if args.get("cache") in ("false", "0") or args.get("incremental") == "true":
+        return func(args, progress=progress)
+    key = result_key(name, args)
+    content = RESULTS.get(key)
+    if content is None:
+        content = func(args, progress=progress)
+        RESULTS.put(key, content)
+    else:
+        progress("cached")
+    return content
+
+
+def run_analysis(s, name, args):
+    """
+    Run an analysis in the request or submit it as a background job.
+
+    Note
+    ----
+    If the request passes `job=true`, the analysis is queued and the
+    response only contains the job information as JSON, including the `id`
+    with which the application can poll `/jobs/status.py` and fetch the
+    triples from `/jobs/result.py`.
+    """
+    content_type = ANALYSES[name][1]
+    if args.get("job") in ("true", "1"):
+        job = JOBS.submit(
+                name, functools.partial(cached_analysis, name), args,
+                content_type)
+        send_response(
+            s,
+            json.dumps(job.info()),
+            content_type="application/json; charset=utf-8",
+        )
+        return
+    try:
+        content = cached_analysis(name, args)
+    except ValueError as exc:
+        send_response(
+            s,
+            str(exc),
+            content_type="text/plain; charset=utf-8",
+            status_code=400,
+        )
+        return
+    send_result(s, content, content_type)
+
+
+def cache_stats(s, query, qtype):
+    """
+    Report the counters and the size of the result cache.
+    """
+    args = {"clear": ""}
+    handle_args(args, query, qtype)
+    if args["clear"] == "true":
+        RESULTS.clear()
+    send_response(
+        s,
+        json.dumps(RESULTS.stats()),
+        content_type="application/json; charset=utf-8",
+    )
 
-    if newick:
-        ascii_tree = Tree(newick).asciiArt()
 
-    matrix = D.tolist() if hasattr(D, "tolist") else D
-    payload = {
-        "taxa": taxa,
-        "matrix": matrix,
-        "phylip": dst,
-        "tree": newick,
-        "ascii": ascii_tree,
-        "method": args["method"],
-        "mode": args["mode"],
-        "tree_method": args["tree"],
-        "taxa_map": taxa_map,
-        "empty_pairs": empty_pairs
-    }
+def _get_job(s, query, qtype):
+    args = {"id": ""}
+    handle_args(args, query, qtype)
+    job = JOBS.get(args["id"])
+    if job is None:
+        send_response(
+            s,
+            json.dumps({"error": "Unknown job.", "id": args["id"]}),
+            content_type="application/json; charset=utf-8",
+            status_code=404,
+        )
+    return job
+
+
+def job_status(s, query, qtype):
+    """
+    Report status and progress of a background job.
+    """
+    job = _get_job(s, query, qtype)
+    if job is not None:
+        send_response(
+            s,
+            json.dumps(job.info()),
+            content_type="application/json; charset=utf-8",
+        )
+
+
+def job_result(s, query, qtype):
+    """
+    Return the result of a finished background job.
+    """
+    job = _get_job(s, query, qtype)
+    if job is None:
+        return
+    if job.status == "done":
+        send_result(s, job.result, job.content_type)
+        return
     send_response(
         s,
-        json.dumps(payload),
+        json.dumps(job.info()),
         content_type="application/json; charset=utf-8",
+        status_code=500 if job.status == "failed" else 409,
     )
 
 
+def job_cancel(s, query, qtype):
+    """
+    Cancel a queued or running background job.
+    """
+    job = _get_job(s, query, qtype)
+    if job is not None:
+        job.cancel()
+        send_response(
+            s,
+            json.dumps(job.info()),
+            content_type="application/json; charset=utf-8",
+        )
+
+
 def feature_pipeline(s, query, qtype):
     args = {
         "action": "",
@@ -1296,26 +2038,64 @@ def semantic_batch(s, query, qtype):
 
 
 def _read_tsv_header(path):
-    with codecs.open(path, "r", "utf-8") as f:
-        line = f.readline()
-    if not line:
-        return []
-    return line.rstrip("\n\r").split("\t")
+    with TsvReader(path) as reader:
+        return reader.header()
+
+
+def _tsv_filters(payload):
+    """
+    Collect the filters of a request to server_page or server_export.
+
+    Note
+    ----
+    Doculects and concepts are given as lists, and values of other columns
+    in the mapping `filters`. Values are compared in lower case.
+    """
+    filters = dict(payload.get("filters") or {})
+    filters["DOCULECT"] = payload.get("doculects", [])
+    filters["CONCEPT"] = payload.get("concepts", [])
+    filters = {
+        str(column).upper(): sorted({str(v).lower() for v in values if v})
+        for column, values in filters.items() if isinstance(values, list)}
+    return {column: values for column, values in filters.items() if values}
 
 
-def _iter_tsv_rows(path, header_len):
-    with codecs.open(path, "r", "utf-8") as f:
-        _ = f.readline()
-        for line in f:
-            cells = line.rstrip("\n\r").split("\t")
-            if len(cells) < header_len:
-                cells += [""] * (header_len - len(cells))
-            elif len(cells) > header_len:
-                cells = cells[:header_len]
-            yield cells
+def _tsv_sort(payload):
+    """
+    Collect the columns by which a request sorts the rows of a TSV file.
+
+    Note
+    ----
+    Columns are given as a list `sort` of names, and a name starting with a
+    minus sorts in descending order, as in `["CONCEPT", "-COGID"]`.
+    """
+    sort = []
+    for name in payload.get("sort") or []:
+        name = str(name).strip()
+        if name.lstrip("-"):
+            sort.append([name.lstrip("-").upper(), name.startswith("-")])
+    return sort
 
 
-def server_page(s, query, qtype):
+def _matching_rows(index, header, filters, conf=None, sort=None):
+    """
+    Return the numbers of the rows of a TSV file that match all filters,
+    in the order of the file or in the order given by `sort`.
+    """
+    if not filters:
+        return index.order(header, sort).numbers if sort else range(len(index))
+    extra = (conf or {}).get("index_columns") or []
+    numbers = index.matches(
+        json.dumps(filters, sort_keys=True),
+        lambda: index.values.find(header, filters, extra))
+    if not sort:
+        return numbers
+    return index.matches(
+        json.dumps([filters, sort], sort_keys=True),
+        lambda: index.order(header, sort).arrange(numbers))
+
+
+def server_page(s, query, qtype, conf=None):
     """
     Stream a page of rows from a TSV without loading everything into memory.
     """
@@ -1361,7 +2141,7 @@ def server_page(s, query, qtype):
         return
 
     limit = int(payload.get("limit", 50) or 50)
-    offset = int(payload.get("offset", 0) or 0)
+    offset = max(0, int(payload.get("offset", 0) or 0))
     columns = payload.get("columns") or []
     columns = [c.strip() for c in columns if c and str(c).strip()]
     column_map = {name.upper(): idx for idx, name in enumerate(header)}
@@ -1369,29 +2149,17 @@ def server_page(s, query, qtype):
     col_indices = [idx for idx in col_indices if idx is not None]
 
     # simple filters: doculects, concepts; match case-insensitively
-    doculects = set([d.lower() for d in payload.get("doculects", []) if d])
-    concepts = set([c.lower() for c in payload.get("concepts", []) if c])
-
-    def match(row):
-        if doculects:
-            tidx = column_map.get("DOCULECT")
-            if tidx is None or row[tidx].lower() not in doculects:
-                return False
-        if concepts:
-            cidx = column_map.get("CONCEPT")
-            if cidx is None or row[cidx].lower() not in concepts:
-                return False
-        return True
-
-    total = 0
-    rows = []
+    filters = _tsv_filters(payload)
+    sort = _tsv_sort(payload)
+
+    # rows are located with the line index of the file, the rows that match
+    # a filter are looked up in its inverted index, and sorted rows in the
+    # sort index of the columns
     try:
-        for cells in _iter_tsv_rows(path, len(header)):
-            if not match(cells):
-                continue
-            if total >= offset and len(rows) < limit:
-                rows.append([cells[i] for i in col_indices])
-            total += 1
+        index = line_index(path)
+        numbers = _matching_rows(index, header, filters, conf, sort)
+        total = len(numbers)
+        rows = list(index.rows(numbers[offset:offset + limit], col_indices))
     except Exception as exc:
         send_response(
             s,
@@ -1406,6 +2174,7 @@ def server_page(s, query, qtype):
         "total": total,
         "offset": offset,
         "limit": limit,
+        "sort": sort,
         "file": str(path),
     }
     send_response(
@@ -1415,7 +2184,7 @@ def server_page(s, query, qtype):
     )
 
 
-def server_export(s, query, qtype):
+def server_export(s, query, qtype, conf=None):
     """
     Export filtered TSV (server-side) without loading in front-end.
     Supports optional offset/limit to export only a slice of rows.
@@ -1467,41 +2236,22 @@ def server_export(s, query, qtype):
     col_indices = [column_map.get(c.upper()) for c in columns] if columns else list(range(len(header)))
     col_indices = [idx for idx in col_indices if idx is not None]
 
-    doculects = set([d.lower() for d in payload.get("doculects", []) if d])
-    concepts = set([c.lower() for c in payload.get("concepts", []) if c])
+    filters = _tsv_filters(payload)
+    sort = _tsv_sort(payload)
 
-    offset = int(payload.get("offset", 0) or 0)
+    offset = max(0, int(payload.get("offset", 0) or 0))
     export_limit = payload.get("export_limit", None)
     if export_limit is None:
         export_limit = payload.get("limit", None)
-    export_limit = int(export_limit) if export_limit not in (None, "", False) else None
-
-    def match(row):
-        if doculects:
-            tidx = column_map.get("DOCULECT")
-            if tidx is None or row[tidx].lower() not in doculects:
-                return False
-        if concepts:
-            cidx = column_map.get("CONCEPT")
-            if cidx is None or row[cidx].lower() not in concepts:
-                return False
-        return True
+    export_limit = max(0, int(export_limit)) if export_limit not in (None, "", False) else None
 
-    lines = []
-    header_out = [header[i] for i in col_indices]
-    lines.append("\t".join(header_out))
-    matched = 0
+    # rows are streamed from the memory map as they are read, the numbers
+    # of the rows are looked up first, so that errors are still reported
     try:
-        for cells in _iter_tsv_rows(path, len(header)):
-            if not match(cells):
-                continue
-            if matched < offset:
-                matched += 1
-                continue
-            if export_limit is not None and (matched - offset) >= export_limit:
-                break
-            matched += 1
-            lines.append("\t".join([cells[i] for i in col_indices]))
+        index = line_index(path)
+        stop = None if export_limit is None else offset + export_limit
+        numbers = _matching_rows(
+            index, header, filters, conf, sort)[offset:stop]
     except Exception as exc:
         send_response(
             s,
@@ -1510,15 +2260,282 @@ def server_export(s, query, qtype):
         )
         return
 
-    content = "\n".join(lines)
+    header_out = [header[i] for i in col_indices]
+    rows = index.rows(numbers, col_indices)
+    try:
+        send_chunks(
+            s,
+            itertools.chain(
+                ["\t".join(header_out)],
+                ("\n" + "\t".join(cells) for cells in rows)),
+            content_type="text/plain; charset=utf-8",
+            content_disposition='attachment; filename="filtered.tsv"',
+        )
+    finally:
+        # unmaps the file, also if the client disconnected
+        rows.close()
+
+
+def server_search(s, query, qtype, conf=None):
+    """
+    Search the cells of a TSV file for a text or a regular expression.
+
+    Note
+    ----
+    The payload holds the `query`, a flag `regex`, and the `columns` to
+    search, by default FORM, TOKENS, and NOTE. Matches are looked up in the
+    trigram index of the file, and can be restricted with the same filters
+    as in server_page. The response holds the identifiers of one page of
+    matching rows, their numbers in the file, the total number of matching
+    rows, and the number of matching rows for each column.
+    """
+    args = {"payload": ""}
+    handle_args(args, query, qtype)
+    payload = _parse_payload(args)
+    if not payload:
+        send_response(
+            s,
+            json.dumps({"error": "Missing payload."}),
+            content_type="application/json; charset=utf-8",
+        )
+        return
+
+    path_str = payload.get("file") or payload.get("path")
+    text = str(payload.get("query") or "")
+    if not path_str or not text:
+        send_response(
+            s,
+            json.dumps({"error": "Missing file path or query."}),
+            content_type="application/json; charset=utf-8",
+        )
+        return
+
+    path = Path(path_str).expanduser()
+    if not path.is_absolute():
+        path = Path.cwd().joinpath(path)
+    if not path.exists():
+        send_response(
+            s,
+            json.dumps({"error": "File not found.", "detail": str(path)}),
+            content_type="application/json; charset=utf-8",
+        )
+        return
+
+    regex = bool(payload.get("regex"))
+    if regex:
+        try:
+            re.compile(text)
+        except re.error as exc:
+            send_response(
+                s,
+                json.dumps({"error": "Invalid expression.", "detail": str(exc)}),
+                content_type="application/json; charset=utf-8",
+            )
+            return
+
+    try:
+        header = _read_tsv_header(path)
+    except Exception as exc:
+        send_response(
+            s,
+            json.dumps({"error": "Failed to read header.", "detail": str(exc)}),
+            content_type="application/json; charset=utf-8",
+        )
+        return
+
+    limit = int(payload.get("limit", 50) or 50)
+    offset = max(0, int(payload.get("offset", 0) or 0))
+    columns = [str(c).strip() for c in payload.get("columns") or [] if c]
+    filters = _tsv_filters(payload)
+
+    # the matches of each column are kept with the line index, like the
+    # rows of a filter, and filters are applied to them afterwards
+    try:
+        index = line_index(path)
+        hits = index.matches(
+            json.dumps(["search", columns, text, regex]),
+            lambda: index.grams.search(header, columns, text, regex))
+        if filters:
+            allowed = set(_matching_rows(index, header, filters, conf))
+            hits = {
+                column: [number for number in numbers if number in allowed]
+                for column, numbers in hits.items()}
+        numbers = sorted(set().union(*hits.values()))
+        page = numbers[offset:offset + limit]
+        column_map = {name.upper(): idx for idx, name in enumerate(header)}
+        if "ID" in column_map:
+            ids = [cells[0] for cells in index.rows(page, [column_map["ID"]])]
+        else:
+            ids = [str(number + 1) for number in page]
+    except Exception as exc:
+        send_response(
+            s,
+            json.dumps({"error": "Failed to search.", "detail": str(exc)}),
+            content_type="application/json; charset=utf-8",
+        )
+        return
+
+    response = {
+        "ids": ids,
+        "rows": page,
+        "total": len(numbers),
+        "counts": {column: len(numbers) for column, numbers in hits.items()},
+        "offset": offset,
+        "limit": limit,
+        "file": str(path),
+    }
     send_response(
         s,
-        content,
-        content_type="text/plain; charset=utf-8",
-        content_disposition='attachment; filename="filtered.tsv"',
+        json.dumps(response),
+        content_type="application/json; charset=utf-8",
     )
 
 
+def select_triples(db, name, cols, concepts=None, doculects=None):
+    """
+    Return an iterator over the rows of a wordlist in the triple store.
+
+    Note
+    ----
+    Identifiers are filtered by concepts and doculects, and the requested
+    columns are pivoted inside SQLite, so that only the rows of the result
+    are read into Python. Rows are yielded as lists of strings, starting
+    with the identifier, in the order in which the identifiers first appear
+    in the table. Empty values and values of "-" are returned as empty
+    strings. If a cell occurs more than once, the last value is used.
+    """
+    table = table_name(name)
+    filters = [
+        (col, json.dumps(values)) for col, values in [
+            ("CONCEPT", concepts), ("DOCULECT", doculects)] if values]
+    if filters:
+        # identifiers are ordered by the rows matching the first filter
+        ids = (
+            "select ID, min(rowid) from " + table + " where COL = ? and "
+            "VAL in (select value from json_each(?))")
+        params = list(filters[0])
+        if len(filters) > 1:
+            ids += (
+                " and ID in (select ID from " + table + " where COL = ? and "
+                "VAL in (select value from json_each(?)))")
+            params += filters[1]
+    else:
+        ids, params = "select ID, min(rowid) from " + table, []
+    # the last non-empty value of each cell is found by its rowid first, and
+    # only those values are read from the table
+    pivot = "".join(
+        ", max(case when t.COL = ? then t.rowid end)" for _ in cols)
+    values = "".join(
+        ", (select VAL from " + table + " where rowid = cells.C" + str(i) + ")"
+        for i in range(len(cols)))
+    query = (
+        "with ids(ID, R) as (" + ids + " group by ID), "
+        "cells(ID" + "".join(", C" + str(i) for i in range(len(cols))) + ") "
+        "as (select t.ID" + pivot + " from " + table + " as t " +
+        ("join ids on t.ID = ids.ID " if filters else "") +
+        "where t.COL in (select value from json_each(?)) "
+        "and t.VAL not in ('-', '') group by t.ID) "
+        "select ids.ID" + values + " from ids "
+        "left join cells on cells.ID = ids.ID order by ids.R;")
+    params += cols + [json.dumps(cols)]
+    return (
+        [str(row[0])] + ["" if val is None else str(val) for val in row[1:]]
+        for row in db.execute(query, params))
+
+
+def current_snapshot(db, name):
+    """
+    Return the columns of the snapshot of a wordlist, if it is up to date.
+    """
+    if not has_table(db, "snapshots"):
+        return None
+    state = db.execute(
+        "select COLS from snapshots where FILE = ? and VERSION = BUILT;",
+        (name,)).fetchone()
+    return json.loads(state[0]) if state else None
+
+
+def refresh_snapshot(db, name, ids=None, cols=None):
+    """
+    Write the wide-format snapshot of a wordlist, or of some of its rows.
+
+    Note
+    ----
+    Each row is stored as a JSON object of its non-empty values, together
+    with the position of its first triple, which keeps the order of
+    `select_triples`. Triggers on the wordlist count its modifications, and
+    the snapshot records the count it reflects. Without `ids`, the snapshot
+    is built anew, otherwise only the given rows are replaced, which is how
+    `update` keeps it current. In this case, `cols` are the columns of the
+    snapshot as returned by `current_snapshot` before the rows were
+    modified. Call this inside a transaction.
+    """
+    table = table_name(name)
+    if ids is None:
+        for _, statement in snapshot_triggers(name):
+            db.execute(statement)
+        db.execute("delete from snapshot_rows where FILE = ?;", (name,))
+        where, params = "", []
+        cols = get_columns(db, name)
+    else:
+        ids = json.dumps(sorted(set(ids)))
+        db.execute(
+            "delete from snapshot_rows where FILE = ? and "
+            "ID in (select value from json_each(?));", (name, ids))
+        where, params = " and ID in (select value from json_each(?))", [ids]
+        # columns that appear for the first time come last, like in
+        # get_columns, and columns without any value left are removed
+        cols = [col for col in cols if db.execute(
+            "select 1 from " + table + " where COL = ? limit 1;",
+            (col,)).fetchone()]
+        cols += [col for (col,) in db.execute(
+            "select COL from " + table + " where ID in "
+            "(select value from json_each(?)) group by COL "
+            "order by min(rowid);", (ids,)) if col not in cols]
+    # only the last non-empty value of a cell is kept, as in select_triples
+    db.execute(
+        "insert into snapshot_rows (FILE, ID, R, ROW) "
+        "select ?, ids.ID, ids.R, coalesce(cells.ROW, '{}') from ("
+        "select ID, min(rowid) as R from " + table + " where 1" + where +
+        " group by ID) as ids left join ("
+        "select ID, json_group_object(COL, VAL) as ROW from " + table +
+        " where rowid in (select max(rowid) from " + table +
+        " where VAL not in ('-', '')" + where + " group by ID, COL) "
+        "group by ID) as cells on cells.ID = ids.ID;",
+        [name] + params * 2)
+    db.execute(
+        "insert into snapshots (FILE, VERSION, BUILT, COLS) "
+        "values (?, 0, 0, ?) on conflict (FILE) do update "
+        "set BUILT = VERSION, COLS = excluded.COLS;",
+        (name, json.dumps(cols)))
+
+
+def snapshot_triples(db, name, cols=None):
+    """
+    Return the header and the rows of a wordlist from its snapshot.
+
+    Note
+    ----
+    The snapshot is built first if it is missing or if the wordlist was
+    modified without updating it, e.g. by another program. Rows are the
+    same as those of `select_triples` without filters.
+    """
+    current = current_snapshot(db, name)
+    if current is None:
+        with db:
+            refresh_snapshot(db, name)
+        current = current_snapshot(db, name)
+    cols = cols or current
+    values = "".join(", json_extract(ROW, ?)" for _ in cols)
+    rows = db.execute(
+        "select ID" + values + " from snapshot_rows where FILE = ? "
+        "order by R;",
+        ['$."{0}"'.format(col.replace('"', '\\"')) for col in cols] + [name])
+    return cols, (
+        [str(row[0])] + ["" if val is None else str(val) for val in row[1:]]
+        for row in rows)
+
+
 def triples(s, query, qtype, conf):
     """
     Basic access to the triple storage storing data in SQLITE.
@@ -1550,74 +2567,47 @@ def triples(s, query, qtype, conf):
         )
         return
 
-    db, cursor = opendb(args["remote_dbase"], conf)
-
-    # get unique columns
-    if not args['columns']:
-        cols = get_columns(cursor, args['file'])
-    else:
-        cols = args['columns'].split('%7C')
-
-    text = 'ID\t' + '\t'.join(cols) + '\n'
-
-    # if neither concepts or doculects are passed from the args, all ids are
-    # selected from the database
-    if not args['concepts'] and not args['doculects']:
-        idxs = [line[0] for line in cursor.execute(
-            'select distinct ID from ' + args['file'] + ';')]
-    else:
-        # we evaluate the concept string
-        if args['concepts']:
-            cstring = 'COL = "CONCEPT" and VAL in ("' + \
-                      '","'.join(args['concepts'].split('%7C')) + '")'
-        else:
-            cstring = ''
-        if args['doculects']:
-            dstring = 'COL = "DOCULECT" and VAL in ("' + \
-                      '","'.join(args['doculects'].split('%7C')) + '")'
-        else:
-            dstring = ''
-
-        if cstring:
-            cidxs = [line[0] for line in cursor.execute(
-                'select distinct ID from ' + args['file'] + ' where ' + cstring)]
-        else:
-            cidxs = []
-        if dstring:
-            didxs = [line[0] for line in cursor.execute(
-                'select distinct ID from ' + args['file'] + ' where ' + dstring)]
-        else:
-            didxs = []
-
-        if cidxs and didxs:
-            idxs = [idx for idx in cidxs if idx in didxs]
-        else:
-            idxs = cidxs or didxs
-
-    # make the dictionary
-    D = {}
-    for a, b, c in cursor.execute('select * from ' + args['file'] + ';'):
-        if c not in ['-', '']:
-            try:
-                D[a][b] = c
-            except KeyError:
-                D[a] = {b: c}
-
-    # make object
-    for idx in idxs:
-        txt = str(idx)
-        for col in cols:
-            try:
-                txt += '\t' + D[idx][col]
-            except IndexError:
-                txt += '\t'
-            except ValueError:
-                txt += "\t"
-            except KeyError:
-                txt += "\t"
-        text += txt + "\n"
-    send_response(s, text, content_type="text/plain; charset=utf-8",
-                  content_disposition='attachment; filename="triples.tsv"')
+    # the database and its journal change with every commit, including
+    # those of other programs, and the change log with those of the server
+    path = database_path(args["remote_dbase"], conf)
+
+    def revalidate(db):
+        stamps = [file_stamp(path), file_stamp(str(path) + "-wal")]
+        return validators(
+            [__version__, args, change_head(db), stamps],
+            mtime=max(stamp[0] for stamp in stamps if stamp) / 1e9)
+
+    pool = get_pool(database_path(args["remote_dbase"], conf))
+    with pool.connection() as db:
+        # unchanged wordlists are confirmed before any triple is read
+        if not_modified(
+                s, revalidate(db), "text/plain; charset=utf-8"):
+            return
+        cols = args['columns'].split('%7C') if args['columns'] else None
+        rows = None
+        # full loads are read from the snapshot of the wordlist, unless the
+        # database is read-only and cannot hold one
+        if not args['concepts'] and not args['doculects'] and \
+                not pool.read_only and has_table(db, "snapshots"):
+            cols, rows = snapshot_triples(db, args["file"], cols)
+        if rows is None:
+            # get unique columns
+            cols = cols or get_columns(db, args['file'])
+            rows = select_triples(
+                db, args["file"], cols,
+                concepts=args["concepts"].split("%7C") if args["concepts"] else None,
+                doculects=args["doculects"].split("%7C") if args["doculects"] else None)
+        # a snapshot that was rebuilt modified the files, so the validators
+        # are computed again for the state that is sent
+        headers = revalidate(db)
+        send_chunks(
+            s,
+            itertools.chain(
+                ['ID\t' + '\t'.join(cols) + '\n'],
+                ("\t".join(row) + "\n" for row in rows)),
+            content_type="text/plain; charset=utf-8",
+            content_disposition='attachment; filename="triples.tsv"',
+            headers=headers)
 
 
 # noinspection SqlDialectInspection,SqlNoDataSourceInspection,SqlResolve
@@ -1660,23 +2650,262 @@ def modifications(s, post, qtype, conf):
         )
         return
 
-    db, cursor = opendb(args["remote_dbase"], conf)
-    cursor.execute(
-        'select ID, COL from backup where FILE="' + args['file'] + '"' +
-        ' and DATE > ' + args['date'] +
-        ' group by ID,COL limit 100;')
-    lines = cursor.fetchall()
-    data = dict([((a, b), c) for a, b, c in cursor.execute(
-        'select * from ' + args['file'] + ';'
-    )])
-    message = ""
-    for line in lines:
+    table = table_name(args["file"])
+    with triple_store(args["remote_dbase"], conf) as db:
+        lines = db.execute(
+            'select b.ID, b.COL, t.VAL from ('
+            'select ID, COL from backup where FILE = ? and DATE > ? '
+            'group by ID, COL) as b join ' + table + ' as t '
+            'on t.ID = b.ID and t.COL = b.COL order by b.ID, b.COL;',
+            (args["file"], args["date"])).fetchall()
+    message = "".join(
+        '{0}\t{1}\t{2}\n'.format(idx, col, val) for idx, col, val in lines)
+    send_response(s, message)
+
+
+# noinspection SqlResolve
+def changes(s, query, qtype, conf):
+    """
+    Return the cells of a wordlist that changed since a given sequence number.
+
+    Note
+    ----
+    Every modification made through the server is logged with a sequence
+    number that only grows. The first line of the result is the sequence
+    number of the latest change, which the client passes as `since` with
+    its next request. The following lines list each modified cell once, as
+    ID, column, and current value, in the order of their last modification.
+    Cells that have been deleted have an empty value. Remote databases keep
+    no change log the server could read, so they are answered with an error.
+    """
+    args = dict(remote_dbase='', file='', since='0')
+    handle_args(args, query, qtype)
+
+    if conf.get("remote") and args["remote_dbase"] in conf["remote"]:
+        send_response(
+            s, "The change feed is not available for remote databases, "
+            "use modifications.py instead.",
+            content_type="text/plain; charset=utf-8", status_code=400)
+        return
+
+    try:
+        since = int(args["since"] or 0)
+    except ValueError:
+        send_response(s, "Invalid sequence number.", status_code=400)
+        return
+    table = table_name(args["file"])
+    with triple_store(args["remote_dbase"], conf) as db:
+        head = change_head(db)
+        lines = db.execute(
+            "select c.ID, c.COL, t.VAL from ("
+            "select ID, COL, max(SEQ) as S from changes "
+            "where FILE = ? and SEQ > ? and SEQ <= ? group by ID, COL) as c "
+            "left join " + table + " as t on t.ID = c.ID and t.COL = c.COL "
+            "order by c.S;",
+            (args["file"], since, head)).fetchall()
+    send_response(
+        s,
+        str(head) + "\n" + "".join(
+            "{0}\t{1}\t{2}\n".format(idx, col, "" if val is None else val)
+            for idx, col, val in lines),
+        content_type="text/plain; charset=utf-8")
+
+
+EVENT_STREAMS = {"open": 0}
+_EVENT_LOCK = threading.Lock()
+
+# longest time in seconds a stream stays open before the client reconnects
+EVENT_TIMEOUT = 60
+
+
+def _send_events(s, lines):
+    s.wfile.write("".join(lines).encode("utf-8"))
+    s.wfile.flush()
+
+
+# noinspection SqlResolve
+def events(s, query, qtype, conf):
+    """
+    Push the modifications of a wordlist to the client as server-sent events.
+
+    Note
+    ----
+    The stream sends one event per modified cell, with the sequence number
+    of the change as its identifier, the operation (insert, update, delete)
+    as its type, and ID, column, and current value as its data. Browsers
+    reconnect automatically and pass the last identifier they received in
+    the header Last-Event-ID, so that no change is lost. Without it, or if
+    it is not a number, the stream starts at `since`, or with the next
+    change. Streams are closed after `timeout` seconds, at most
+    `EVENT_TIMEOUT`, so they are only offered by a concurrent server. A
+    pooled server continues them on a thread of their own, outside its
+    workers, and limits how many are open at the same time.
+    """
+    args = dict(remote_dbase='', file='', since='', timeout=str(EVENT_TIMEOUT))
+    handle_args(args, query, qtype)
+    server = getattr(s, "server", None)
+    if not isinstance(server, socketserver.ThreadingMixIn):
+        send_response(
+            s, "Live updates require a server with more than one worker.",
+            content_type="text/plain; charset=utf-8", status_code=503)
+        return
+    table = table_name(args["file"])
+    pool = get_pool(database_path(args["remote_dbase"], conf))
+    try:
+        timeout = min(max(0, float(args["timeout"])), EVENT_TIMEOUT)
+    except ValueError:
+        timeout = EVENT_TIMEOUT
+    limit = getattr(server, "streams", None)
+    with _EVENT_LOCK:
+        if limit is not None and EVENT_STREAMS["open"] >= limit:
+            full = True
+        else:
+            full = False
+            EVENT_STREAMS["open"] += 1
+    if full:
+        send_response(
+            s, "Too many live connections.",
+            content_type="text/plain; charset=utf-8", status_code=503)
+        return
+
+    def stream():
         try:
-            val = data[line[0], line[1]].encode('utf-8')
-            message += '{0}\t{1}\t{2}\n'.format(line[0], line[1], val)
-        except KeyError:
+            last = (s.headers.get("Last-Event-ID") if s.headers else None) or \
+                args["since"]
+            with pool.connection() as db:
+                try:
+                    since = int(last)
+                except ValueError:
+                    since = change_head(db)
+            s.send_response(200)
+            s.send_header("Content-type", "text/event-stream; charset=utf-8")
+            s.send_header("Cache-Control", "no-cache")
+            s.send_header("Connection", "close")
+            s.end_headers()
+            # clients wait this long before reconnecting
+            _send_events(s, ["retry: 1000\n\n"])
+            end = time.time() + timeout
+            version = pool.version
+            while time.time() < end and not pool.closed:
+                with pool.connection() as db:
+                    rows = db.execute(
+                        "select c.SEQ, c.OP, c.ID, c.COL, t.VAL from changes as c "
+                        "left join " + table + " as t "
+                        "on t.ID = c.ID and t.COL = c.COL "
+                        "where c.FILE = ? and c.SEQ > ? order by c.SEQ;",
+                        (args["file"], since)).fetchall()
+                if rows:
+                    _send_events(s, [
+                        "id: {0}\nevent: {1}\ndata: {2}\t{3}\t{4}\n\n".format(
+                            seq, op, idx, col,
+                            "" if val is None or op == "delete" else val)
+                        for seq, op, idx, col, val in rows])
+                    since = rows[-1][0]
+                else:
+                    # comments keep the connection open and reveal closed ones
+                    _send_events(s, [": waiting\n\n"])
+                # changes from other processes are found when the wait times out
+                version = pool.wait(
+                    version, timeout=min(15, max(0, end - time.time())))
+        except (BrokenPipeError, ConnectionResetError):
             pass
-    send_response(s, message)
+        finally:
+            with _EVENT_LOCK:
+                EVENT_STREAMS["open"] -= 1
+
+    detach = getattr(server, "detach", None)
+    if detach is None:
+        stream()
+    else:
+        detach(s, stream)
+
+
+def update_cells(db, name, cells, user):
+    """
+    Write a batch of cells to a wordlist in a single transaction.
+
+    Note
+    ----
+    The cells are triples of identifier, column, and value. The values they
+    replace are read with one query and written to the backup table with the
+    new values in bulk. Tables with a unique index on their cells are
+    written with an UPSERT. Returns the cells with the value they replaced,
+    which is None for new cells. If a cell occurs more than once, the
+    later value replaces the earlier one.
+    """
+    table = table_name(name)
+    with db:
+        # lock the database before reading, so that the values stored in
+        # the backup are the ones that are replaced
+        if not db.in_transaction:
+            db.execute("begin immediate;")
+        snapshot = current_snapshot(db, name)
+        current = {}
+        for idx, col, val in db.execute(
+                "select t.ID, t.COL, t.VAL from " + table + " as t join ("
+                "select json_extract(value, '$[0]') as ID, "
+                "json_extract(value, '$[1]') as COL from json_each(?)) as c "
+                "on t.ID = c.ID and t.COL = c.COL order by t.rowid;",
+                (json.dumps([[idx, col] for idx, col, _ in cells]),)):
+            current[idx, col] = val
+        edits = []
+        for idx, col, val in cells:
+            edits.append((idx, col, current.get((idx, col)), val))
+            current[idx, col] = val
+
+        if unique_cells(db, table):
+            db.executemany(
+                "insert into " + table + " values (?, ?, ?) "
+                "on conflict (ID, COL) do update set VAL = excluded.VAL;",
+                cells)
+        else:
+            db.executemany(
+                "insert into " + table + " values (?, ?, ?);",
+                [(idx, col, val) for idx, col, orig, val in edits
+                 if orig is None])
+            db.executemany(
+                "update " + table + " set VAL = ? where ID = ? and COL = ?;",
+                [(val, idx, col) for idx, col, orig, val in edits
+                 if orig is not None])
+        db.executemany(
+            'insert into backup values (?, ?, ?, ?, strftime("%s", "now"), ?);',
+            [(name, idx, col, "!newvalue!" if orig is None else orig, user)
+             for idx, col, orig, val in edits])
+        record_changes(db, name, [
+            (idx, col, "insert" if orig is None else "update")
+            for idx, col, orig, val in edits])
+        if snapshot is not None:
+            refresh_snapshot(
+                db, name, [idx for idx, col, val in cells], snapshot)
+    return edits
+
+
+def update_summary(edits, now):
+    """
+    Describe the cells written by `update_cells` in the messages of update.py.
+
+    Note
+    ----
+    A single cell is reported as before. Larger batches are summarized with
+    one line for modified and one line for inserted cells, and the
+    application checks for the keywords UPDATE and INSERTION in them.
+    """
+    if len(edits) == 1:
+        idx, col, orig, val = edits[0]
+        if orig is None:
+            return 'INSERTION: Successfully inserted {0} on {1}'.format(
+                val, now)
+        return 'UPDATE: Modification successful replace "{0}" with "{1}" on {2}.'.format(
+            orig, val, now)
+    modified = sum(1 for change in edits if change[2] is not None)
+    lines = []
+    if modified:
+        lines.append('UPDATE: Modification successful for {0} cells on {1}.'.format(
+            modified, now))
+    if len(edits) - modified:
+        lines.append('INSERTION: Successfully inserted {0} cells on {1}.'.format(
+            len(edits) - modified, now))
+    return "\n".join(lines)
 
 
 # noinspection SqlResolve
@@ -1725,92 +2954,54 @@ def update(s, post, qtype, conf):
         send_response(s, message, encode=False)
         return
 
-    db, cursor = opendb(args["remote_dbase"], conf)
-
-    if "update" in args:
-        idxs = urllib.parse.unquote(args['ids']).split("|||")
-        cols = urllib.parse.unquote(args['cols']).split("|||")
-        vals = urllib.parse.unquote(args['vals']).split("|||")
-
-        # iterate over the entries
-        if len(idxs) == len(cols) == len(vals):
-            pass
-        else:
-            print('ERROR: wrong values submitted')
-            return
-        for idx, col, val in zip(idxs, cols, vals):
-
-            # unquote the value
-            val = urllib.parse.unquote(val)
-
-            # check for quote characters
-            if '"' in val:
-                val = val.replace('"', '""')
+    table = table_name(args["file"])
+    with triple_store(args["remote_dbase"], conf) as db:
+        if "update" in args:
+            idxs = urllib.parse.unquote(args['ids']).split("|||")
+            cols = urllib.parse.unquote(args['cols']).split("|||")
+            vals = urllib.parse.unquote(args['vals']).split("|||")
 
-            # get original data value
-            try:
-                orig_val = [x for x in cursor.execute(
-                    'select VAL from ' + args['file'] + ' where ID=' + \
-                    idx + ' and COL like "' + col + '";')][0][0]
-
-                qstring = 'update ' + args[
-                    'file'] + ' set VAL="' + val + '" where ID=' + idx + ' and COL="' + col + '";'
-                cursor.execute(
-                    qstring
-                )
-
-                message = 'UPDATE: Modification successful replace "{0}" with "{1}" on {2}.'.format(
-                    orig_val.encode('utf-8'),
-                    val,
-                    now)
-
-            except IndexError:
-                orig_val = '!newvalue!'
-
-                # create new datum if value has not been retrieved
-                cursor.execute(
-                    'insert into ' + args['file'] + ' values(' +
-                    idx + ',"' + col + '","' +
-                    val + '");')
-                message = 'INSERTION: Successfully inserted {0} on {1}'.format(
-                    val, now)
-
-            # modify original value with double quotes for safety
-            if '"' in orig_val:
-                orig_val = orig_val.replace('"', '""')
-
-            # insert the backup line
+            # check that all entries are complete
+            if len(idxs) == len(cols) == len(vals):
+                pass
+            else:
+                print('ERROR: wrong values submitted')
+                return
+            cells = [
+                (int(idx), col, urllib.parse.unquote(val))
+                for idx, col, val in zip(idxs, cols, vals)]
             try:
-                # noinspection SqlDialectInspection,SqlResolve
-                cursor.execute(
-                    'insert into backup values(?,?,?,?,strftime("%s","now"),?);',
-                    (
-                        args['file'],
-                        idx,
-                        col,
-                        orig_val,
-                        conf["user"]
-                    ))
-            except Exception as e:
+                edits = update_cells(db, args["file"], cells, conf["user"])
+            except sqlite3.Error as e:
                 print(e)
-                message = 'ERROR'
-
-        db.commit()
+                message = 'ERROR: {0}'.format(e)
+            else:
+                message = update_summary(edits, now)
+                get_pool(database_path(args["remote_dbase"], conf)).notify()
 
-    elif "delete" in args:
-        lines = [line for line in cursor.execute(
-            'select * from ' + args['file'] + ' where ID=' + args['ID'] + ';'
-        )]
-        for idx, col, val in lines:
-            cursor.execute(
+        elif "delete" in args:
+            if not db.in_transaction:
+                db.execute("begin immediate;")
+            snapshot = current_snapshot(db, args['file'])
+            lines = db.execute(
+                'select ID, COL, VAL from ' + table + ' where ID = ?;',
+                (args['ID'],)).fetchall()
+            db.executemany(
                 'insert into backup values(?,?,?,?,strftime("%s","now"),?);',
-                (args['file'], idx, col, val, conf["user"]))
-            cursor.execute(
-                'delete from ' + args['file'] + ' where ID=' + args['ID'] + ';')
-        db.commit()
-        message = 'DELETION: Successfully deleted all entries for ID {0} on {1}.'.format(
-            args['ID'],
-            now)
+                [(args['file'], idx, col, val, conf["user"])
+                 for idx, col, val in lines])
+            db.execute(
+                'delete from ' + table + ' where ID = ?;', (args['ID'],))
+            record_changes(
+                db, args['file'], [(idx, col, "delete") for idx, col, val in lines])
+            if snapshot is not None:
+                refresh_snapshot(
+                    db, args['file'], [int(args['ID'])], snapshot)
+            db.commit()
+            get_pool(database_path(args["remote_dbase"], conf)).notify()
+            message = 'DELETION: Successfully deleted all entries for ID {0} on {1}.'.format(
+                args['ID'],
+                now)
     send_response(s, message)
 
 
@@ -0,0 +1,78 @@
+import json
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from edictor.cache import RESULTS
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    """
+    Keep the caches of the server out of the folder of the user.
+    """
+    monkeypatch.setenv("EDICTOR_CACHE", str(tmp_path.joinpath("cache")))
+    monkeypatch.setattr(RESULTS, "_path", None)
+    monkeypatch.setattr(RESULTS, "_ready", False)
+    monkeypatch.setattr(RESULTS, "hits", 0)
+    monkeypatch.setattr(RESULTS, "misses", 0)
+    return tmp_path.joinpath("cache")
+
+
+@pytest.fixture
+def databases(tmp_path, monkeypatch):
+    """
+    Work in a folder with copies of the test databases.
+
+    Note
+    ----
+    The pool of connections migrates the databases it opens, so tests that
+    refer to the folders `data` or `sqlite` receive copies of the tracked
+    databases.
+    """
+    tests = Path(__file__).parent
+    ignore = shutil.ignore_patterns("*-wal", "*-shm")
+    shutil.copytree(tests / "data", tmp_path / "data", ignore=ignore)
+    shutil.copytree(
+        tests.parent / "src" / "edictor" / "app" / "sqlite",
+        tmp_path / "sqlite", ignore=ignore)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(scope="session")
+def wordlist():
+    """
+    Read the words of the first concepts from the Germanic test database.
+
+    Note
+    ----
+    The function returned takes the number of concepts and the columns that
+    follow the identifier, and returns one line of tab-separated cells per
+    word, ordered by identifier, as the application passes them to the
+    analyses. The database is opened read-only, so it is not migrated.
+    """
+    path = Path(__file__).parent / "data" / "germanic.sqlite3"
+
+    def lines(concepts=3, columns=("DOCULECT", "CONCEPT", "TOKENS")):
+        db = sqlite3.connect("file:" + path.as_posix() + "?mode=ro", uri=True)
+        try:
+            cells = db.execute(
+                "select ID, COL, VAL from germanic where COL in (select value "
+                "from json_each(?)) and ID in (select ID from germanic where "
+                "COL = 'CONCEPT' and VAL in (select VAL from germanic "
+                "where COL = 'CONCEPT' group by VAL order by min(ID) "
+                "limit ?)) order by ID;",
+                (json.dumps(list(columns)), concepts)).fetchall()
+        finally:
+            db.close()
+        rows = {}
+        for idx, col, val in cells:
+            rows.setdefault(idx, {})[col] = val
+        return [
+            "\t".join([str(idx)] + [row.get(col, "") for col in columns])
+            for idx, row in rows.items()]
+
+    return lines
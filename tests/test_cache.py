@@ -0,0 +1,110 @@
+"""
+Test the caches of the local server.
+"""
+from edictor.cache import (
+        ResultCache, ScorerCache, normalize_wordlist, result_key, cache_dir,
+        forms_changed)
+
+try:
+    from lingpy.compare.lexstat import LexStat
+    with_lingpy = True
+except ImportError:
+    with_lingpy = False
+
+
+def _lexstat(words):
+    tmp = {0: ["doculect", "concept", "form", "tokens"]}
+    idx = 1
+    for i, concept in enumerate(words):
+        for j, doculect in enumerate(["A", "B", "C"]):
+            tmp[idx] = [doculect, "c" + str(i), concept[j], concept[j].split()]
+            idx += 1
+    return LexStat(tmp)
+
+
+def test_cache_dir(cache):
+    assert cache_dir() == cache
+
+
+def test_normalize_wordlist():
+    assert normalize_wordlist("2\tB  \n1\tA\n\n") == "1\tA\n2\tB"
+
+
+def test_result_key():
+    args = {"wordlist": "1\tA\n2\tB\n", "mode": "full"}
+    key = result_key("cognates", args)
+    assert key == result_key(
+        "cognates", {"wordlist": "2\tB\n1\tA\n", "mode": "full", "job": "true"})
+    assert key != result_key("alignments", args)
+    assert key != result_key("cognates", dict(args, mode="partial"))
+
+
+def test_result_cache(tmp_path):
+    cache = ResultCache(tmp_path.joinpath("results.sqlite3"), max_bytes=10)
+    assert cache.get("a") is None
+    cache.put("a", "12345")
+    cache.put("b", "12345")
+    assert cache.get("a") == "12345"
+    # b is now the least recently used entry and is evicted first
+    cache.put("c", "123")
+    assert cache.get("b") is None
+    assert cache.get("c") == "123"
+    # too large for the cache
+    cache.put("d", "12345678901")
+    assert cache.get("d") is None
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 3
+    assert stats["entries"] == 2
+    assert stats["size"] == 8
+
+    # the cache survives a restart of the server
+    cache = ResultCache(tmp_path.joinpath("results.sqlite3"), max_bytes=10)
+    assert cache.get("a") == "12345"
+    cache.clear()
+    assert cache.stats()["entries"] == 0
+    cache.configure(tmp_path.joinpath("other.sqlite3"), 20)
+    assert cache.max_bytes == 20
+
+
+def test_forms_changed():
+    assert forms_changed(["a", "b"], ["a", "b"]) == 0
+    assert forms_changed(["a", "b"], ["a", "c"]) == 1
+    assert forms_changed([], []) == 0
+
+
+def test_scorer_cache(tmp_path):
+    if not with_lingpy:
+        return
+    words = [
+        ["m a m a", "m u m u", "m i m i"],
+        ["k a l", "k u l", "k a l a"],
+        ["t a l a", "t o l a", "d a l a"],
+        ["p a n", "b a n", "p o n"],
+    ] * 5
+    scorers = ScorerCache(tmp_path, threshold=0.1)
+    lex = _lexstat(words)
+    assert not scorers.load(lex, {"runs": 10})
+    lex.get_scorer(runs=10)
+    scorers.store(lex, {"runs": 10})
+
+    cached = _lexstat(words)
+    assert scorers.load(cached, {"runs": 10})
+    assert cached.cscorer.matrix == lex.cscorer.matrix
+    assert not scorers.load(cached, {"runs": 20})
+    assert not scorers.load(cached, {"runs": 10}, kind="partial")
+
+    # one of twenty forms changed per language stays below the threshold
+    changed = [list(row) for row in words]
+    changed[0] = ["m a m o", "m u m o", "m i m o"]
+    cached = _lexstat(changed)
+    assert scorers.load(cached, {"runs": 10})
+    assert cached.cscorer["1.M.m", "2.M.m"] == lex.cscorer["1.M.m", "2.M.m"]
+
+    # three changed forms exceed it, the scorer has to be recomputed
+    changed[1] = ["k a t", "k u t", "k a t a"]
+    changed[2] = ["t a t a", "t o t a", "d a t a"]
+    assert not scorers.load(_lexstat(changed), {"runs": 10})
+
+    scorers.configure(tmp_path.joinpath("other"), 0.5)
+    assert scorers.threshold == 0.5
@@ -3,6 +3,7 @@ import multiprocessing
 import time
 import os
 import tempfile
+import sqlite3
 
 
 def test_server():
@@ -30,6 +31,19 @@ def test_wordlist():
         os.chdir("..")
 
 
+def test_migrate(tmp_path, capsys):
+    path = tmp_path / "test.sqlite3"
+    db = sqlite3.connect(path)
+    db.execute("create table germanic (ID int, COL text, VAL text);")
+    db.close()
+    main("migrate", str(path), str(tmp_path / "missing.sqlite3"))
+    main("migrate", str(path))
+    out = capsys.readouterr().out.split("\n")
+    assert "germanic_col_val" in out[0]
+    assert "file not found" in out[1]
+    assert "up to date" in out[2]
+
+
 def test_main():
     os.system("edictor")
     os.system("edictor --help")
@@ -0,0 +1,54 @@
+"""
+Test the compression of the responses of the local server.
+"""
+import gzip
+import os
+
+from edictor.compress import (
+        Compressor, compress, compressible, negotiate, precompressed,
+        encodings)
+
+
+def test_compressible():
+    assert compressible("text/plain; charset=utf-8")
+    assert compressible("application/json")
+    assert compressible("text/javascript")
+    assert not compressible("image/png")
+
+
+def test_negotiate():
+    assert negotiate(None) is None
+    assert negotiate("") is None
+    assert negotiate("gzip") == "gzip"
+    assert negotiate("deflate, gzip;q=0.5") == "gzip"
+    assert negotiate("gzip;q=0") is None
+    assert negotiate("identity") is None
+    assert negotiate("*") == encodings()[0]
+    assert negotiate("*, gzip;q=0") == ("br" if "br" in encodings() else None)
+
+
+def test_compress():
+    data = "ID\tDOCULECT\tCONCEPT\n".encode("utf-8") * 1000
+    assert gzip.decompress(compress(data, "gzip")) == data
+    assert len(compress(data, "gzip")) < len(data) / 10
+
+    compressor = Compressor("gzip")
+    parts = [compressor.compress(data[:5000]), compressor.compress(data[5000:])]
+    assert gzip.decompress(b"".join(parts) + compressor.flush()) == data
+
+
+def test_precompressed(tmp_path, cache):
+    path = tmp_path / "app.js"
+    path.write_text("var x = 1;\n" * 1000)
+    data = precompressed(path, "gzip")
+    assert gzip.decompress(data) == path.read_bytes()
+    variants = list(cache.joinpath("static").iterdir())
+    assert len(variants) == 1
+    assert variants[0].read_bytes() == data
+    assert precompressed(path, "gzip") == data
+
+    # edited files are compressed again and replace the older variant
+    path.write_text("var y = 2;\n" * 1000)
+    os.utime(path, ns=(0, 10 ** 9))
+    assert gzip.decompress(precompressed(path, "gzip")) == path.read_bytes()
+    assert len(list(cache.joinpath("static").iterdir())) == 1
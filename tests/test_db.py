@@ -0,0 +1,159 @@
+import sqlite3
+import threading
+
+from pytest import raises
+
+from edictor.db import (
+        ConnectionPool, get_pool, close_pools, table_name, POOLS, migrate,
+        triple_tables, SCHEMA_VERSION)
+
+
+def make_db(path):
+    db = sqlite3.connect(path)
+    db.execute("create table germanic (ID int, COL text, VAL text);")
+    db.execute("insert into germanic values (1, 'DOCULECT', 'German');")
+    db.execute(
+        "create table backup (FILE text, ID int, COL text, VAL text, "
+        "DATE text, user text);")
+    db.commit()
+    db.close()
+    return path
+
+
+def test_table_name():
+    assert table_name("germanic") == "germanic"
+    raises(ValueError, table_name, "")
+    raises(ValueError, table_name, "germanic; drop table backup")
+    raises(ValueError, table_name, 'germanic"')
+
+
+def test_connection_pool(tmp_path):
+    pool = ConnectionPool(make_db(tmp_path / "test.sqlite3"), size=2)
+    with pool.connection() as db:
+        first = db
+        assert db.execute("select VAL from germanic;").fetchone()[0] == "German"
+    assert pool.wal
+    # connections are reused
+    with pool.connection() as db:
+        assert db is first
+
+    # uncommitted changes are rolled back when a request fails
+    with raises(RuntimeError):
+        with pool.connection() as db:
+            db.execute("insert into germanic values (2, 'DOCULECT', 'Dutch');")
+            raise RuntimeError
+    with pool.connection() as db:
+        assert db.execute("select count(*) from germanic;").fetchone()[0] == 1
+
+    # connections can be used from other threads
+    results = []
+
+    def read():
+        with pool.connection() as db:
+            results.append(db.execute("select count(*) from germanic;").fetchone()[0])
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [1, 1, 1, 1]
+    assert pool._idle.qsize() <= 2
+
+    pool.close()
+    assert pool._idle.qsize() == 0
+
+
+def test_get_pool(tmp_path):
+    path = make_db(tmp_path / "test.sqlite3")
+    assert get_pool(path) is get_pool(str(path))
+    close_pools()
+    assert not POOLS
+
+
+def test_migrate(tmp_path):
+    db = sqlite3.connect(make_db(tmp_path / "test.sqlite3"))
+    db.execute("create table other (ID int, COL text);")
+    assert triple_tables(db) == ["germanic"]
+    assert migrate(db) == [
+        "germanic_col_val", "germanic_id_col", "backup_file_date",
+        "backup_file_id", "changes", "changes_file_seq", "snapshots",
+        "snapshot_rows", "snapshot_rows_order", "germanic_snapshot_insert",
+        "germanic_snapshot_update", "germanic_snapshot_delete"]
+    assert db.execute("pragma user_version;").fetchone()[0] == SCHEMA_VERSION
+    assert migrate(db) == []
+    unique = db.execute(
+        "select sql from sqlite_master where name = 'germanic_id_col';"
+    ).fetchone()[0]
+    assert "UNIQUE" in unique.upper()
+    raises(
+        sqlite3.IntegrityError, db.execute,
+        "insert into germanic values (1, 'DOCULECT', 'Dutch');")
+    db.close()
+
+    # tables with duplicate cells keep them
+    db = sqlite3.connect(tmp_path / "duplicates.sqlite3")
+    db.execute("create table germanic (ID int, COL text, VAL text);")
+    db.executemany(
+        "insert into germanic values (?, ?, ?);",
+        [(1, "DOCULECT", "German"), (1, "DOCULECT", "Dutch")])
+    db.commit()
+    assert migrate(db)[:4] == [
+        "germanic_col_val", "germanic_id_col", "changes", "changes_file_seq"]
+    assert "UNIQUE" not in db.execute(
+        "select sql from sqlite_master where name = 'germanic_id_col';"
+    ).fetchone()[0].upper()
+    db.close()
+
+    # tables added after the migration receive their indexes as well
+    db = sqlite3.connect(tmp_path / "test.sqlite3")
+    db.execute("create table dutch (ID int, COL text, VAL text);")
+    db.commit()
+    assert migrate(db) == [
+        "dutch_col_val", "dutch_id_col", "dutch_snapshot_insert",
+        "dutch_snapshot_update", "dutch_snapshot_delete"]
+    db.close()
+
+    # the pool migrates the database when it is opened
+    pool = ConnectionPool(make_db(tmp_path / "pooled.sqlite3"))
+    with pool.connection() as db:
+        assert db.execute("pragma user_version;").fetchone()[0] == SCHEMA_VERSION
+        # and again once the schema changed
+        db.execute("create table dutch (ID int, COL text, VAL text);")
+        db.commit()
+    with pool.connection() as db:
+        assert "dutch_snapshot_insert" in {row[0] for row in db.execute(
+            "select name from sqlite_master;")}
+    pool.close()
+
+
+def test_pool_migration_failures(tmp_path, monkeypatch):
+    import edictor.db
+
+    failures = []
+
+    def fail(db):
+        raise sqlite3.OperationalError(failures.pop(0))
+
+    # locked databases are migrated with the next request
+    monkeypatch.setattr(edictor.db, "migrate", fail)
+    failures.append("database is locked")
+    pool = ConnectionPool(make_db(tmp_path / "locked.sqlite3"))
+    with pool.connection() as db:
+        assert db.execute("pragma user_version;").fetchone()[0] == 0
+    monkeypatch.undo()
+    with pool.connection() as db:
+        assert db.execute("pragma user_version;").fetchone()[0] == SCHEMA_VERSION
+    assert not pool.read_only
+    pool.close()
+
+    # read-only databases are used without the change log
+    monkeypatch.setattr(edictor.db, "migrate", fail)
+    failures.append("attempt to write a readonly database")
+    pool = ConnectionPool(make_db(tmp_path / "read-only.sqlite3"))
+    with pool.connection() as db:
+        assert db.execute("select VAL from germanic;").fetchone()[0] == "German"
+    with pool.connection() as db:
+        assert db.execute("pragma user_version;").fetchone()[0] == 0
+    assert pool.read_only
+    pool.close()
@@ -0,0 +1,81 @@
+"""
+Test the background jobs of the local server.
+"""
+import threading
+import time
+
+from edictor.jobs import JobQueue, JobCancelled
+
+
+def _wait(job, timeout=10):
+    start = time.time()
+    while not job.finished and time.time() - start < timeout:
+        time.sleep(0.01)
+
+
+def test_job_queue():
+    jobs = JobQueue(max_jobs=1)
+
+    def analysis(args, progress):
+        progress("one", 1, 2)
+        return args["value"]
+
+    job = jobs.submit("test", analysis, {"value": "done"})
+    _wait(job)
+    assert job.status == "done"
+    assert job.result == "done"
+    assert job.info()["stage"] == "one"
+    assert jobs.get(job.id) is job
+    assert jobs.get("missing") is None
+
+    def broken(args, progress):
+        raise ValueError("broken")
+
+    job = jobs.submit("test", broken, {})
+    _wait(job)
+    assert job.status == "failed"
+    assert job.error == "broken"
+
+
+def test_job_cancel():
+    jobs = JobQueue(max_jobs=1)
+    started, release = threading.Event(), threading.Event()
+
+    def analysis(args, progress):
+        progress("first")
+        started.set()
+        release.wait(10)
+        progress("second")
+        return "never"
+
+    running = jobs.submit("test", analysis, {})
+    queued = jobs.submit("test", analysis, {})
+    started.wait(10)
+    # the cap of one job keeps the second job in the queue
+    assert queued.status == "queued"
+    jobs.cancel(queued.id)
+    jobs.cancel(running.id)
+    release.set()
+    _wait(running)
+    assert running.status == "cancelled"
+    assert queued.status == "cancelled"
+    assert running.result is None
+
+    job = jobs.submit("test", analysis, {})
+    job.cancel()
+    try:
+        job.progress("stage")
+    except JobCancelled:
+        pass
+    else:
+        assert False
+
+
+def test_job_prune():
+    jobs = JobQueue(max_jobs=2, keep=2)
+    for i in range(5):
+        _wait(jobs.submit("test", lambda args, progress: "", {}))
+    jobs.submit("test", lambda args, progress: "", {})
+    assert len(jobs.jobs) <= 3
+    jobs.configure(3)
+    assert jobs.max_jobs == 3
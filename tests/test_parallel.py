@@ -0,0 +1,52 @@
+"""
+Test the distribution of analyses across processes.
+"""
+from edictor.feature import _cognates
+from edictor.db import close_pools
+from edictor.parallel import (
+        get_workers, shard, process_map, start_method, PROCESSES)
+
+
+def test_get_workers():
+    assert get_workers(None) == 1
+    assert get_workers("", default=2) == 2
+    assert get_workers("3") == 3
+    assert get_workers("-1") == 1
+    assert get_workers("auto") >= 1
+    assert get_workers("many") == 1
+
+
+def test_shard():
+    assert shard([], 4) == []
+    parts = shard(["aaaa", "b", "cc", "ddd"], 2)
+    assert parts == [["aaaa", "b"], ["ddd", "cc"]]
+    assert len(shard(["a", "b"], 8)) == 2
+
+
+def test_process_map():
+    assert process_map(len, [["a"], ["b", "c"]], 1) == [1, 2]
+    assert process_map(len, [["a"], ["b", "c"]], 2) == [1, 2]
+    assert start_method().get_start_method() in ("forkserver", "spawn")
+
+
+def test_process_pool():
+    # the pool of the server is started once and closed with the databases
+    PROCESSES.configure(2)
+    try:
+        assert process_map(len, [["a"], ["b", "c"]], 2) == [1, 2]
+        executor = PROCESSES.executor()
+        assert process_map(len, [["a"], ["b", "c"], []], 3) == [1, 2, 0]
+        assert PROCESSES.executor() is executor
+    finally:
+        close_pools()
+    assert PROCESSES.executor() is None
+    assert process_map(len, [["a"], ["b", "c"]], 2) == [1, 2]
+
+
+def test_parallel_feature_cognates(wordlist):
+    rows = [
+        {"idx": idx, "doculect": doculect, "concept": concept,
+         "tokens": tokens.split()}
+        for idx, doculect, concept, tokens in (
+            line.split("\t") for line in wordlist(6))]
+    assert _cognates(rows, workers=1) == _cognates(rows, workers=3)
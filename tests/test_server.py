@@ -1,5 +1,7 @@
 from edictor.server import Handler
+from edictor.util import edictor_path
 import tempfile
+import shutil
 import os
 
 class FileLike:
@@ -37,6 +39,10 @@ def test_Handler():
     wd = os.getcwd()
     with tempfile.TemporaryDirectory() as t:
         os.chdir(t)
+        # databases in the working folder are used before those of the
+        # application, which are thus not migrated by the tests
+        os.mkdir("sqlite")
+        shutil.copy(edictor_path("sqlite", "germanic.sqlite3"), "sqlite")
         han = Handler(Tester(), "https://localhost:1234", "")
         for fn, path in [
                 ("/", ""),
@@ -75,3 +81,164 @@ def test_Handler():
                 han.do_POST()
         os.chdir(wd)
 
+
+def test_get_server(monkeypatch, tmp_path):
+    import threading
+    import time
+    import urllib.request
+    from pathlib import Path
+    import edictor.server
+    from edictor.server import get_server, PooledHTTPServer
+    from edictor.util import send_response
+
+    release = threading.Event()
+
+    def slow(s, query, qtype):
+        release.wait(10)
+        send_response(s, "done")
+
+    monkeypatch.setattr(edictor.server, "cognates", slow)
+    shutil.copy(Path(__file__).parent / "data" / "germanic.sqlite3", tmp_path)
+    monkeypatch.setattr(
+            edictor.server, "CONF", {"sqlite": str(tmp_path), "user": "unknown"})
+
+    httpd = get_server(0, workers=4, address="127.0.0.1")
+    assert isinstance(httpd, PooledHTTPServer)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{0}".format(httpd.server_address[1])
+    try:
+        slow_request = threading.Thread(
+                target=lambda: urllib.request.urlopen(
+                    url + "/cognates.py", data=b"wordlist=", timeout=15).read(),
+                daemon=True)
+        slow_request.start()
+        time.sleep(0.2)
+        start = time.time()
+        data = urllib.request.urlopen(
+                url + "/triples/triples.py?file=germanic&remote_dbase=germanic"
+                "&doculects=German", timeout=5).read()
+        assert data[:2] == b"ID"
+        assert time.time() - start < 5
+        assert slow_request.is_alive()
+    finally:
+        release.set()
+        httpd.shutdown()
+        httpd.server_close()
+
+    httpd = get_server(0, workers=1, address="127.0.0.1")
+    assert not isinstance(httpd, PooledHTTPServer)
+    httpd.server_close()
+
+
+def test_events(monkeypatch, tmp_path):
+    import shutil
+    import threading
+    import time
+    import urllib.request
+    import urllib.error
+    from pathlib import Path
+    import edictor.server
+    import edictor.util
+    from edictor.server import get_server
+    from edictor.db import close_pools
+
+    shutil.copy(
+        Path(__file__).parent / "data" / "germanicm.sqlite3",
+        tmp_path / "germanic.sqlite3")
+    monkeypatch.setattr(
+            edictor.server, "CONF", {"sqlite": str(tmp_path), "user": "edictor"})
+
+    # live updates need a concurrent server
+    httpd = get_server(0, workers=1, address="127.0.0.1")
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{0}".format(httpd.server_address[1])
+    try:
+        urllib.request.urlopen(
+            url + "/triples/events.py?file=germanic&remote_dbase=germanic",
+            timeout=5)
+        assert False
+    except urllib.error.HTTPError as e:
+        assert e.code == 503
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    httpd = get_server(0, workers=4, address="127.0.0.1")
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{0}".format(httpd.server_address[1])
+    try:
+        stream = urllib.request.urlopen(
+            url + "/triples/events.py?file=germanic&remote_dbase=germanic"
+            "&timeout=10", timeout=10)
+        assert stream.headers["Content-type"].startswith("text/event-stream")
+        assert stream.readline() == b"retry: 1000\n"
+        urllib.request.urlopen(
+            url + "/triples/update.py",
+            data=b"update=true&file=germanic&remote_dbase=germanic&ids=42"
+            b"&cols=NOTE&vals=live", timeout=5).read()
+        lines = []
+        while b"data: 42\tNOTE\tlive\n" not in lines:
+            lines.append(stream.readline())
+        assert b"event: update\n" in lines
+        event_id = [line for line in lines if line.startswith(b"id: ")][-1]
+        stream.close()
+
+        # reconnecting clients receive the changes they missed
+        urllib.request.urlopen(
+            url + "/triples/update.py",
+            data=b"delete=true&file=germanic&remote_dbase=germanic&ID=42",
+            timeout=5).read()
+        request = urllib.request.Request(
+            url + "/triples/events.py?file=germanic&remote_dbase=germanic"
+            "&timeout=1",
+            headers={"Last-Event-ID": event_id[4:].decode("utf-8").strip()})
+        data = urllib.request.urlopen(request, timeout=10).read()
+        assert b"event: delete\n" in data
+        assert b"data: 42\tNOTE\t\n" in data
+        assert b"data: 42\tNOTE\tlive\n" not in data
+
+        # malformed identifiers start with the next change
+        request = urllib.request.Request(
+            url + "/triples/events.py?file=germanic&remote_dbase=germanic"
+            "&timeout=0",
+            headers={"Last-Event-ID": "none"})
+        assert urllib.request.urlopen(request, timeout=10).read() == \
+            b"retry: 1000\n\n"
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        # open streams end once the databases are closed
+        close_pools()
+
+    # streams do not occupy the workers, and their timeout is capped
+    monkeypatch.setattr(edictor.util, "EVENT_TIMEOUT", 2)
+    httpd = get_server(0, workers=2, address="127.0.0.1")
+    httpd.streams = 2
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    url = "http://127.0.0.1:{0}".format(httpd.server_address[1])
+    try:
+        start = time.time()
+        streams = [
+            urllib.request.urlopen(
+                url + "/triples/events.py?file=germanic&remote_dbase=germanic"
+                "&timeout=3600", timeout=10)
+            for i in range(2)]
+        try:
+            urllib.request.urlopen(
+                url + "/triples/events.py?file=germanic&remote_dbase=germanic",
+                timeout=5)
+            assert False
+        except urllib.error.HTTPError as e:
+            assert e.code == 503
+        for i in range(3):
+            data = urllib.request.urlopen(
+                url + "/triples/triples.py?file=germanic&remote_dbase=germanic",
+                timeout=5).read()
+            assert data[:2] == b"ID"
+        for stream in streams:
+            assert stream.read().startswith(b"retry: 1000\n")
+        assert time.time() - start < 10
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+        close_pools()
@@ -0,0 +1,85 @@
+"""
+Test the cache of the static files of the application.
+"""
+import gzip
+import os
+import socket
+import threading
+
+from edictor.static import StaticCache, cache_control, sendfile
+
+
+def test_cache_control():
+    assert cache_control("/js/vendor/jquery-ui.js").startswith("public")
+    assert cache_control("/css/bootstrap.min.css").startswith("public")
+    assert cache_control("/fonts/glyphicons-halflings-regular.woff").startswith(
+        "public")
+    assert cache_control("/js/wordlist.js") == "no-cache"
+    assert cache_control("/index.html") == "no-cache"
+
+
+def stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def test_static_cache(tmp_path):
+    cache = StaticCache(max_bytes=5000, max_file=3000)
+    path = tmp_path / "a.js"
+    path.write_text("a" * 2000)
+    assert cache.get(path, stamp(path)) == b"a" * 2000
+    assert cache.get(path, stamp(path)) == b"a" * 2000
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert gzip.decompress(cache.get(path, stamp(path), "gzip")) == b"a" * 2000
+    assert cache.get(path, stamp(path), "gzip")
+    assert cache.hits == 2
+
+    # modified files are read again
+    path.write_text("b" * 2000)
+    os.utime(path, ns=(0, 10 ** 9))
+    assert cache.get(path, stamp(path)) == b"b" * 2000
+    assert cache.size == 2000
+
+    # large files are not kept, and old entries are evicted
+    large = tmp_path / "large.js"
+    large.write_text("c" * 4000)
+    assert cache.get(large, stamp(large)) == b"c" * 4000
+    assert cache.size == 2000
+    for name in "def":
+        other = tmp_path / (name + ".js")
+        other.write_text(name * 2000)
+        cache.get(other, stamp(other))
+    assert cache.size <= 5000
+    assert str(path) not in cache._entries
+    cache.clear()
+    assert cache.size == 0
+
+
+class SocketHandler:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.wfile = connection.makefile("wb", buffering=0)
+
+
+def test_sendfile(tmp_path):
+    path = tmp_path / "font.woff"
+    path.write_bytes(os.urandom(200000))
+    assert not sendfile(object(), path, 200000)
+
+    server, client = socket.socketpair()
+    received = []
+
+    def read():
+        data = b""
+        while len(data) < 200000:
+            data += client.recv(65536)
+        received.append(data)
+
+    thread = threading.Thread(target=read)
+    thread.start()
+    assert sendfile(SocketHandler(server), path, 200000)
+    thread.join()
+    assert received[0] == path.read_bytes()
+    server.close()
+    client.close()
@@ -0,0 +1,169 @@
+"""
+Test the random access to the rows of TSV files.
+"""
+import os
+import sqlite3
+from array import array
+
+from edictor import tsv
+from edictor.tsv import (
+    LineIndex, SortIndex, TsvReader, line_index, literals, sidecar, sort_key,
+    INDEXES)
+
+
+def make_tsv(path, rows=100):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ID\tDOCULECT\tCONCEPT\n")
+        for i in range(1, rows + 1):
+            f.write("{0}\t{1}\tconcept-{2}\n".format(
+                i, ["German", "Dutch", "Gótico"][i % 3], i % 10))
+    return path
+
+
+def test_tsv_reader(tmp_path):
+    path = tmp_path / "test.tsv"
+    path.write_bytes(b"ID\tDOCULECT\tNOTE\r\n1\tGerman\r\n2\tDutch\tx\ty\n3")
+    with TsvReader(path) as reader:
+        assert reader.header() == ["ID", "DOCULECT", "NOTE"]
+        offsets = reader.offsets()
+        assert offsets.tolist() == [18, 28, 40, 41]
+        assert list(reader.cells([2, 0], offsets[0], offsets[-1])) == [
+            ["", "1"], ["x", "2"], ["", "3"]]
+        assert list(reader.cells([1], offsets[1], offsets[2], decode=False)) == [
+            [b"Dutch"]]
+        assert b"".join(reader.chunks(5)) == path.read_bytes()
+
+    path.write_bytes(b"")
+    with TsvReader(path) as reader:
+        assert reader.header() == [] and reader.offsets().tolist() == [0]
+        assert list(reader.cells([0], 0, 0)) == []
+
+
+def test_line_index(tmp_path, cache):
+    path = make_tsv(tmp_path / "test.tsv")
+    index = LineIndex(path)
+    assert len(index) == 100
+    assert sidecar(path, ".lines").exists()
+    assert list(index.rows([0, 99, 100], [0, 1, 2])) == [
+        ["1", "Dutch", "concept-1"], ["100", "Dutch", "concept-0"]]
+    assert index.read(2, 4) == b"3\tGerman\tconcept-3\n4\tDutch\tconcept-4\n"
+    assert list(index.rows([1], [1, 2])) == [["Gótico", "concept-2"]]
+
+    # the stored offsets are used by the next index of the same file
+    loaded = LineIndex(path)
+    assert isinstance(loaded._offsets, memoryview)
+    assert list(loaded._offsets) == list(index._offsets)
+
+    numbers = index.matches("german", lambda: list(range(2, 100, 3)))
+    assert index.matches("german", None) is numbers
+    assert list(index.rows(range(98, 200), [0]))[-1] == ["100"]
+
+    # modified files are indexed again
+    assert line_index(path) is line_index(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("101\tGerman\tconcept-1")
+    os.utime(path, ns=(0, 10 ** 9))
+    index = line_index(path)
+    assert len(index) == 101
+    assert list(index.rows([100], [0, 1, 2])) == [["101", "German", "concept-1"]]
+    assert LineIndex(path)._offsets.tolist() == index._offsets.tolist()
+    INDEXES.clear()
+
+
+def test_value_index(tmp_path, cache):
+    path = make_tsv(tmp_path / "test.tsv")
+    header = ["ID", "DOCULECT", "CONCEPT"]
+    values = line_index(path).values
+    assert list(values.find(header, {"DOCULECT": ["german"]})) == list(
+        range(2, 100, 3))
+    assert values.columns() == {"DOCULECT", "CONCEPT"}
+    assert list(values.find(header, {
+        "DOCULECT": ["GERMAN", "dutch"], "CONCEPT": ["concept-3"]})) == [
+            2, 12, 32, 42, 62, 72, 92]
+    assert list(values.find(header, {"NOTE": ["x"]})) == []
+    assert list(values.find(header, {"ID": ["7"]}, extra=["id"])) == [6]
+    assert values.columns() == {"DOCULECT", "CONCEPT", "ID"}
+
+    # the stored index is discarded when the file changes
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("101\tGerman\tconcept-1\n")
+    os.utime(path, ns=(0, 10 ** 9))
+    values = line_index(path).values
+    assert values.find(header, {"DOCULECT": ["german"]})[-1] == 100
+    db = sqlite3.connect(values.path)
+    assert db.execute("select distinct COL from postings;").fetchall() == [
+        ("CONCEPT",), ("DOCULECT",)]
+    db.close()
+    INDEXES.clear()
+
+
+def test_sort_index(tmp_path, cache, monkeypatch):
+    path = make_tsv(tmp_path / "test.tsv")
+    header = ["ID", "DOCULECT", "CONCEPT"]
+    with open(path, encoding="utf-8") as f:
+        rows = [line.rstrip("\n").split("\t") for line in f][1:]
+
+    def expected(key):
+        return sorted(range(len(rows)), key=lambda i: key(rows[i]))
+
+    index = line_index(path)
+    order = index.order(header, [["concept", False], ["ID", True]])
+    assert index.order(header, [["CONCEPT", False], ["ID", True]]) is order
+    assert list(order.numbers) == expected(
+        lambda row: (row[2], -int(row[0])))
+    assert list(order.arrange([5, 1, 3, 2])) == sorted(
+        [5, 1, 3, 2], key=list(order.numbers).index)
+    # numbers are compared by value, and equal values keep the file order
+    assert list(index.order(header, [["ID", True]]).numbers) == list(
+        range(99, -1, -1))
+    assert list(index.order(header, [["DOCULECT", False]]).numbers) == expected(
+        lambda row: row[1].lower())
+    assert list(index.order(header, [["NOTE", False]]).numbers) == list(
+        range(100))
+
+    cells = ["ab", "10", "B", "abc", "2", "Ab"]
+    assert sorted(cells, key=sort_key) == ["2", "10", "ab", "Ab", "abc", "B"]
+    assert sorted(cells, key=lambda cell: sort_key(cell, True)) == [
+        "B", "abc", "ab", "Ab", "10", "2"]
+
+    # large files are sorted in runs, which are merged
+    sort = [["DOCULECT", True], ["CONCEPT", False]]
+    numbers = sorted(range(len(rows)), key=lambda i: rows[i][2])
+    numbers.sort(key=lambda i: rows[i][1], reverse=True)
+    assert list(index.order(header, sort).numbers) == numbers
+    monkeypatch.setattr(tsv, "SORT_SIZE", 100)
+    with TsvReader(path) as reader:
+        assert len(list(SortIndex(index, header, sort)._runs(reader))) > 10
+    SortIndex(index, header, sort).path.unlink()
+    order = SortIndex(index, header, sort)
+    assert isinstance(order.numbers, array)
+    assert list(order.numbers) == numbers
+    assert list(order.ranks) == [numbers.index(i) for i in range(100)]
+    INDEXES.clear()
+
+
+def test_trigram_index(tmp_path, cache, monkeypatch):
+    path = tmp_path / "test.tsv"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ID\tDOCULECT\tFORM\tNOTE\n")
+        for i in range(1, 201):
+            f.write("{0}\t{1}\tform-{0}\t{2}\n".format(
+                i, ["German", "Dutch"][i % 2], "Vowel Shift" if i % 50 else ""))
+    header = ["ID", "DOCULECT", "FORM", "NOTE"]
+    monkeypatch.setattr(tsv, "GRAM_ROWS", 64)
+    grams = line_index(path).grams
+
+    assert literals("ab[cd]ef+g") == ["ab", "e", "g"]
+    assert literals("a|bc") == []
+    hits = grams.search(header, ["form"], "RM-12")
+    assert grams.columns() == {"FORM"}
+    assert list(hits["FORM"]) == [11] + list(range(119, 129))
+    # regular expressions without three known characters check all cells
+    hits = grams.search(header, ["FORM", "NOTE"], r"-1\d$", regex=True)
+    assert list(hits["FORM"]) == list(range(9, 19))
+    assert len(hits["NOTE"]) == 0
+    hits = grams.search(header, [], "shift")
+    assert list(hits) == ["FORM", "NOTE"] and len(hits["NOTE"]) == 196
+    assert grams.candidates("NOTE", {"shi", "ift"}).tolist() == [
+        i - 1 for i in range(1, 201) if i % 50]
+    INDEXES.clear()
@@ -3,16 +3,29 @@ Test the util module of the edictor package.
 """
 from pathlib import Path
 from pytest import raises
+import edictor.db
+import edictor.parallel
+import edictor.util
+from edictor.db import migrate
+from edictor.static import STATIC
 from edictor.util import (
         opendb, edictor_path, configuration, file_name,
         file_type, file_handler, serve_base, 
         download, new_id, cognates, patterns, alignments, triples,
-        modifications, update, parse_args, parse_post,
-        send_response, handle_args, check
+        modifications, update, parse_args, parse_post, select_triples,
+        update_cells, update_summary, changes,
+        send_response, handle_args, check, distances,
+        job_status, job_result, job_cancel, cache_stats, server_page,
+        server_export, server_search, send_chunks, refresh_snapshot
         )
 import os
 import tempfile
 import json
+import shutil
+import sqlite3
+import time
+import gzip
+import urllib.parse
 
 try:
     from lingpy.compare.partial import Partial
@@ -53,6 +66,10 @@ class Sender:
         pass
     
 
+def wordlist_query(lines):
+    return "wordlist=" + urllib.parse.quote("\n".join(lines) + "\n")
+
+
 def test_opendb():
 
     os.chdir(Path(__file__).parent)
@@ -192,7 +209,7 @@ def test_serve_base():
             )
 
 
-def test_cognates():
+def test_cognates(wordlist):
     if not with_lingpy:
         return
 
@@ -209,6 +226,78 @@ def test_cognates():
 
     cognates(s, data, "POST")
 
+    lines = wordlist(12)
+    data = wordlist_query(lines)
+    cognates(s, data + "&mode=full&method=lexstat&runs=10", "POST")
+    assert len(s.wfile.written.split(b"\n")) == len(lines) + 1
+    cognates(s, data + "&mode=partial&method=lexstat&runs=10", "POST")
+    assert len(s.wfile.written.split(b"\n")) == len(lines) + 1
+
+
+def test_incremental_cognates(wordlist):
+    if not with_lingpy:
+        return
+
+    s = Sender()
+    rows = wordlist(3)
+    concepts = {}
+    for row in rows:
+        concepts.setdefault(row.split("\t")[2], []).append(row.split("\t")[0])
+    first, second, third = concepts.values()
+    for mode in ["full", "partial"]:
+        query = "&mode=" + mode + "&incremental=true&session=test"
+        cognates(s, wordlist_query(rows) + "&mode=" + mode, "POST")
+        full = s.wfile.written
+        cognates(s, wordlist_query(rows) + query, "POST")
+        assert s.wfile.written == full
+        highest = max(
+            int(cogid) for line in full.decode("utf-8").split("\n") if line
+            for cogid in line.split("\t")[1].split())
+
+        # nothing changed, nothing to report
+        cognates(s, wordlist_query(rows) + query, "POST")
+        assert s.wfile.written == b""
+
+        changed = [
+            row + " a" if row.split("\t")[0] == second[1] else row
+            for row in rows]
+        cognates(s, wordlist_query(changed) + query, "POST")
+        lines = s.wfile.written.decode("utf-8").split("\n")[:-1]
+        assert [line.split("\t")[0] for line in lines] == second
+        assert min(
+            int(cogid) for line in lines
+            for cogid in line.split("\t")[1].split()) > highest
+
+        # concepts missing from a request keep their identifiers reserved
+        query = "&mode=" + mode + "&incremental=true&session=subset"
+        cognates(s, wordlist_query(rows) + query, "POST")
+        cognates(s, wordlist_query(rows[:len(first)]) + query, "POST")
+        assert s.wfile.written == b""
+        cognates(s, wordlist_query(rows) + query, "POST")
+        lines = s.wfile.written.decode("utf-8").split("\n")[:-1]
+        assert [line.split("\t")[0] for line in lines] == second + third
+        assert min(
+            int(cogid) for line in lines
+            for cogid in line.split("\t")[1].split()) > highest
+
+
+def test_parallel_cognates(wordlist):
+    if not with_lingpy:
+        return
+
+    s = Sender()
+    data = wordlist_query(wordlist(6))
+    for mode in ["full", "partial"]:
+        outputs = []
+        for workers in ["1", "2"]:
+            cognates(
+                s, data + "&mode=" + mode + "&cache=false&workers=" + workers,
+                "POST")
+            outputs.append(s.wfile.written)
+        # identifiers do not depend on the number of processes
+        assert outputs[0] == outputs[1]
+        assert outputs[0].split(b"\n")[0].split(b"\t")[1].split()[0] == b"1"
+
 
 def test_alignments():
 
@@ -229,6 +318,78 @@ def test_alignments():
     alignments(s, data, "POST")
 
 
+def test_cache_stats(wordlist):
+    if not with_lingpy:
+        return
+
+    s = Sender()
+    data = wordlist_query(wordlist(1)) + "&mode=full"
+    cognates(s, data, "POST")
+    first = s.wfile.written
+    cognates(s, data, "POST")
+    assert s.wfile.written == first
+    cache_stats(s, "", "POST")
+    stats = json.loads(s.wfile.written)
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    cache_stats(s, "?clear=true", "GET")
+    assert json.loads(s.wfile.written)["entries"] == 0
+
+
+def test_parallel_alignments(wordlist):
+    if not with_lingpy:
+        return
+
+    s = Sender()
+    rows = wordlist(3, ("DOCULECT", "CONCEPT", "TOKENS", "COGID"))
+    data = wordlist_query(rows)
+    for method in ["library", "progressive", "nw"]:
+        outputs = []
+        for workers in ["1", "2"]:
+            alignments(
+                s, data + "&mode=full&cache=false&method=" + method +
+                "&workers=" + workers, "POST")
+            outputs.append(s.wfile.written)
+        assert outputs[0] == outputs[1]
+        assert [line.split("\t")[0] for line in
+                outputs[1].decode("utf-8").split("\n")[:-1]] == \
+            [row.split("\t")[0] for row in rows]
+
+    data = "wordlist=1\tA\tA\tm a %2B m a\t1 2\n" + \
+        "2\tB\tA\tm u\t1\n" + \
+        "3\tC\tA\tm a\t2\n" + \
+        "4\tA\tB\tk a l\t3\n"
+    outputs = []
+    for workers in ["1", "2"]:
+        alignments(
+            s, data + "&mode=partial&cache=false&workers=" + workers, "POST")
+        outputs.append(s.wfile.written)
+    assert outputs[0] == outputs[1]
+
+
+def test_parallel_alignments_start_method(monkeypatch, wordlist):
+    if not with_lingpy:
+        return
+
+    contexts = []
+    executor = edictor.parallel.ProcessPoolExecutor
+
+    def pool(*args, **kw):
+        contexts.append(kw.get("mp_context"))
+        return executor(*args, **kw)
+
+    monkeypatch.setattr(edictor.parallel, "ProcessPoolExecutor", pool)
+    s = Sender()
+    rows = wordlist(2, ("DOCULECT", "CONCEPT", "TOKENS", "COGID"))
+    alignments(
+        s, wordlist_query(rows) +
+        "&mode=full&cache=false&method=library&workers=2", "POST")
+    assert len(s.wfile.written.split(b"\n")) == len(rows) + 1
+    assert contexts
+    assert all(context.get_start_method() in {"forkserver", "spawn"}
+               for context in contexts)
+
+
 def test_patterns():
 
     if not with_lingrex:
@@ -248,7 +409,55 @@ def test_patterns():
     patterns(s, data, "POST")
 
 
-def test_new_id():
+def test_distances(wordlist):
+    if not with_lingpy:
+        return
+
+    s = Sender()
+    distances(s, "wordlist=", "POST")
+    assert b"Missing wordlist" in s.wfile.written
+    distances(s, wordlist_query(wordlist(3)) + "&tree=upgma", "POST")
+    assert sorted(json.loads(s.wfile.written)["taxa"]) == [
+        "Dutch", "English", "German", "Proto-Germanic"]
+
+
+def test_jobs(wordlist):
+    if not with_lingpy:
+        return
+
+    s = Sender()
+    lines = wordlist(1)
+    data = wordlist_query(lines) + "&mode=full&job=true"
+    cognates(s, data, "POST")
+    job = json.loads(s.wfile.written)
+    assert job["status"] in ["queued", "running", "done"]
+
+    for i in range(200):
+        job_status(s, "id=" + job["id"], "POST")
+        if json.loads(s.wfile.written)["status"] == "done":
+            break
+        time.sleep(0.05)
+    job_result(s, "id=" + job["id"], "POST")
+    assert len(s.wfile.written.decode("utf-8").split("\n")) == len(lines) + 1
+
+    job_cancel(s, "id=" + job["id"], "POST")
+    assert json.loads(s.wfile.written)["status"] == "done"
+    job_status(s, "id=unknown", "POST")
+    assert b"Unknown job" in s.wfile.written
+
+    alignments(
+        s, "wordlist=1\tA\tA\tm a m a\t1\n&mode=partial&method=sw&job=1",
+        "POST")
+    job = json.loads(s.wfile.written)
+    for i in range(200):
+        job_result(s, "?id=" + job["id"], "GET")
+        if b"failed" in s.wfile.written:
+            break
+        time.sleep(0.05)
+    assert b"Unsupported alignment method" in s.wfile.written
+
+
+def test_new_id(databases):
 
     s = Sender()
 
@@ -277,7 +486,7 @@ def test_new_id():
         )
 
 
-def test_triples():
+def test_triples(databases):
 
     s = Sender()
 
@@ -318,7 +527,147 @@ def test_triples():
     assert s.wfile.written[:2] == b"ID"
 
 
-def test_modifications():
+class Collector:
+
+    def __init__(self):
+
+        self.data = b""
+
+    def write(self, x):
+
+        self.data += x
+
+
+class StreamSender(Sender):
+
+    request_version = "HTTP/1.1"
+
+    def __init__(self):
+
+        self.wfile = Collector()
+        self.headers = {}
+
+    def send_header(self, x, y):
+
+        self.headers[x] = y
+
+
+def dechunk(data):
+    out = b""
+    while True:
+        size, data = data.split(b"\r\n", 1)
+        size = int(size, 16)
+        if not size:
+            assert data == b"\r\n"
+            return out
+        out += data[:size]
+        assert data[size:size + 2] == b"\r\n"
+        data = data[size + 2:]
+
+
+def reference_triples(path, table, columns, concepts, doculects):
+    # the algorithm of triples() before the output was streamed, the tables
+    # are scanned in their order, regardless of the indexes
+    db = sqlite3.connect(path)
+    cursor = db.cursor()
+    if not columns:
+        cols = [x[0] for x in cursor.execute(
+            'select distinct col from ' + table + ' not indexed;')]
+    else:
+        cols = columns
+    text = 'ID\t' + '\t'.join(cols) + '\n'
+    if not concepts and not doculects:
+        idxs = [x[0] for x in cursor.execute(
+            'select distinct ID from ' + table + ' not indexed;')]
+    else:
+        cidxs, didxs = [], []
+        if concepts:
+            cidxs = [x[0] for x in cursor.execute(
+                'select distinct ID from ' + table + ' not indexed '
+                'where COL = "CONCEPT" '
+                'and VAL in ("' + '","'.join(concepts) + '")')]
+        if doculects:
+            didxs = [x[0] for x in cursor.execute(
+                'select distinct ID from ' + table + ' not indexed '
+                'where COL = "DOCULECT" '
+                'and VAL in ("' + '","'.join(doculects) + '")')]
+        if cidxs and didxs:
+            idxs = [idx for idx in cidxs if idx in didxs]
+        else:
+            idxs = cidxs or didxs
+    D = {}
+    for a, b, c in cursor.execute('select * from ' + table + ' not indexed;'):
+        if c not in ['-', '']:
+            D.setdefault(a, {})[b] = c
+    for idx in idxs:
+        text += str(idx) + "".join(
+            "\t" + D.get(idx, {}).get(col, "") for col in cols) + "\n"
+    db.close()
+    return text.encode("utf-8")
+
+
+def test_triples_streamed(tmp_path):
+
+    # the pool migrates the database, so the fixture is copied
+    data = tmp_path
+    shutil.copy(Path(__file__).parent / "data" / "germanic.sqlite3", data)
+    for columns, concepts, doculects in [
+            ([], [], []),
+            ([], [], ["German"]),
+            ([], [], ["German", "Dutch"]),
+            ([], ["*bainan", "*bakanan"], []),
+            ([], ["*bainan", "*bakanan"], ["German", "English"]),
+            (["ID", "DOCULECT", "CONCEPT", "TOKENS", "COGID"], [], []),
+            (["DOCULECT", "NOTE"], [], ["Gothic"]),
+            ]:
+        s = StreamSender()
+        triples(
+            s,
+            "file=germanic&remote_dbase=germanic&columns={0}&concepts={1}"
+            "&doculects={2}".format(
+                "%7C".join(columns), "%7C".join(concepts),
+                "%7C".join(doculects)),
+            "POST",
+            {"sqlite": str(data)})
+        assert s.headers["Transfer-Encoding"] == "chunked"
+        assert dechunk(s.wfile.data) == reference_triples(
+            data / "germanic.sqlite3", "germanic", columns, concepts, doculects)
+
+    # clients using HTTP/1.0 receive the plain content
+    s = StreamSender()
+    s.request_version = "HTTP/1.0"
+    triples(s, "file=germanic&remote_dbase=germanic", "POST", {"sqlite": str(data)})
+    assert "Transfer-Encoding" not in s.headers
+    assert s.wfile.data == reference_triples(
+        data / "germanic.sqlite3", "germanic", [], [], [])
+
+
+def test_select_triples():
+
+    db, cursor = opendb("germanic", {"sqlite": str(Path(__file__).parent / "data")})
+    concepts = ["*bainan", "*bakanan"]
+    rows = list(select_triples(
+        db, "germanic", ["DOCULECT", "CONCEPT"], concepts=concepts))
+    assert {row[2] for row in rows} == set(concepts)
+    assert [int(row[0]) for row in rows] == sorted(int(row[0]) for row in rows)
+
+    # filters are intersected
+    both = list(select_triples(
+        db, "germanic", ["DOCULECT", "CONCEPT"], concepts=concepts,
+        doculects=["German", "English"]))
+    assert both == [row for row in rows if row[1] in ["German", "English"]]
+    assert not list(select_triples(
+        db, "germanic", ["DOCULECT"], concepts=["unknown"],
+        doculects=["German"]))
+
+    # missing columns are empty
+    assert list(select_triples(
+        db, "germanic", ["UNKNOWN"], concepts=concepts))[0][1] == ""
+    raises(ValueError, select_triples, db, "germanic where 1", [])
+    db.close()
+
+
+def test_modifications(databases):
 
     s = Sender()
 
@@ -334,7 +683,7 @@ def test_modifications():
     modifications(s, "file=germanic", "POST", {})
 
 
-def test_update():
+def test_update(databases):
     s = Sender()
     # modify entries
     update(
@@ -364,3 +713,604 @@ def test_update():
         "POST",
         {"sqlite": "data", "remote_dbase": "germanicm", "user": "edictor"}
     )
+
+    # values are passed as parameters, quotes are stored unchanged
+    update(
+        s,
+        "update=true&file=germanic&remote_dbase=germanicm&ids=42&cols=NOTE&"
+        "vals=a %22quoted%22 note",
+        "POST",
+        {"sqlite": "data", "remote_dbase": "germanicm", "user": "edictor"}
+    )
+    db, cursor = opendb("germanicm", {"sqlite": "data"})
+    assert cursor.execute(
+        "select VAL from germanic where ID = 42 and COL = 'NOTE';"
+    ).fetchone()[0] == 'a "quoted" note'
+    db.close()
+    update(
+        s,
+        "update=true&file=germanic&remote_dbase=germanicm&ids=42&cols=NOTE&vals=exc",
+        "POST",
+        {"sqlite": "data", "remote_dbase": "germanicm", "user": "edictor"}
+    )
+    raises(
+        ValueError, update, s,
+        "update=true&file=germanic;&remote_dbase=germanicm&ids=42&cols=NOTE&vals=exc",
+        "POST",
+        {"sqlite": "data", "remote_dbase": "germanicm", "user": "edictor"})
+
+
+def test_update_cells(tmp_path):
+
+    path = tmp_path / "germanic.sqlite3"
+    shutil.copy(Path(__file__).parent / "data" / "germanicm.sqlite3", path)
+    conf = {"sqlite": str(tmp_path), "user": "edictor"}
+    db = sqlite3.connect(path)
+    backups = db.execute("select count(*) from backup;").fetchone()[0]
+    notes = dict(db.execute(
+        "select ID, VAL from germanic where COL = 'NOTE';").fetchall())
+    db.close()
+    idxs = sorted(notes)[:3]
+
+    s = Sender()
+    update(
+        s,
+        "update=true&file=germanic&remote_dbase=germanic&ids={0}&cols={1}&"
+        "vals={2}".format(
+            "|||".join(str(idx) for idx in idxs + [idxs[0], 99999]),
+            "|||".join(["NOTE"] * 4 + ["DOCULECT"]),
+            "|||".join(["a", "b", "c", "d", "German"])),
+        "POST",
+        conf)
+    message = s.wfile.written.decode("utf-8").split("\n")
+    assert message[0].startswith("UPDATE: Modification successful for 4 cells")
+    assert message[1].startswith("INSERTION: Successfully inserted 1 cells")
+
+    db = sqlite3.connect(path)
+    assert db.execute(
+        "select VAL from germanic where COL = 'NOTE' and ID = ?;",
+        (idxs[0],)).fetchone()[0] == "d"
+    assert db.execute(
+        "select VAL from germanic where COL = 'DOCULECT' and ID = 99999;"
+    ).fetchone()[0] == "German"
+    backup = db.execute(
+        "select ID, VAL from backup order by rowid desc limit 5;").fetchall()
+    assert db.execute("select count(*) from backup;").fetchone()[0] == backups + 5
+    # each backup stores the value that was replaced
+    assert backup[::-1] == [
+        (idxs[0], notes[idxs[0]]), (idxs[1], notes[idxs[1]]),
+        (idxs[2], notes[idxs[2]]), (idxs[0], "a"), (99999, "!newvalue!")]
+    db.close()
+
+    # tables without a unique index are updated without an UPSERT
+    db = sqlite3.connect(":memory:")
+    db.execute("create table germanic (ID int, COL text, VAL text);")
+    db.execute(
+        "create table backup (FILE text, ID int, COL text, VAL text, "
+        "DATE text, user text);")
+    db.execute("insert into germanic values (1, 'NOTE', 'a');")
+    migrate(db)
+    db.execute("drop index germanic_id_col;")
+    changes = update_cells(
+        db, "germanic", [(1, "NOTE", "b"), (2, "NOTE", "c"), (2, "NOTE", "d")],
+        "edictor")
+    assert changes == [
+        (1, "NOTE", "a", "b"), (2, "NOTE", None, "c"), (2, "NOTE", "c", "d")]
+    assert db.execute(
+        "select ID, COL, VAL from germanic order by ID;").fetchall() == [
+            (1, "NOTE", "b"), (2, "NOTE", "d")]
+    assert update_summary(changes[:1], "now").startswith("UPDATE")
+    assert update_summary(changes[1:2], "now").startswith("INSERTION")
+
+
+def test_changes(tmp_path):
+
+    shutil.copy(
+        Path(__file__).parent / "data" / "germanicm.sqlite3",
+        tmp_path / "germanic.sqlite3")
+    conf = {"sqlite": str(tmp_path), "user": "edictor"}
+    s = Sender()
+    changes(s, "file=germanic&remote_dbase=germanic", "POST", conf)
+    start = int(s.wfile.written.split(b"\n")[0])
+
+    update(
+        s,
+        "update=true&file=germanic&remote_dbase=germanic&ids=42|||1694|||42"
+        "&cols=NOTE|||NOTE|||NOTE&vals=a|||b|||c",
+        "POST", conf)
+    changes(
+        s, "?file=germanic&remote_dbase=germanic&since={0}".format(start),
+        "GET", conf)
+    lines = s.wfile.written.decode("utf-8").split("\n")
+    head = int(lines[0])
+    assert head == start + 3
+    assert lines[1:] == ["1694\tNOTE\tb", "42\tNOTE\tc", ""]
+
+    update(s, "delete=true&file=germanic&remote_dbase=germanic&ID=1694",
+           "POST", conf)
+    changes(
+        s, "file=germanic&remote_dbase=germanic&since={0}".format(head),
+        "POST", conf)
+    lines = s.wfile.written.decode("utf-8").split("\n")
+    assert int(lines[0]) > head
+    assert "1694\tNOTE\t" in lines
+    assert not [line for line in lines[1:] if line.startswith("42\t")]
+
+    changes(
+        s, "file=germanic&remote_dbase=germanic&since={0}".format(lines[0]),
+        "POST", conf)
+    assert s.wfile.written == lines[0].encode("utf-8") + b"\n"
+
+    # modifications report the values themselves
+    modifications(
+        s, "file=germanic&remote_dbase=germanic&date=0", "POST", conf)
+    assert "42\tNOTE\tc" in s.wfile.written.decode("utf-8").split("\n")
+
+    # remote databases have no change log
+    s = RevalidatingSender()
+    changes(
+        s, "file=germanic&remote_dbase=germanic&since=0", "POST",
+        dict(conf, remote={"germanic": {"modifications.py": {
+            "url": "http://localhost/modifications.py", "data": ""}}}))
+    assert s.status == 400
+    assert b"remote" in s.wfile.data
+
+
+def test_allocate_id(tmp_path, monkeypatch):
+
+    shutil.copy(
+        Path(__file__).parent / "data" / "germanicm.sqlite3",
+        tmp_path / "germanic.sqlite3")
+    conf = {"sqlite": str(tmp_path), "user": "edictor"}
+    s = Sender()
+
+    def allocate(column):
+        new_id(
+            s, "new_id={0}&file=germanic&remote_dbase=germanic".format(column),
+            "POST", conf)
+        return int(s.wfile.written)
+
+    first = allocate("true")
+    # identifiers are reserved
+    assert allocate("true") == first + 1
+    update(
+        s,
+        "update=true&file=germanic&remote_dbase=germanic&ids={0}&cols=NOTE"
+        "&vals=new".format(first + 10),
+        "POST", conf)
+    assert allocate("true") == first + 11
+
+    cogid = allocate("COGID")
+    assert allocate("COGID") == cogid + 1
+    update(
+        s,
+        "update=true&file=germanic&remote_dbase=germanic&ids=42&cols=COGID"
+        "&vals={0} {1}".format(cogid + 5, cogid + 6),
+        "POST", conf)
+    assert allocate("COGID") == cogid + 7
+
+    # rows written by other programs are found in the table, other columns
+    # by the modifications counted for the snapshot
+    triples(Sender(), "file=germanic&remote_dbase=germanic", "POST", conf)
+    db = sqlite3.connect(tmp_path / "germanic.sqlite3")
+    db.executemany("insert into germanic values (?, ?, ?);", [
+        (first + 50, "COGID", str(cogid + 20)), (first + 50, "NOTE", "x")])
+    db.commit()
+    db.close()
+    assert allocate("true") == first + 51
+    assert allocate("COGID") == cogid + 21
+
+    # edits made through the server are taken from the change log
+    scans = []
+    largest_id = edictor.util._largest_id
+
+    def spy(db, name, column, since=None):
+        scans.append((column, since))
+        return largest_id(db, name, column, since=since)
+
+    monkeypatch.setattr(edictor.util, "_largest_id", spy)
+    for step in range(2):
+        update(
+            s,
+            "update=true&file=germanic&remote_dbase=germanic&ids=42"
+            "&cols=COGID&vals={0}".format(cogid + 30 + step),
+            "POST", conf)
+        assert allocate("COGID") == cogid + 31 + step
+    assert scans and all(since is not None for _, since in scans)
+    monkeypatch.undo()
+
+    # read-only databases have no change log
+    folder = read_only_copy(tmp_path, monkeypatch)
+    conf = {"sqlite": str(folder)}
+    try:
+        largest = allocate("true")
+        assert allocate("true") == largest + 1
+    finally:
+        os.chmod(folder, 0o755)
+
+
+def test_snapshot_triples(tmp_path):
+
+    path = tmp_path / "germanic.sqlite3"
+    shutil.copy(Path(__file__).parent / "data" / "germanicm.sqlite3", path)
+    conf = {"sqlite": str(tmp_path), "user": "edictor"}
+
+    def load():
+        s = StreamSender()
+        triples(s, "file=germanic&remote_dbase=germanic", "POST", conf)
+        return dechunk(s.wfile.data)
+
+    assert load() == reference_triples(path, "germanic", [], [], [])
+    s = Sender()
+    update(
+        s,
+        "update=true&file=germanic&remote_dbase=germanic&ids=42|||42|||99999"
+        "&cols=NOTE|||NEWCOLUMN|||DOCULECT&vals=a|||b|||German",
+        "POST", conf)
+    update(s, "delete=true&file=germanic&remote_dbase=germanic&ID=1694",
+           "POST", conf)
+    # the snapshot was kept current by update
+    db = sqlite3.connect(path)
+    assert db.execute(
+        "select VERSION = BUILT from snapshots where FILE = 'germanic';"
+    ).fetchone()[0]
+    db.close()
+    assert load() == reference_triples(path, "germanic", [], [], [])
+    data = load().decode("utf-8").split("\n")
+    assert data[0].endswith("\tNEWCOLUMN")
+    header = data[0].split("\t")
+    assert data[-2].split("\t")[0] == "99999"
+    assert data[-2].split("\t")[header.index("DOCULECT")] == "German"
+
+    # snapshots are rebuilt after other programs modified the wordlist
+    db = sqlite3.connect(path)
+    db.execute("insert into germanic values (99998, 'DOCULECT', 'Dutch');")
+    db.commit()
+    db.close()
+    data = load()
+    assert data == reference_triples(path, "germanic", [], [], [])
+    assert b"\n99998\t" in data
+
+
+def test_snapshot_duplicate_cells(tmp_path):
+
+    path = tmp_path / "dups.sqlite3"
+    db = sqlite3.connect(path)
+    db.execute("create table wordlist (ID int, COL text, VAL text);")
+    db.executemany("insert into wordlist values (?, ?, ?);", [
+        (1, "DOCULECT", "A"), (1, "NOTE", "old"), (2, "DOCULECT", "B"),
+        (2, "NOTE", "x"), (1, "NOTE", "new"), (2, "NOTE", "")])
+    db.commit()
+    db.close()
+    conf = {"sqlite": str(tmp_path), "user": "edictor"}
+
+    def load(query=""):
+        s = StreamSender()
+        triples(s, "file=wordlist&remote_dbase=dups" + query, "POST", conf)
+        return dechunk(s.wfile.data)
+
+    # the last non-empty value of a cell is used, also in the snapshot
+    expected = b"ID\tDOCULECT\tNOTE\n1\tA\tnew\n2\tB\tx\n"
+    assert load() == expected
+    assert load("&doculects=A|B".replace("|", "%7C")) == expected
+    db = sqlite3.connect(path)
+    with db:
+        refresh_snapshot(db, "wordlist", [1], ["DOCULECT", "NOTE"])
+    db.close()
+    assert load() == expected
+
+
+class RevalidatingSender(StreamSender):
+
+    def __init__(self, **headers):
+
+        super().__init__()
+        self.headers = {key.replace("_", "-"): val for key, val in headers.items()}
+        self.sent = {}
+        self.status = None
+
+    def send_response(self, x):
+
+        self.status = x
+
+    def send_header(self, x, y):
+
+        self.sent[x] = y
+
+
+def test_not_modified(tmp_path, monkeypatch):
+
+    shutil.copy(Path(__file__).parent / "data" / "germanicm.sqlite3",
+                tmp_path / "germanic.sqlite3")
+    conf = {"sqlite": str(tmp_path), "user": "edictor"}
+    query = "file=germanic&remote_dbase=germanic"
+
+    s = RevalidatingSender()
+    triples(s, query, "POST", conf)
+    etag = s.sent["ETag"]
+    assert s.status == 200 and s.sent["Cache-Control"] == "no-cache"
+
+    s = RevalidatingSender(If_None_Match=etag)
+    triples(s, query, "POST", conf)
+    assert s.status == 304 and s.wfile.data == b""
+    s = RevalidatingSender(If_None_Match='W/"other", ' + etag)
+    triples(s, query, "POST", conf)
+    assert s.status == 304
+
+    # unchanged wordlists are confirmed without reading the triples
+    with monkeypatch.context() as m:
+        for name in ["snapshot_triples", "select_triples", "get_columns"]:
+            m.setattr(edictor.util, name, None)
+        s = RevalidatingSender(If_None_Match=etag)
+        triples(s, query, "POST", conf)
+        assert s.status == 304
+
+    # filters and edits change the entity tag
+    s = RevalidatingSender(If_None_Match=etag)
+    triples(s, query + "&doculects=German", "POST", conf)
+    assert s.status == 200 and s.sent["ETag"] != etag
+    update(Sender(), "update=true&file=germanic&remote_dbase=germanic"
+           "&ids=42&cols=NOTE&vals=a", "POST", conf)
+    s = RevalidatingSender(If_None_Match=etag)
+    triples(s, query, "POST", conf)
+    assert s.status == 200 and s.sent["ETag"] != etag
+
+    # TSV files are revalidated by their time of modification and size
+    wd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        Path("test.tsv").write_text("ID\tDOCULECT\n1\tGerman\n")
+        s = RevalidatingSender()
+        file_handler(s, "tsv", "/data/test.tsv")
+        assert s.status == 200
+        etag, modified = s.sent["ETag"], s.sent["Last-Modified"]
+        s = RevalidatingSender(If_None_Match=etag)
+        file_handler(s, "tsv", "/data/test.tsv")
+        assert s.status == 304
+        s = RevalidatingSender(If_Modified_Since=modified)
+        file_handler(s, "tsv", "/data/test.tsv")
+        assert s.status == 304
+        Path("test.tsv").write_text("ID\tDOCULECT\n1\tGerman\n2\tDutch\n")
+        s = RevalidatingSender(If_None_Match=etag)
+        file_handler(s, "tsv", "/data/test.tsv")
+        assert s.status == 200 and dechunk(s.wfile.data).endswith(b"Dutch\n")
+    finally:
+        os.chdir(wd)
+
+
+def read_only_copy(tmp_path, monkeypatch):
+    # root ignores the permissions, for which the failed migration of a
+    # read-only database is simulated
+    folder = tmp_path / "read-only"
+    folder.mkdir()
+    shutil.copy(Path(__file__).parent / "data" / "germanic.sqlite3", folder)
+    os.chmod(folder / "germanic.sqlite3", 0o444)
+    os.chmod(folder, 0o555)
+    if os.geteuid() == 0:
+        def fail(db):
+            raise sqlite3.OperationalError("attempt to write a readonly database")
+        monkeypatch.setattr(edictor.db, "migrate", fail)
+    return folder
+
+
+def test_triples_read_only(tmp_path, monkeypatch):
+
+    folder = read_only_copy(tmp_path, monkeypatch)
+    conf = {"sqlite": str(folder)}
+    try:
+        for query in ["", "&doculects=German"]:
+            s = RevalidatingSender()
+            triples(s, "file=germanic&remote_dbase=germanic" + query,
+                    "POST", conf)
+            assert s.status == 200 and "ETag" in s.sent
+            assert dechunk(s.wfile.data) == reference_triples(
+                folder / "germanic.sqlite3", "germanic", [], [],
+                ["German"] if query else [])
+    finally:
+        os.chmod(folder, 0o755)
+
+
+def test_compressed_responses(tmp_path):
+
+    data = "ID\tDOCULECT\n".encode("utf-8") * 1000
+    s = RevalidatingSender(Accept_Encoding="gzip, deflate")
+    send_response(s, data, "text/plain", encode=False)
+    assert s.sent["Content-Encoding"] == "gzip"
+    assert s.sent["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(s.wfile.data) == data
+
+    # small responses and clients without gzip receive the plain content
+    s = RevalidatingSender(Accept_Encoding="gzip")
+    send_response(s, "success")
+    assert "Content-Encoding" not in s.sent and s.wfile.data == b"success"
+    s = RevalidatingSender()
+    send_response(s, data, "application/json", encode=False)
+    assert s.wfile.data == data and s.sent["Vary"] == "Accept-Encoding"
+
+    # streamed responses are compressed as they are written
+    shutil.copy(Path(__file__).parent / "data" / "germanicm.sqlite3",
+                tmp_path / "germanic.sqlite3")
+    conf = {"sqlite": str(tmp_path), "user": "edictor"}
+    s = RevalidatingSender(Accept_Encoding="gzip")
+    triples(s, "file=germanic&remote_dbase=germanic", "POST", conf)
+    assert s.sent["ETag"].startswith('W/"')
+    assert gzip.decompress(dechunk(s.wfile.data)) == reference_triples(
+        tmp_path / "germanic.sqlite3", "germanic", [], [], [])
+    # the weak tag still revalidates the content, and is sent with the same
+    # Vary header as the content
+    etag = s.sent["ETag"]
+    s = RevalidatingSender(Accept_Encoding="gzip", If_None_Match=etag)
+    triples(s, "file=germanic&remote_dbase=germanic", "POST", conf)
+    assert s.status == 304 and s.sent["ETag"] == etag
+    assert s.sent["Vary"] == "Accept-Encoding"
+    assert "Content-Encoding" not in s.sent
+
+    # static files are sent from their compressed variants
+    s = RevalidatingSender(Accept_Encoding="gzip")
+    file_handler(s, "js", "/js/util.js")
+    assert gzip.decompress(s.wfile.data) == edictor_path("js", "util.js").read_bytes()
+    etag = s.sent["ETag"]
+    s = RevalidatingSender(Accept_Encoding="gzip", If_None_Match=etag)
+    file_handler(s, "js", "/js/util.js")
+    assert s.status == 304 and s.sent["ETag"] == etag
+    assert s.sent["Vary"] == "Accept-Encoding"
+    s = RevalidatingSender(If_None_Match=etag)
+    file_handler(s, "js", "/js/util.js")
+    assert s.status == 304 and s.sent["Vary"] == "Accept-Encoding"
+
+
+def test_static_files(tmp_path):
+
+    STATIC.clear()
+    s = RevalidatingSender()
+    file_handler(s, "js", "/js/wordlist.js")
+    assert s.sent["Cache-Control"] == "no-cache"
+    assert s.wfile.data == edictor_path("js", "wordlist.js").read_bytes()
+    hits = STATIC.hits
+    file_handler(s, "js", "/js/wordlist.js")
+    assert STATIC.hits == hits + 1
+
+    s = RevalidatingSender(If_None_Match=s.sent["ETag"])
+    file_handler(s, "js", "/js/wordlist.js")
+    assert s.status == 304
+    s = RevalidatingSender()
+    file_handler(s, "js", "/js/vendor/jquery-1.10.2.js")
+    assert s.sent["Cache-Control"].startswith("public")
+
+    # large binary files are sent with their length
+    s = RevalidatingSender()
+    file_handler(s, "png", "/img/wordlists.png")
+    data = edictor_path("img", "wordlists.png").read_bytes()
+    assert s.sent["Content-Length"] == str(len(data)) and s.wfile.data == data
+    s = RevalidatingSender()
+    file_handler(s, "png", "/img/missing.png")
+    assert s.status == 404
+
+    # the start page is rendered again when files are added
+    wd = os.getcwd()
+    os.chdir(tmp_path)
+    try:
+        s = Sender()
+        serve_base(s, {"links": []})
+        assert b"first.tsv" not in s.wfile.written
+        Path("first.tsv").write_text("ID\n")
+        serve_base(s, {"links": []})
+        assert b"first.tsv" in s.wfile.written
+    finally:
+        os.chdir(wd)
+
+
+def test_server_page(tmp_path):
+
+    path = tmp_path / "large.tsv"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ID\tDOCULECT\tCONCEPT\tFORM\n")
+        for i in range(1, 1001):
+            f.write("{0}\t{1}\tc{2}\tform-{0}\n".format(
+                i, ["German", "Dutch", "English"][i % 3], i % 7))
+
+    def page(**payload):
+        s = Sender()
+        payload["file"] = str(path)
+        server_page(s, "payload=" + json.dumps(payload), "POST")
+        return json.loads(s.wfile.written)
+
+    def expected(offset, limit, doculects=(), concepts=()):
+        with open(path, encoding="utf-8") as f:
+            rows = [line.rstrip("\n").split("\t") for line in f][1:]
+        rows = [row for row in rows
+                if (not doculects or row[1] in doculects)
+                and (not concepts or row[2] in concepts)]
+        return rows[offset:offset + limit], len(rows)
+
+    result = page(offset=990, limit=50)
+    assert (result["rows"], result["total"]) == expected(990, 50)
+    result = page(offset=20, limit=5, doculects=["dutch"], concepts=["c3"])
+    assert (result["rows"], result["total"]) == expected(20, 5, ["Dutch"], ["c3"])
+    result = page(offset=0, limit=5, columns=["FORM", "ID"])
+    assert result["header"] == ["FORM", "ID"]
+    assert result["rows"][0] == ["form-1", "1"]
+    assert page(offset=2000, limit=5)["rows"] == []
+    result = page(offset=0, limit=5, filters={"form": ["FORM-7", "form-8"]})
+    assert (result["rows"], result["total"]) == (expected(6, 2)[0], 2)
+
+    # rows are sorted on the server, also when they are filtered
+    result = page(offset=0, limit=4, sort=["concept", "-ID"])
+    assert [row[0] for row in result["rows"]] == ["994", "987", "980", "973"]
+    assert result["sort"] == [["CONCEPT", False], ["ID", True]]
+    result = page(offset=1, limit=3, sort=["-concept", "ID"], doculects=["dutch"])
+    assert [row[0] for row in result["rows"]] == ["34", "55", "76"]
+    assert result["total"] == expected(0, 1000, ["Dutch"])[1]
+
+    s = Sender()
+    server_export(s, "payload=" + json.dumps({
+        "file": str(path), "doculects": ["German"], "offset": 3,
+        "export_limit": 100}), "POST")
+    rows, total = expected(3, 100, ["German"])
+    assert s.wfile.written.decode("utf-8").split("\n") == [
+        "ID\tDOCULECT\tCONCEPT\tFORM"] + ["\t".join(row) for row in rows]
+
+    # exports are streamed in chunks
+    s = StreamSender()
+    server_export(s, "payload=" + json.dumps({"file": str(path)}), "POST")
+    assert s.headers["Transfer-Encoding"] == "chunked"
+    assert dechunk(s.wfile.data) == path.read_bytes().rstrip(b"\n")
+
+
+def test_server_search(tmp_path):
+
+    path = tmp_path / "large.tsv"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("ID\tDOCULECT\tCONCEPT\tFORM\tNOTE\n")
+        for i in range(1, 1001):
+            f.write("{0}\t{1}\tc{2}\tform-{0}\t{3}\n".format(
+                i, ["German", "Dutch", "English"][i % 3], i % 7,
+                "see form-{0}".format(i - 1) if i % 10 == 0 else ""))
+
+    def search(**payload):
+        s = Sender()
+        payload["file"] = str(path)
+        server_search(s, "payload=" + json.dumps(payload), "POST")
+        return json.loads(s.wfile.written)
+
+    result = search(query="FORM-99", limit=3)
+    assert result["ids"] == ["99", "100", "990"]
+    assert result["rows"] == [98, 99, 989]
+    assert result["total"] == 13
+    assert result["counts"] == {"FORM": 11, "NOTE": 2}
+    result = search(query="form-99", columns=["form"], doculects=["dutch"])
+    assert result["ids"] == ["991", "994", "997"]
+    assert result["counts"] == {"FORM": 3}
+    result = search(query=r"^form-\d5$", regex=True, offset=2, limit=2)
+    assert result["ids"] == ["35", "45"] and result["total"] == 9
+    assert "error" in search(query="form-(", regex=True)
+    assert "error" in search(query="")
+
+
+class Disconnected(Collector):
+
+    def write(self, x):
+
+        raise BrokenPipeError
+
+
+def test_send_chunks_disconnected():
+
+    produced = []
+
+    def chunks():
+        for i in range(100):
+            produced.append(i)
+            yield "x" * 1024
+
+    s = StreamSender()
+    s.wfile = Disconnected()
+    gen = chunks()
+    assert send_chunks(s, gen, chunk_size=4096) is False
+    # the content is no longer produced after the first write failed
+    assert len(produced) == 4
+    assert gen.gi_frame is None
+
+    s = StreamSender()
+    assert send_chunks(s, chunks(), chunk_size=4096) is True
+    assert dechunk(s.wfile.data) == b"x" * 1024 * 100